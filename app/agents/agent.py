@@ -1,17 +1,42 @@
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
 from langchain.prompts import ChatPromptTemplate
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import asyncio
+import logging
+import threading
+import time
 
 from app.config import settings
 from app.tools import RiskAssessmentTool,ProposalTool
-from app.prompts.counseling_prompts import COUNSELOR_SYSTEM_PROMPT, COUNSELOR_CHAT_PROMPT
-from app.prompts.proposal_prompts import PROPOSAL_SYSTEM_PROMPT, PROPOSAL_EXAMPLES
+from app.prompts.counseling_prompts import COUNSELOR_SYSTEM_PROMPT, COUNSELOR_CHAT_PROMPT, HISTORY_SUMMARY_PROMPT
+from app.prompts.counseling_prompts import COUNSELOR_DIRECT_PROMPT, CRISIS_RESPONSE_TEMPLATE
+from app.prompts.proposal_prompts import PROPOSAL_SYSTEM_PROMPT, PROPOSAL_EXAMPLES, PROPOSAL_DIRECT_PROMPT, PROPOSAL_CHAT_PROMPT
 from app.llm import get_chat_llm_instance
-from app.tools.role_manager import RoleManagerTool, AgentRole
+from app.metrics import metrics_handler, span
+from app.tools.executor import submit_sync_tool
+from app.tools.resource_finder import load_crisis_lines
+from app.tools.role_manager import RoleManagerTool, AgentRole, current_conversation_id
 from app.prompts.counseling_prompts import COUNSELOR_SYSTEM_PROMPT
 from utils.message_analyzer import MessageAnalyzer, LLMMessageAnalyzer
+from app.agents.router import MessageRouter, ROUTE_AGENT
+
+logger = logging.getLogger(__name__)
+
+
+def _format_crisis_response(crisis_lines: List[Dict]) -> str:
+    """用危机热线列表填充危机支持回复"""
+    lines = []
+    for item in crisis_lines:
+        line = f"- {item['name']}"
+        if item.get("phone"):
+            line += f"：{item['phone']}"
+        if item.get("description"):
+            line += f"（{item['description']}）"
+        lines.append(line)
+    return CRISIS_RESPONSE_TEMPLATE.format(crisis_lines="\n".join(lines))
 
 class CounselorAgent:
     """使用LangChain实现的多角色Agent"""
@@ -19,22 +44,41 @@ class CounselorAgent:
     def __init__(self):
         # 使用工厂方法获取LLM
         self.llm = get_chat_llm_instance(temperature=0.5)
+        # 历史摘要使用确定性输出
+        self.summary_llm = get_chat_llm_instance(temperature=0.0)
          # 初始化角色管理工具
         self.role_manager = RoleManagerTool()
+        # 风险评估：启用预先评估时与主回答并发执行，不再作为Agent的工具
+        self.risk_tool = RiskAssessmentTool()
+        self.risk_preflight = settings.RISK_PREFLIGHT_ENABLED
+        # 高风险时替换回答的危机支持回复，热线来自资源文件
+        self.crisis_response = _format_crisis_response(load_crisis_lines())
+        self._risk_lock = threading.Lock()
+        self._risk_stats = {
+            "assessed": 0, "high": 0, "unknown": 0,
+            "timeouts": 0, "failures": 0, "unparsed": 0, "retries": 0, "keyword_overrides": 0
+        }
         # 初始化工具
         self.tools = [
-            RiskAssessmentTool(),
             # ResourceFinderTool()
             ProposalTool(),
             self.role_manager
         ]
-        
-        # 创建系统消息
-        self.counselor_system_message = SystemMessage(content=COUNSELOR_SYSTEM_PROMPT)
-        self.proposal_system_message = SystemMessage(content=PROPOSAL_SYSTEM_PROMPT)
+        if not self.risk_preflight:
+            self.tools.insert(0, self.risk_tool)
+        # 记录每次工具调用的耗时
+        for tool in self.tools:
+            tool.callbacks = [metrics_handler]
         
         # 创建Agent
         self._create_agent()
+        
+        # 路由和不带工具的单轮链，每个角色一条，与该角色的Agent使用相同的系统提示
+        self.router = MessageRouter() if settings.ROUTER_ENABLED else None
+        self.direct_chains = {
+            AgentRole.COUNSELOR: COUNSELOR_DIRECT_PROMPT | self.llm,
+            AgentRole.PROPOSAL_EVALUATOR: PROPOSAL_DIRECT_PROMPT | self.llm
+        }
 
         # self.agent = create_openai_functions_agent(
         #     llm=self.llm,
@@ -51,39 +95,83 @@ class CounselorAgent:
         # )
     
     def _create_agent(self):
-        """创建Agent，根据当前角色使用适当的系统提示"""
-        # 确定当前角色对应的系统消息
-        if self.role_manager.is_counselor():
-            system_message = self.counselor_system_message
-        else:
-            system_message = self.proposal_system_message
+        """为每个角色预先创建一个Agent执行器，创建后不再修改"""
+        self.executors = {
+            AgentRole.COUNSELOR: self._build_executor(COUNSELOR_CHAT_PROMPT),
+            AgentRole.PROPOSAL_EVALUATOR: self._build_executor(PROPOSAL_CHAT_PROMPT)
+        }
         
-        # 创建提示模板
-        prompt = COUNSELOR_CHAT_PROMPT
-
-        self.agent = create_openai_functions_agent(
+        # 默认（心理咨询师）执行器，供同步接口使用
+        self.agent_executor = self.executors[AgentRole.COUNSELOR]
+    
+    def _build_executor(self, prompt: ChatPromptTemplate) -> AgentExecutor:
+        agent = create_openai_functions_agent(
             llm=self.llm,
             tools=self.tools,
-            prompt=COUNSELOR_CHAT_PROMPT
+            prompt=prompt
         )
-
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
+        
+        return AgentExecutor(
+            agent=agent,
             tools=self.tools,
             verbose=True,
             handle_parsing_errors=True
         )
+    
+    def _direct_chain_for(self, decision: Dict[str, Any], conversation_id: Optional[str]):
+        """路由判定不需要工具时，返回会话当前角色的单轮链；否则返回 None（交给Agent）"""
+        if decision["route"] == ROUTE_AGENT:
+            return None
+        return self.direct_chains[self.role_manager.get_role(conversation_id)]
+    
+    def _executor_for(self, conversation_id: Optional[str]) -> AgentExecutor:
+        """根据会话当前的角色选择执行器"""
+        return self.executors[self.role_manager.get_role(conversation_id)]
 
     async def generate_response(self, 
                           user_input: str, 
-                          chat_history: Optional[List] = None) -> Dict[str, Any]:
+                          chat_history: Optional[List] = None,
+                          conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """生成对用户输入的回应"""
         
         if chat_history is None:
             chat_history = []
         
-        # 使用Agent处理用户输入
-        response = await self.agent_executor.ainvoke(
+        # 设置当前会话，角色管理工具据此读写该会话的角色
+        token = current_conversation_id.set(conversation_id)
+        # 风险评估与路由、主回答并发执行，不占用Agent的工具调用往返
+        risk_task = self._start_risk_assessment(user_input)
+        try:
+            result = await self._generate_response(user_input, chat_history, conversation_id)
+            return self._apply_risk(result, await self._finish_risk_assessment(risk_task, user_input))
+        finally:
+            current_conversation_id.reset(token)
+            if risk_task is not None and not risk_task.done():
+                risk_task.cancel()
+    
+    async def _generate_response(self,
+                                 user_input: str,
+                                 chat_history: List,
+                                 conversation_id: Optional[str]) -> Dict[str, Any]:
+        # 先路由：意图明确的消息走不带工具的单轮链，省去工具调用的往返
+        decision = await self._route(user_input)
+        chain = self._direct_chain_for(decision, conversation_id)
+        if chain is not None:
+            message = await chain.ainvoke(
+                {
+                    "input": user_input,
+                    "chat_history": chat_history
+                }
+            )
+            return {
+                "response": message.content,
+                "intermediate_steps": [],
+                "route": decision["route"],
+                "role": self.role_manager.get_role(conversation_id).value
+            }
+        
+        # 使用当前角色的Agent处理用户输入
+        response = await self._executor_for(conversation_id).ainvoke(
             {
                 "input": user_input,
                 "chat_history": chat_history
@@ -92,26 +180,318 @@ class CounselorAgent:
         
         return {
             "response": response["output"],
-            "intermediate_steps": response.get("intermediate_steps", [])
+            "intermediate_steps": response.get("intermediate_steps", []),
+            "route": decision["route"],
+            # 工具可能在本轮切换了角色，返回处理后的角色
+            "role": self.role_manager.get_role(conversation_id).value
         }
     
-    def generate_response_sync(self, 
-                         user_input: str, 
-                         chat_history: Optional[List] = None) -> Dict[str, Any]:
-        """同步版本的响应生成（用于非异步上下文）"""
+    def _start_risk_assessment(self, user_input: str) -> Optional[asyncio.Task]:
+        """在后台开始预先风险评估，未启用时返回 None"""
+        if not self.risk_preflight:
+            return None
+        return asyncio.create_task(self.risk_tool.aassess(user_input))
+    
+    def _record_risk(self, assessment: Dict[str, Any], outcome: Optional[str] = None) -> None:
+        with self._risk_lock:
+            self._risk_stats["assessed"] += 1
+            if assessment["level"] in ("high", "unknown"):
+                self._risk_stats[assessment["level"]] += 1
+            if outcome:
+                self._risk_stats[outcome] += 1
+    
+    def _count_risk(self, key: str) -> None:
+        with self._risk_lock:
+            self._risk_stats[key] += 1
+    
+    @staticmethod
+    def _is_assessed(assessment: Optional[Dict[str, Any]]) -> bool:
+        """评估是否得出了明确的风险等级（模型输出无法解析时为 unknown）"""
+        return assessment is not None and assessment["level"] != "unknown"
+    
+    async def _finish_risk_assessment(self,
+                                      risk_task: Optional[asyncio.Task],
+                                      user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        等待预先风险评估的结果
+        
+        总共最多等待 RISK_PREFLIGHT_TIMEOUT 秒。评估失败或模型输出无法解析时，在剩余时间内重试一次；
+        仍然没有明确的风险等级时按"未评估"处理（见 _risk_unavailable）。
+        """
+        if risk_task is None:
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.RISK_PREFLIGHT_TIMEOUT
+        assessment, error = None, None
+        with span("risk_wait"):
+            for attempt in range(2):
+                if attempt:
+                    self._count_risk("retries")
+                    risk_task = asyncio.create_task(self.risk_tool.aassess(user_input))
+                try:
+                    assessment, error = await asyncio.wait_for(risk_task, max(deadline - loop.time(), 0)), None
+                except asyncio.TimeoutError as e:
+                    assessment, error = None, e
+                    break
+                except Exception as e:
+                    assessment, error = None, e
+                if self._is_assessed(assessment):
+                    self._record_risk(assessment)
+                    return dict(assessment, assessed=True)
+        return self._risk_unavailable(user_input, error)
+    
+    def _finish_risk_assessment_sync(self, risk_future, user_input: str) -> Optional[Dict[str, Any]]:
+        """_finish_risk_assessment 的同步版本，评估在工具线程池中执行"""
+        if risk_future is None:
+            return None
+        deadline = time.monotonic() + settings.RISK_PREFLIGHT_TIMEOUT
+        assessment, error = None, None
+        for attempt in range(2):
+            if attempt:
+                self._count_risk("retries")
+                risk_future = submit_sync_tool(self.risk_tool.assess, user_input)
+            try:
+                assessment, error = risk_future.result(timeout=max(deadline - time.monotonic(), 0)), None
+            except FutureTimeoutError as e:
+                risk_future.cancel()
+                assessment, error = None, e
+                break
+            except Exception as e:
+                assessment, error = None, e
+            if self._is_assessed(assessment):
+                self._record_risk(assessment)
+                return dict(assessment, assessed=True)
+        return self._risk_unavailable(user_input, error)
+    
+    def _risk_unavailable(self, user_input: str, error: Optional[Exception]) -> Dict[str, Any]:
+        """
+        评估超时、失败或结果无法解析时的结果（assessed 为 False）
+        
+        没有评估结果不代表消息没有风险：这时用危机关键词兜底，命中时按高风险处理，替换回答。
+        """
+        if isinstance(error, (asyncio.TimeoutError, FutureTimeoutError)):
+            logger.warning("Pre-flight risk assessment timed out")
+            outcome, reason = "timeouts", "timeout"
+        elif error is not None:
+            logger.error(f"Pre-flight risk assessment failed: {str(error)}")
+            outcome, reason = "failures", str(error)
+        else:
+            logger.warning("Pre-flight risk assessment returned no usable risk level")
+            outcome, reason = "unparsed", "unparsed"
         
+        crisis = MessageAnalyzer.has_crisis_signal(user_input)
+        assessment = {
+            "level": "high" if crisis else "unknown",
+            "categories": {},
+            "high_risk_categories": [],
+            "assessed": False,
+            "error": reason
+        }
+        self._record_risk(assessment, outcome)
+        if crisis:
+            self._count_risk("keyword_overrides")
+        return assessment
+    
+    def _apply_risk(self, result: Dict[str, Any], assessment: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """把评估结果放入结果的 risk 字段，高风险时用危机支持回复替换回答"""
+        if assessment is None:
+            return result
+        override = assessment["level"] == "high"
+        result["risk"] = dict(assessment, override=override)
+        if override:
+            result["response"] = self.crisis_response
+        return result
+    
+    def risk_stats(self) -> Dict[str, int]:
+        """返回预先风险评估的次数、高风险（回答被替换）、超时、失败、无法解析、重试和关键词兜底替换的计数"""
+        with self._risk_lock:
+            return dict(self._risk_stats)
+    
+    async def _route(self, user_input: str) -> Dict[str, Any]:
+        """返回路由决策，未启用路由时一律交给Agent"""
+        if self.router is None:
+            return {"route": ROUTE_AGENT, "source": "disabled"}
+        return await self.router.route(user_input)
+    
+    def _route_sync(self, user_input: str) -> Dict[str, Any]:
+        """_route 的同步版本"""
+        if self.router is None:
+            return {"route": ROUTE_AGENT, "source": "disabled"}
+        return self.router.route_sync(user_input)
+    
+    async def stream_response(self,
+                              user_input: str,
+                              chat_history: Optional[List] = None,
+                              conversation_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式生成回应，边生成边产出事件
+        
+        事件类型:
+            route: 路由决策 {"type": "route", "route": ...}
+            token: 模型输出的文本片段 {"type": "token", "content": ...}
+            tool_start: 开始调用工具 {"type": "tool_start", "tool": ..., "input": ...}
+            tool_end: 工具调用完成 {"type": "tool_end", "tool": ..., "output": ...}
+            risk: 预先风险评估结果 {"type": "risk", "risk": ...}，在 final 之前产出
+            final: 最终回应 {"type": "final", "response": ...}，高风险时为危机支持回复
+        
+        启用预先评估时，评估结果出来之前 token 和工具事件先暂存不发送：高风险时回答要被替换，
+        已经发给客户端的内容无法撤回。评估为高风险时停止生成主回答，暂存的事件全部丢弃。
+        """
         if chat_history is None:
             chat_history = []
         
-        # 使用Agent处理用户输入
-        response = self.agent_executor.invoke(
+        # 异步生成器在驱动它的请求任务的上下文中执行，各步之间上下文可能不同，
+        # 用 reset 令牌会失效，这里直接设置，作用范围是本次请求的任务
+        current_conversation_id.set(conversation_id)
+        
+        risk_task = self._start_risk_assessment(user_input)
+        events = self._stream_events(user_input, chat_history, conversation_id)
+        resolved = risk_task is None
+        assessment = None
+        held: List[Dict[str, Any]] = []
+        try:
+            async for event in events:
+                if not resolved and (event["type"] == "final" or risk_task.done()):
+                    assessment = await self._finish_risk_assessment(risk_task, user_input)
+                    resolved = True
+                    if assessment["level"] == "high":
+                        for final_event in self._final_events("", assessment):
+                            yield final_event
+                        return
+                    for held_event in held:
+                        yield held_event
+                    held = []
+                
+                if event["type"] == "final":
+                    for final_event in self._final_events(event["response"], assessment):
+                        yield final_event
+                elif resolved or event["type"] == "route":
+                    yield event
+                else:
+                    held.append(event)
+        finally:
+            # 高风险或客户端提前断开时不再需要主回答和评估结果
+            await events.aclose()
+            if risk_task is not None and not risk_task.done():
+                risk_task.cancel()
+    
+    def _final_events(self, response: str, assessment: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """流式回应最后的 risk 和 final 事件"""
+        result = self._apply_risk({"response": response}, assessment)
+        events = [{"type": "risk", "risk": result["risk"]}] if "risk" in result else []
+        events.append({"type": "final", "response": result["response"]})
+        return events
+    
+    async def _stream_events(self,
+                             user_input: str,
+                             chat_history: List,
+                             conversation_id: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        """产出主回答的事件，最后一个是 final"""
+        decision = await self._route(user_input)
+        yield {"type": "route", "route": decision["route"]}
+        
+        chain = self._direct_chain_for(decision, conversation_id)
+        if chain is not None:
+            chunks = []
+            async for chunk in chain.astream(
+                {
+                    "input": user_input,
+                    "chat_history": chat_history
+                }
+            ):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield {"type": "token", "content": chunk.content}
+            yield {"type": "final", "response": "".join(chunks)}
+            return
+        
+        final_output = None
+        async for event in self._executor_for(conversation_id).astream_events(
             {
                 "input": user_input,
                 "chat_history": chat_history
-            }
+            },
+            version="v1"
+        ):
+            kind = event["event"]
+            
+            if kind == "on_chat_model_stream":
+                # 决定调用工具的那一轮只有 function_call，没有文本内容
+                content = event["data"]["chunk"].content
+                if content:
+                    yield {"type": "token", "content": content}
+            
+            elif kind == "on_tool_start":
+                yield {
+                    "type": "tool_start",
+                    "tool": event["name"],
+                    "input": event["data"].get("input")
+                }
+            
+            elif kind == "on_tool_end":
+                yield {
+                    "type": "tool_end",
+                    "tool": event["name"],
+                    "output": str(event["data"].get("output"))
+                }
+            
+            elif kind == "on_chain_end" and event["name"] == "AgentExecutor":
+                output = event["data"].get("output") or {}
+                final_output = output.get("output")
+        
+        yield {"type": "final", "response": final_output or ""}
+    
+    async def summarize_history(self,
+                                messages: List[BaseMessage],
+                                previous_summary: Optional[str] = None) -> str:
+        """把较早的对话折叠成摘要（供 ChatHistoryManager 使用）"""
+        conversation = "\n".join(
+            f"{'用户' if isinstance(msg, HumanMessage) else '咨询师'}: {msg.content}"
+            for msg in messages
+        )
+        prompt = HISTORY_SUMMARY_PROMPT.format(
+            previous_summary=previous_summary or "无",
+            conversation=conversation
         )
         
-        return {
-            "response": response["output"],
-            "intermediate_steps": response.get("intermediate_steps", [])
-        }
\ No newline at end of file
+        result = await self.summary_llm.ainvoke(prompt)
+        return result.content
+    
+    def generate_response_sync(self, 
+                         user_input: str, 
+                         chat_history: Optional[List] = None,
+                         conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """同步版本的响应生成（用于非异步上下文），与异步版本一样先路由，再按会话角色处理"""
+        
+        if chat_history is None:
+            chat_history = []
+        
+        token = current_conversation_id.set(conversation_id)
+        # 风险评估在工具线程池中与路由、主回答并发执行
+        risk_future = submit_sync_tool(self.risk_tool.assess, user_input) if self.risk_preflight else None
+        try:
+            decision = self._route_sync(user_input)
+            chain = self._direct_chain_for(decision, conversation_id)
+            inputs = {
+                "input": user_input,
+                "chat_history": chat_history
+            }
+            if chain is not None:
+                result = {
+                    "response": chain.invoke(inputs).content,
+                    "intermediate_steps": []
+                }
+            else:
+                # 使用当前角色的Agent处理用户输入
+                response = self._executor_for(conversation_id).invoke(inputs)
+                result = {
+                    "response": response["output"],
+                    "intermediate_steps": response.get("intermediate_steps", [])
+                }
+            result["route"] = decision["route"]
+            result["role"] = self.role_manager.get_role(conversation_id).value
+            return self._apply_risk(result, self._finish_risk_assessment_sync(risk_future, user_input))
+        finally:
+            current_conversation_id.reset(token)
+            if risk_future is not None:
+                risk_future.cancel()
@@ -0,0 +1,150 @@
+from typing import Any, Dict, Optional, Tuple
+import logging
+import threading
+
+from app.config import settings
+from utils.keyword_matcher import KeywordMatcher
+from utils.message_analyzer import MessageAnalyzer, LLMMessageAnalyzer
+
+logger = logging.getLogger(__name__)
+
+# 路由目标
+ROUTE_COUNSELOR = "counselor"   # 单轮心理咨询链，不绑定工具
+ROUTE_PROPOSAL = "proposal"     # 单轮提案评估链，不绑定工具
+ROUTE_AGENT = "agent"           # 完整的工具调用Agent
+
+# 需要调用提案工具才能完成的操作（创建、投票、查看等），这类消息必须交给Agent
+PROPOSAL_ACTION_KEYWORDS = [
+    "创建", "发起", "提交", "新建", "create",
+    "投票", "投一票", "vote",
+    "查看", "列出", "列表", "结果", "list", "view", "show",
+    "关闭", "close", "分析", "analyze"
+]
+
+# 切换角色要调用角色管理工具，不论消息属于哪一类都必须交给Agent
+ROLE_SWITCH_KEYWORDS = ["切换", "switch", "角色", "role"]
+
+_ACTION_MATCHER = KeywordMatcher({"action": PROPOSAL_ACTION_KEYWORDS, "role": ROLE_SWITCH_KEYWORDS})
+
+
+class MessageRouter:
+    """在Agent之前对消息分流
+
+    先用关键词分析器判断：只涉及心理咨询的消息直接走单轮咨询链；
+    只涉及提案讨论且不需要执行提案操作的消息走单轮提案评估链。
+    关键词同时命中两类的消息交给 LLMMessageAnalyzer 判断（可配置），
+    其余情况（没有明确信号、需要工具、LLM置信度不足）走完整Agent。
+    含危机信号或要求切换角色的消息总是走完整Agent（危机消息的风险评估见 route 中的说明）。
+    单轮链使用会话当前角色的提示（由 CounselorAgent 选择）。
+    """
+
+    def __init__(self, use_llm: Optional[bool] = None, confidence_threshold: Optional[float] = None):
+        self.use_llm = settings.ROUTER_USE_LLM if use_llm is None else use_llm
+        self.confidence_threshold = (
+            settings.ROUTER_CONFIDENCE_THRESHOLD if confidence_threshold is None else confidence_threshold
+        )
+        self._lock = threading.Lock()
+        self._stats = {
+            ROUTE_COUNSELOR: 0,
+            ROUTE_PROPOSAL: 0,
+            ROUTE_AGENT: 0,
+            "keyword_decisions": 0,
+            "crisis_decisions": 0,
+            "llm_decisions": 0,
+            "llm_failures": 0
+        }
+
+    @staticmethod
+    def _needs_tools(message: str) -> bool:
+        """提案消息是否要求执行需要工具的操作（包括切换角色）"""
+        return bool(_ACTION_MATCHER.find_all(message)) or MessageAnalyzer.has_proposal_id(message)
+
+    @staticmethod
+    def _switches_role(message: str) -> bool:
+        """消息是否涉及切换角色"""
+        return _ACTION_MATCHER.count_by_category(_ACTION_MATCHER.find_all(message))["role"] > 0
+
+    def _record(self, route: str, source: str) -> None:
+        with self._lock:
+            self._stats[route] += 1
+            if source == "keyword":
+                self._stats["keyword_decisions"] += 1
+            elif source == "llm":
+                self._stats["llm_decisions"] += 1
+            elif source == "crisis":
+                self._stats["crisis_decisions"] += 1
+
+    def _keyword_decision(self, message: str) -> Tuple[str, str, Dict[str, Any], bool]:
+        """关键词判定，返回 (路由目标, 判定依据, 分析结果, 是否需要交给LLM判断)"""
+        analysis = MessageAnalyzer.analyze_message_type(message)
+        is_proposal = analysis["is_proposal_related"]
+        is_counseling = analysis["is_counseling_related"]
+
+        if analysis["has_crisis_signal"]:
+            # 危机信号：启用预先评估（默认）时，每条消息不论走哪条链都有并发的风险评估，
+            # 高风险时回答会被替换为危机支持回复；这里仍交给Agent，是为了关闭预先评估时
+            # 由Agent调用风险评估工具，单轮链不绑定工具，无法评估
+            return ROUTE_AGENT, "crisis", analysis, False
+        if self._switches_role(message):
+            return ROUTE_AGENT, "keyword", analysis, False
+        if is_counseling and not is_proposal:
+            return ROUTE_COUNSELOR, "keyword", analysis, False
+        if is_proposal and not is_counseling:
+            return (ROUTE_AGENT if self._needs_tools(message) else ROUTE_PROPOSAL), "keyword", analysis, False
+        # 两类关键词都命中时交给LLM判断主要意图
+        return ROUTE_AGENT, "default", analysis, is_proposal and is_counseling and self.use_llm
+
+    def _llm_decision(self, message: str, analysis: Dict[str, Any]) -> Tuple[str, str]:
+        """根据LLM分析结果返回 (路由目标, 判定依据)，置信度不足时交给Agent"""
+        if "llm_error" in analysis:
+            raise RuntimeError(analysis["llm_error"])
+        confidence = float(analysis.get("confidence", 0))
+        primary_type = analysis.get("primary_type")
+        if confidence < self.confidence_threshold:
+            return ROUTE_AGENT, "default"
+        if primary_type == "counseling":
+            return ROUTE_COUNSELOR, "llm"
+        if primary_type == "proposal" and not self._needs_tools(message):
+            return ROUTE_PROPOSAL, "llm"
+        return ROUTE_AGENT, "llm"
+
+    def _llm_failed(self, error: Exception) -> None:
+        logger.error(f"LLM routing failed: {str(error)}")
+        with self._lock:
+            self._stats["llm_failures"] += 1
+
+    async def route(self, message: str) -> Dict[str, Any]:
+        """
+        判断消息应交给哪条处理链
+
+        Returns:
+            {"route": 路由目标, "source": 判定依据(crisis/keyword/llm/default), "analysis": 分析结果}
+        """
+        route, source, analysis, ambiguous = self._keyword_decision(message)
+        if ambiguous:
+            try:
+                analysis = await LLMMessageAnalyzer.analyze_message(message)
+                route, source = self._llm_decision(message, analysis)
+            except Exception as e:
+                self._llm_failed(e)
+
+        self._record(route, source)
+        return {"route": route, "source": source, "analysis": analysis}
+
+    def route_sync(self, message: str) -> Dict[str, Any]:
+        """route 的同步版本（用于非异步上下文）"""
+        route, source, analysis, ambiguous = self._keyword_decision(message)
+        if ambiguous:
+            try:
+                analysis = LLMMessageAnalyzer.analyze_message_sync(message)
+                route, source = self._llm_decision(message, analysis)
+            except Exception as e:
+                self._llm_failed(e)
+
+        self._record(route, source)
+        return {"route": route, "source": source, "analysis": analysis}
+
+    def stats(self) -> Dict[str, int]:
+        """返回各路由目标和判定依据的计数"""
+        with self._lock:
+            return dict(self._stats)
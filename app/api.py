@@ -1,13 +1,27 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Dict, Any
 import uuid
 import asyncio
+import json
+import math
+import os
 
 from app.agents.agent import CounselorAgent
+from app.batch import BatchRunner, aparse_batch_lines, iter_lines
+from app.concurrency import ConversationGate, DuplicateRequestError, OverloadedError
 from app.database import ConversationMemory
+from app.history import ChatHistoryManager
 from app.config import settings
+from app.llm import get_llm_limiter_stats, get_llm_pool_stats, close_llm_clients
+from app.tools.risk_cache import risk_cache
+from app.tools.proposal_tool import proposal_manager
+from app.metrics import REQUEST_LATENCY, register_stats, request_timer, span, summarize_spans
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+import time
 import logging
 import traceback
 
@@ -29,6 +43,26 @@ app.add_middleware(
 # 初始化组件
 counselor_agent = CounselorAgent()
 memory = ConversationMemory()
+history_manager = ChatHistoryManager(
+    memory,
+    summarizer=counselor_agent.summarize_history if settings.HISTORY_SUMMARY_ENABLED else None
+)
+
+# 同一会话的请求依次处理，重复消息按配置的策略处理
+conversation_gate = ConversationGate(
+    settings.CONVERSATION_DUPLICATE_POLICY,
+    lock_dir=settings.CONVERSATION_LOCK_DIR if settings.shared_state else None
+)
+
+# 在 /metrics 中导出已有的统计信息
+register_stats("conversation_cache", memory.cache_stats)
+register_stats("llm_pool", get_llm_pool_stats)
+register_stats("llm_limiter", get_llm_limiter_stats)
+register_stats("risk_cache", risk_cache.stats)
+register_stats("conversation_gate", conversation_gate.stats)
+register_stats("risk_preflight", counselor_agent.risk_stats)
+if counselor_agent.router:
+    register_stats("router", counselor_agent.router.stats)
 
 # 数据模型
 class Message(BaseModel):
@@ -39,79 +73,284 @@ class Message(BaseModel):
 class ConversationRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    include_timings: bool = False  # 在 details 中返回各阶段耗时
+    # messages 的返回方式: full（完整历史）、delta（只返回 cursor 之后的消息）、none（不返回）
+    history_mode: Literal["full", "delta", "none"] = "full"
+    # 客户端已有的消息条数（上一次响应中的 cursor），delta 模式下不指定则只返回本轮的两条消息
+    cursor: Optional[int] = Field(default=None, ge=0)
 
 class ConversationResponse(BaseModel):
     conversation_id: str
     response: str
     messages: List[Message]
+    cursor: Optional[int] = None  # 本轮之后会话中的消息总数，下次请求的 cursor
     details: Optional[Dict[str, Any]] = None
 
+def _message_payload(messages: List[Dict]) -> List[Dict[str, Any]]:
+    """把存储中的消息转换为 Message 的字段，不再经过 Pydantic 校验"""
+    return [
+        {"role": msg["role"], "content": msg["content"], "timestamp": msg.get("timestamp")}
+        for msg in messages
+    ]
+
+def _retry_after_header(error: OverloadedError) -> Dict[str, str]:
+    """503 响应的 Retry-After（整数秒）"""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+
 # API端点
-@app.post("/api/chat", response_model=ConversationResponse)
-async def chat(request: ConversationRequest):
-    try:
-        # 获取或创建会话ID
-        conversation_id = request.conversation_id or str(uuid.uuid4())
-        
-        # 记录请求信息
-        logger.info(f"Received chat request for conversation_id: {conversation_id}")
-        
-        # 获取历史对话（LangChain消息格式）
-        chat_history = memory.get_messages(conversation_id)
-        
-        # 添加用户消息到历史 - 修改这里的调用
-        # 查看ConversationMemory.add_message方法的签名，调整参数
-        # 可能的选项1: 如果方法只需要会话ID和完整消息对象
-        memory.add_message(
+async def _run_chat_turn(request: ConversationRequest, conversation_id: str):
+    """执行一轮对话，调用方需持有该会话的锁
+
+    返回 (Agent结果, 按 history_mode 选出的消息, 会话消息总数)
+    """
+    # 获取token预算内的历史对话（LangChain消息格式）
+    with span("history_load"):
+        chat_history = await history_manager.aget_window(conversation_id)
+    
+    # 添加用户消息到历史 - 修改这里的调用
+    # 查看ConversationMemory.add_message方法的签名，调整参数
+    # 可能的选项1: 如果方法只需要会话ID和完整消息对象
+    with span("persist"):
+        await memory.aadd_message(
             conversation_id, 
             {"role": "user", "content": request.message}
         )
-        
-        # 或者选项2: 如果方法接收会话ID和消息内容
-        # memory.add_message(conversation_id, request.message)
-        
-        # 获取Agent响应
-        logger.info("Calling LLM for response...")
-        result = await counselor_agent.generate_response(
-            request.message,
-            chat_history
-        )
-        
-        # 添加Agent响应到历史 - 同样修改这里
-        # 与上面使用相同的格式
-        memory.add_message(
+    
+    # 或者选项2: 如果方法接收会话ID和消息内容
+    # memory.add_message(conversation_id, request.message)
+    
+    # 获取Agent响应
+    logger.info("Calling LLM for response...")
+    result = await counselor_agent.generate_response(
+        request.message,
+        chat_history,
+        conversation_id=conversation_id
+    )
+    
+    # 添加Agent响应到历史 - 同样修改这里
+    # 与上面使用相同的格式
+    with span("persist"):
+        await memory.aadd_message(
             conversation_id, 
             {"role": "assistant", "content": result["response"]}
         )
-        # 或者
-        # memory.add_message(conversation_id, result["response"])
+    # 或者
+    # memory.add_message(conversation_id, result["response"])
+    
+    # 在锁内切片（复制），返回时不受之后的追加影响；delta 模式只复制新消息
+    history = await memory.aget_conversation(conversation_id)
+    total = len(history)
+    if request.history_mode == "full":
+        messages = list(history)
+    elif request.history_mode == "delta":
+        start = total - 2 if request.cursor is None else min(request.cursor, total)
+        messages = history[start:]
+    else:
+        messages = []
+    return result, messages, total
+
+@app.post("/api/chat", response_model=ConversationResponse)
+async def chat(request: ConversationRequest):
+    try:
+        with request_timer("chat") as spans:
+            # 获取或创建会话ID
+            conversation_id = request.conversation_id or str(uuid.uuid4())
+        
+            # 记录请求信息
+            logger.info(f"Received chat request for conversation_id: {conversation_id}")
+        
+            # 同一会话的请求依次执行
+            result, messages, total = await conversation_gate.run(
+                conversation_id,
+                request.message,
+                lambda: _run_chat_turn(request, conversation_id)
+            )
         
-        # 获取原始对话历史
-        messages = memory.get_conversation(conversation_id)
+            details = {
+                "steps": result.get("intermediate_steps", []),
+                "route": result.get("route"),
+                "role": result.get("role"),
+                # 预先风险评估结果，override 为 true 时回答已替换为危机支持回复
+                "risk": result.get("risk")
+            }
+            if request.include_timings:
+                details["timings"] = summarize_spans(spans)
         
-        return {
-            "conversation_id": conversation_id,
-            "response": result["response"],
-            "messages": messages,
-            "details": {"steps": result.get("intermediate_steps", [])}
-        }
+            # 直接构造JSON，已保存的历史不再按 List[Message] 重新校验
+            return JSONResponse({
+                "conversation_id": conversation_id,
+                "response": result["response"],
+                "messages": _message_payload(messages),
+                "cursor": total,
+                "details": jsonable_encoder(details)
+            })
     
+    except DuplicateRequestError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OverloadedError as e:
+        # 上游调用排队已满，快速拒绝而不是继续堆积
+        raise HTTPException(status_code=503, detail=str(e), headers=_retry_after_header(e))
     except Exception as e:
         # 详细记录错误信息
         logger.error(f"Error processing chat request: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ConversationRequest):
+    """流式聊天接口，以SSE形式返回token和工具调用事件，结束后再保存助手消息"""
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    logger.info(f"Received streaming chat request for conversation_id: {conversation_id}")
+    started = time.perf_counter()
+    
+    # 重复消息在开始流之前就返回409；流式请求不支持合并
+    if conversation_gate.policy != "queue" and conversation_gate.is_duplicate(conversation_id, request.message):
+        raise HTTPException(status_code=409, detail="Duplicate message in flight for this conversation")
+    
+    async def event_stream():
+        yield _sse("start", {"conversation_id": conversation_id})
+        try:
+            # 在生成器内加锁，客户端提前断开时锁也能随生成器关闭而释放
+            async with conversation_gate.hold(conversation_id, request.message):
+                with span("history_load"):
+                    chat_history = await history_manager.aget_window(conversation_id)
+                with span("persist"):
+                    await memory.aadd_message(
+                        conversation_id, 
+                        {"role": "user", "content": request.message}
+                    )
+                
+                response = ""
+                async for event in counselor_agent.stream_response(
+                    request.message, chat_history, conversation_id=conversation_id
+                ):
+                    if event["type"] == "final":
+                        response = event["response"]
+                    else:
+                        yield _sse(event["type"], event)
+                
+                # 流结束后再保存助手消息
+                with span("persist"):
+                    await memory.aadd_message(
+                        conversation_id, 
+                        {"role": "assistant", "content": response}
+                    )
+            REQUEST_LATENCY.labels("chat_stream").observe(time.perf_counter() - started)
+            yield _sse("done", {"conversation_id": conversation_id, "response": response})
+        except DuplicateRequestError as e:
+            yield _sse("error", {"status": 409, "detail": str(e)})
+        except OverloadedError as e:
+            yield _sse("error", {"status": 503, "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error processing streaming chat request: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield _sse("error", {"detail": f"Internal server error: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/chat/batch")
+async def chat_batch(request: Request,
+                     concurrency: Optional[int] = None,
+                     rate_limit: Optional[float] = None,
+                     include_steps: bool = False):
+    """
+    批量对话接口：请求体为JSONL，每行 {"message": ..., "conversation_id": 可选, "id": 可选}
+
+    同一会话的消息依次处理，不同会话并发处理；每完成一条就输出一行JSON结果。
+    请求体边接收边处理，不整体读入内存；无效行在读到时输出错误结果。
+    """
+    concurrency = concurrency or settings.BATCH_CONCURRENCY
+    if not 1 <= concurrency <= settings.BATCH_MAX_CONCURRENCY:
+        raise HTTPException(
+            status_code=400,
+            detail=f"concurrency must be between 1 and {settings.BATCH_MAX_CONCURRENCY}"
+        )
+    
+    runner = BatchRunner(
+        counselor_agent,
+        memory,
+        history_manager,
+        gate=conversation_gate,
+        concurrency=concurrency,
+        rate_limit=settings.BATCH_RATE_LIMIT if rate_limit is None else rate_limit,
+        include_steps=include_steps
+    )
+    logger.info("Received batch chat request")
+    
+    async def result_stream():
+        count = 0
+        async for result in runner.run(aparse_batch_lines(iter_lines(request.stream()))):
+            count += 1
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        logger.info(f"Finished batch chat request with {count} lines")
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @app.get("/api/conversations/{conversation_id}", response_model=List[Message])
-async def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str,
+                           limit: Optional[int] = Query(default=None, ge=1, le=1000),
+                           before: Optional[int] = Query(default=None, ge=0)):
+    """
+    获取会话消息，按时间顺序返回
+
+    指定 limit 时分页：返回位置 before（不含，默认为末尾）之前最近的 limit 条消息，
+    还有更早的消息时在响应头 X-Next-Before 中给出下一页的 before。
+    响应头 X-Total-Count 为会话中的消息总数。
+    """
     try:
-        conversation = memory.get_conversation(conversation_id)
+        conversation = await memory.aget_conversation(conversation_id)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
-        return conversation
+        total = len(conversation)
+        end = total if before is None else min(before, total)
+        start = 0 if limit is None else max(0, end - limit)
+        headers = {"X-Total-Count": str(total)}
+        if start > 0:
+            headers["X-Next-Before"] = str(start)
+        return JSONResponse(_message_payload(conversation[start:end]), headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("shutdown")
+async def shutdown():
+    # 等待会话的后台写入完成
+    await memory.aclose()
+    await close_llm_clients()
+    proposal_manager.close()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标
+
+    多进程部署时设置 PROMETHEUS_MULTIPROC_DIR，直方图和计数器汇总所有工作进程，
+    内部统计（缓存、连接池等）只有 /health 中按进程提供。
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "version": "0.1.0"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "version": "0.1.0",
+        "worker_pid": os.getpid(),
+        "conversation_cache": memory.cache_stats(),
+        "llm_pool": get_llm_pool_stats(),
+        "llm_limiter": get_llm_limiter_stats(),
+        "risk_cache": risk_cache.stats(),
+        "router": counselor_agent.router.stats() if counselor_agent.router else None,
+        "conversation_gate": conversation_gate.stats()
+    }
\ No newline at end of file
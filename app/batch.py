@@ -0,0 +1,269 @@
+"""批量对话回放：把大量用户消息并发交给Agent处理，结果以JSONL逐条输出"""
+
+from typing import Any, AsyncIterable, AsyncIterator, Deque, Dict, Iterable, Iterator, Optional, Union
+from collections import deque
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from app.agents.agent import CounselorAgent
+from app.concurrency import ConversationGate, OverloadedError
+from app.database import ConversationMemory
+from app.history import ChatHistoryManager
+from app.metrics import request_timer, span, summarize_spans
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """异步令牌桶限速器
+
+    rate 为每秒允许的请求数，0 表示不限速；burst 为允许的突发数量。
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """取得一个令牌，令牌不足时等待"""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def parse_batch_line(index: int, line: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+    """
+    解析一行JSONL输入: {"message": ..., "conversation_id": 可选, "id": 可选}
+
+    没有 conversation_id 的行开启一个新会话。
+
+    Returns:
+        有效条目；无效行返回带 error 字段的错误结果；空行返回 None
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        # 字节行由 json.loads 按UTF-8解码，解码失败（UnicodeDecodeError）也是 ValueError
+        record = json.loads(line)
+        if not isinstance(record, dict) or not isinstance(record.get("message"), str):
+            raise ValueError("each line must be an object with a string 'message'")
+    except ValueError as e:
+        return {"index": index, "error": f"invalid line: {str(e)}"}
+
+    return {
+        "index": index,
+        "id": record.get("id"),
+        "conversation_id": record.get("conversation_id") or str(uuid.uuid4()),
+        "message": record["message"]
+    }
+
+
+def parse_batch_lines(lines: Iterable[Union[str, bytes]]) -> Iterator[Dict[str, Any]]:
+    """逐行解析JSONL输入，依次产出有效条目或错误结果（见 parse_batch_line）"""
+    for index, line in enumerate(lines):
+        item = parse_batch_line(index, line)
+        if item is not None:
+            yield item
+
+
+async def aparse_batch_lines(lines: AsyncIterable[Union[str, bytes]]) -> AsyncIterator[Dict[str, Any]]:
+    """parse_batch_lines 的异步版本，用于边接收边解析的上传"""
+    index = 0
+    async for line in lines:
+        item = parse_batch_line(index, line)
+        index += 1
+        if item is not None:
+            yield item
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """把字节块流切分为行，只缓存尚未结束的一行"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+class BatchRunner:
+    """并发执行批量对话
+
+    同一会话的消息按输入顺序依次处理（后面的消息能看到前面的历史），
+    不同会话由 concurrency 个工作协程并行处理；每条消息调用模型前先经过限速器。
+    输入边读边处理，不需要先把整个批次读入内存。
+    """
+
+    def __init__(self,
+                 agent: CounselorAgent,
+                 memory: ConversationMemory,
+                 history_manager: ChatHistoryManager,
+                 gate: Optional[ConversationGate] = None,
+                 concurrency: int = 8,
+                 rate_limit: float = 0,
+                 include_steps: bool = False,
+                 max_buffered: Optional[int] = None):
+        self.agent = agent
+        self.memory = memory
+        self.history_manager = history_manager
+        # 与在线接口共用时，批量消息和在线请求对同一会话也不会交错
+        self.gate = gate or ConversationGate()
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.include_steps = include_steps
+        # 已读入但尚未处理完的条目上限
+        self.max_buffered = max_buffered or self.concurrency * 4
+
+    async def _process(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        conversation_id = item["conversation_id"]
+        result = {
+            "index": item["index"],
+            "id": item["id"],
+            "conversation_id": conversation_id,
+            "message": item["message"]
+        }
+        await self.rate_limiter.acquire()
+        start = time.perf_counter()
+        with request_timer("batch") as spans:
+            try:
+                async with self.gate.hold(conversation_id, item["message"]):
+                    await self._process_turn(item, conversation_id, result)
+            except OverloadedError as e:
+                # 上游过载时快速失败，客户端可在 retry_after 秒后重放这一条
+                result["error"] = str(e)
+                result["retry_after"] = e.retry_after
+            except Exception as e:
+                logger.error(f"Batch item {item['index']} failed: {str(e)}")
+                result["error"] = str(e)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["timings_ms"] = summarize_spans(spans)["totals_ms"]
+        return result
+
+    async def _process_turn(self, item: Dict[str, Any], conversation_id: str, result: Dict[str, Any]) -> None:
+        """执行一轮对话（与 /api/chat 相同的步骤），把结果写入 result"""
+        with span("history_load"):
+            chat_history = await self.history_manager.aget_window(conversation_id)
+        with span("persist"):
+            await self.memory.aadd_message(conversation_id, {"role": "user", "content": item["message"]})
+
+        response = await self.agent.generate_response(
+            item["message"],
+            chat_history,
+            conversation_id=conversation_id
+        )
+
+        with span("persist"):
+            await self.memory.aadd_message(conversation_id, {"role": "assistant", "content": response["response"]})
+
+        result.update({
+            "response": response["response"],
+            "route": response.get("route"),
+            "role": response.get("role"),
+            "risk": response.get("risk")
+        })
+        if self.include_steps:
+            result["steps"] = [
+                {"tool": action.tool, "input": action.tool_input, "output": str(output)}
+                for action, output in response.get("intermediate_steps", [])
+            ]
+
+    async def run(self,
+                  items: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]]
+                  ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        处理所有条目，按完成顺序产出结果
+
+        items 可以是列表，也可以是边读边解析的（异步）迭代器：条目读入后立即分派，
+        已读入但结果尚未被调用方取走的条目不超过 max_buffered 条，读取速度受处理和输出速度约束。
+        带 error 字段的条目（无效行）直接作为结果输出。
+        """
+        # 有条目待处理或正在处理的会话 -> 该会话尚未处理完的条目
+        queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        # 等待工作协程接手的会话，None 表示输入已读完
+        ready: asyncio.Queue = asyncio.Queue()
+        # (结果, 是否占用缓冲名额)
+        results: asyncio.Queue = asyncio.Queue()
+        buffered = asyncio.Semaphore(self.max_buffered)
+
+        async def feed():
+            async for item in _aiter(items):
+                if "error" in item:
+                    await results.put((item, False))
+                    continue
+                await buffered.acquire()
+                conversation_id = item["conversation_id"]
+                queue = queues.get(conversation_id)
+                if queue is not None:
+                    # 该会话正在处理，排在它后面，保证同一会话按输入顺序处理
+                    queue.append(item)
+                else:
+                    queues[conversation_id] = deque([item])
+                    ready.put_nowait(conversation_id)
+
+        async def worker():
+            while True:
+                conversation_id = await ready.get()
+                if conversation_id is None:
+                    return
+                queue = queues[conversation_id]
+                while queue:
+                    await results.put((await self._process(queue[0]), True))
+                    queue.popleft()
+                del queues[conversation_id]
+
+        async def supervise():
+            try:
+                await feed()
+                for _ in workers:
+                    ready.put_nowait(None)
+                await asyncio.gather(*workers)
+            finally:
+                await results.put((_DONE, False))
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        supervisor = asyncio.create_task(supervise())
+        try:
+            while True:
+                result, holds_slot = await results.get()
+                if result is _DONE:
+                    break
+                yield result
+                if holds_slot:
+                    buffered.release()
+            # 读取输入失败时把异常抛给调用方
+            await supervisor
+        finally:
+            # 调用方提前停止（例如客户端断开）时取消剩余工作
+            for task in [supervisor, *workers]:
+                task.cancel()
+            await asyncio.gather(supervisor, *workers, return_exceptions=True)
+
+
+_DONE = object()
+
+
+async def _aiter(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    """把同步或异步可迭代对象统一为异步迭代"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """线程安全的LRU缓存，支持条目数/近似字节数上限以及过期淘汰
+
+    - max_entries: 最大条目数，0 表示不限制
+    - max_bytes: 所有条目近似大小之和的上限，0 表示不限制
+    - ttl: 写入后的存活时间（秒），0 表示不过期
+    - idle_ttl: 最近一次访问后的空闲时间（秒），0 表示不过期
+    - on_evict: 条目被淘汰（容量或过期）时的回调 on_evict(key, value)，在锁外调用
+    """
+
+    def __init__(self,
+                 max_entries: int = 0,
+                 max_bytes: int = 0,
+                 ttl: float = 0,
+                 idle_ttl: float = 0,
+                 sizeof: Optional[Callable[[Any], int]] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self.on_evict = on_evict
+
+        # key -> [value, size, created_at, last_access]，按访问顺序排列
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _is_expired(self, entry: list, now: float) -> bool:
+        if self.ttl and now - entry[2] > self.ttl:
+            return True
+        if self.idle_ttl and now - entry[3] > self.idle_ttl:
+            return True
+        return False
+
+    def _remove(self, key: Hashable) -> list:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry[1]
+        return entry
+
+    def _collect_evictions(self, now: float) -> list:
+        """在持有锁时挑出需要淘汰的条目，返回 (key, value) 列表"""
+        evicted = []
+
+        # 按访问顺序排列，空闲过期的条目一定在最前面
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if not self._is_expired(entry, now):
+                break
+            self._remove(key)
+            self.expirations += 1
+            evicted.append((key, entry[0]))
+
+        while self._entries and (
+            (self.max_entries and len(self._entries) > self.max_entries) or
+            (self.max_bytes and self._total_bytes > self.max_bytes and len(self._entries) > 1)
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry[1]
+            self.evictions += 1
+            evicted.append((key, entry[0]))
+
+        return evicted
+
+    def _notify(self, evicted: list) -> None:
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取条目，命中时刷新访问时间"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry, now):
+                self._remove(key)
+                self.expirations += 1
+                evicted = [(key, entry[0])]
+                entry = None
+            else:
+                evicted = []
+
+            if entry is None:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                entry[3] = now
+                self._entries.move_to_end(key)
+                value = entry[0]
+
+            evicted.extend(self._collect_evictions(now))
+
+        self._notify(evicted)
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """读取条目但不更新访问顺序和计数"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """写入或更新条目，size 不指定时使用 sizeof 计算"""
+        size = self.sizeof(value) if size is None else size
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._total_bytes -= entry[1]
+                entry[0], entry[1], entry[3] = value, size, now
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = [value, size, now, now]
+            self._total_bytes += size
+            evicted = self._collect_evictions(now)
+
+        self._notify(evicted)
+
+    def grow(self, key: Hashable, delta: int) -> bool:
+        """条目的值被原地修改（如列表追加）后调整其大小估算并刷新访问时间
+
+        不重新计算整个值的大小。条目不存在时返回 False，调用方应改用 set。
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            entry[1] += delta
+            entry[3] = now
+            self._total_bytes += delta
+            self._entries.move_to_end(key)
+            evicted = self._collect_evictions(now)
+
+        self._notify(evicted)
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除条目（不触发 on_evict）"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            return self._remove(key)[0]
+
+    def evict_expired(self) -> int:
+        """主动清理过期条目，返回淘汰数量"""
+        with self._lock:
+            evicted = self._collect_evictions(time.monotonic())
+        self._notify(evicted)
+        return len(evicted)
+
+    def clear(self) -> None:
+        """清空缓存，每个条目都会触发 on_evict"""
+        with self._lock:
+            evicted = [(key, entry[0]) for key, entry in self._entries.items()]
+            self._entries.clear()
+            self._total_bytes = 0
+        self._notify(evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry, time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中、未命中、淘汰计数和当前占用"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,482 @@
+"""并发控制：按会话串行化请求、相同调用的合并（single-flight）以及自适应并发限制"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+import zlib
+
+from app.cache import LRUCache
+
+try:
+    import fcntl
+except ImportError:  # Windows 不支持跨进程文件锁
+    fcntl = None
+
+
+class DuplicateRequestError(Exception):
+    """同一会话中相同的消息正在处理（reject 策略）"""
+
+
+class OverloadedError(Exception):
+    """等待队列已满或排队超时，请求被拒绝（接口返回503）"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class KeyedLock:
+    """按键划分的异步锁，没有持有者和等待者的键会被立即清理
+
+    只在单个事件循环中使用。
+    """
+
+    def __init__(self):
+        # 键 -> [锁, 持有和等待的协程数]
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable) -> AsyncIterator[None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class FileLockStripes:
+    """跨进程的按键互斥：键按哈希分到固定数量的锁文件上，用 flock 加锁
+
+    不同键可能落到同一个锁文件上而相互等待，但不会影响正确性。等待时以
+    非阻塞方式轮询，不占用线程，取消等待也不会遗留锁。
+    """
+
+    def __init__(self, directory: str, stripes: int = 256,
+                 poll_interval: float = 0.002, max_poll_interval: float = 0.05):
+        if fcntl is None:
+            raise RuntimeError("File locks require fcntl (POSIX only)")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stripes = stripes
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.contended = 0
+
+    def _path(self, key: str) -> str:
+        stripe = zlib.crc32(key.encode("utf-8")) % self.stripes
+        return os.path.join(self.directory, f"conversation-{stripe:03d}.lock")
+
+    @asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[None]:
+        # 每次加锁都单独打开文件：flock 按打开的文件描述归属，同一进程内的两次加锁也会互斥
+        fd = os.open(self._path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            delay = self.poll_interval
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if delay == self.poll_interval:
+                        self.contended += 1
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_poll_interval)
+            yield
+        finally:
+            # 关闭文件描述即释放锁
+            os.close(fd)
+
+
+class ConversationGate:
+    """会话请求闸门
+
+    同一会话的请求按到达顺序依次执行（读历史、调用模型、写消息作为一个整体），
+    保证消息顺序和存储内容不会交错。对同一会话中内容相同、仍在处理中的重复消息，
+    可选择的策略:
+        queue: 照常排队，依次处理（默认）
+        reject: 抛出 DuplicateRequestError（接口返回409）
+        coalesce: 不再重复处理，等待正在进行的请求并共享其结果；
+            原请求被取消时由其中一个等待者重新执行
+
+    指定 lock_dir 时（多进程部署），在进程内的锁之外再加一层文件锁，
+    同一会话落到不同工作进程的请求也会依次执行。重复消息的检测仍只在进程内进行。
+    """
+
+    POLICIES = ("queue", "reject", "coalesce")
+
+    def __init__(self, policy: str = "queue", lock_dir: Optional[str] = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        self.policy = policy
+        self.locks = KeyedLock()
+        self.file_locks = FileLockStripes(lock_dir) if lock_dir else None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._stats = {"requests": 0, "waited": 0, "rejected": 0, "coalesced": 0, "rerun": 0}
+
+    @staticmethod
+    def _key(conversation_id: str, message: str) -> Tuple[str, str]:
+        return conversation_id, " ".join(message.split())
+
+    def is_duplicate(self, conversation_id: str, message: str) -> bool:
+        """相同的消息是否正在该会话中处理"""
+        return self._key(conversation_id, message) in self._inflight
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: str, message: str) -> AsyncIterator[None]:
+        """独占会话执行一段代码（不支持合并，coalesce 策略下重复消息按 reject 处理）"""
+        key = self._key(conversation_id, message)
+        self._stats["requests"] += 1
+        if key in self._inflight and self.policy != "queue":
+            self._stats["rejected"] += 1
+            raise DuplicateRequestError(f"Duplicate message in flight for conversation {conversation_id}")
+
+        future = self._register(key)
+        try:
+            async with self._acquire(conversation_id):
+                yield
+        finally:
+            self._unregister(key, future)
+
+    async def run(self, conversation_id: str, message: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """按会话串行执行 func，并按策略处理重复消息"""
+        key = self._key(conversation_id, message)
+        self._stats["requests"] += 1
+        while self.policy != "queue":
+            existing = self._inflight.get(key)
+            if existing is None:
+                break
+            if self.policy == "reject":
+                self._stats["rejected"] += 1
+                raise DuplicateRequestError(f"Duplicate message in flight for conversation {conversation_id}")
+            self._stats["coalesced"] += 1
+            try:
+                # shield: 等待方被取消时不影响正在执行的原请求
+                return await asyncio.shield(existing)
+            except asyncio.CancelledError:
+                # 等待者自己被取消（可能与原请求同时被取消）时不再重新执行
+                if not existing.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # 只有原请求被取消（如客户端断开），不会再有结果：第一个醒来的等待者重新执行，
+                # 其余等待者合并到它上面
+                self._stats["rerun"] += 1
+
+        future = self._register(key)
+        try:
+            async with self._acquire(conversation_id):
+                result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._unregister(key, future)
+
+    @asynccontextmanager
+    async def _acquire(self, conversation_id: str) -> AsyncIterator[None]:
+        if self.locks.locked(conversation_id):
+            self._stats["waited"] += 1
+        async with self.locks.acquire(conversation_id):
+            if self.file_locks is None:
+                yield
+            else:
+                async with self.file_locks.acquire(conversation_id):
+                    yield
+
+    def _register(self, key: Tuple[str, str]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        # 没有合并等待者时异常无人读取，避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # queue 策略下可能已有相同消息在处理，保留先到的那个供合并使用
+        self._inflight.setdefault(key, future)
+        return future
+
+    def _unregister(self, key: Tuple[str, str], future: asyncio.Future) -> None:
+        if not future.done():
+            future.cancel()
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回请求、排队等待、拒绝、合并以及原请求被取消后重新执行的计数"""
+        stats = dict(self._stats, active_conversations=len(self.locks), policy=self.policy)
+        if self.file_locks is not None:
+            stats["cross_process_waited"] = self.file_locks.contended
+        return stats
+
+
+_MISSING = object()
+
+
+class _SyncCall:
+    """同步路径上正在执行的一次调用"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次，其余调用方等待并共享结果
+
+    可选的结果缓存（result_ttl > 0）让调用完成后短时间内的相同调用直接返回。
+    异常不会被缓存，同一批等待者都会收到该异常。异步调用在独立的任务中执行，
+    发起者被取消不会影响其他等待者。
+    """
+
+    def __init__(self, result_ttl: float = 0, max_entries: int = 1000):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._sync_inflight: Dict[Hashable, _SyncCall] = {}
+        self._sync_lock = threading.Lock()
+        self._results = LRUCache(max_entries=max_entries, ttl=result_ttl) if result_ttl > 0 else None
+        self._stats = {"calls": 0, "executions": 0, "shared": 0, "cache_hits": 0}
+
+    def _cached(self, key: Hashable) -> Tuple[bool, Any]:
+        if self._results is None:
+            return False, None
+        value = self._results.get(key, _MISSING)
+        if value is _MISSING:
+            return False, None
+        self._stats["cache_hits"] += 1
+        return True, value
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 func 或等待正在执行的相同调用"""
+        self._stats["calls"] += 1
+        hit, value = self._cached(key)
+        if hit:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self._stats["executions"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._execute(key, func))
+        else:
+            self._stats["shared"] += 1
+        return await asyncio.shield(task)
+
+    async def _execute(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await func()
+            if self._results is not None:
+                self._results.set(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def do_sync(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """do 的同步版本，供在线程中执行的调用使用"""
+        with self._sync_lock:
+            self._stats["calls"] += 1
+            hit, value = self._cached(key)
+            if hit:
+                return value
+            call = self._sync_inflight.get(key)
+            leader = call is None
+            if leader:
+                self._stats["executions"] += 1
+                call = self._sync_inflight[key] = _SyncCall()
+            else:
+                self._stats["shared"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            if self._results is not None:
+                self._results.set(key, call.result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._sync_lock:
+                self._sync_inflight.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回调用次数、实际执行次数、共享次数和缓存命中次数"""
+        return dict(self._stats, inflight=len(self._inflight) + len(self._sync_inflight))
+
+
+class _Waiter:
+    """排队中的调用方：异步调用方用 future 唤醒，线程用 Event 唤醒"""
+
+    __slots__ = ("loop", "future", "event", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制
+
+    同时执行的调用数不超过 limit：调用成功且并发已用满时 limit 加 1/limit
+    （每轮约加1），收到过载信号（429、5xx、超时）时乘以 decrease_ratio。
+    两次减小之间至少间隔一个平均调用耗时（一轮），同一批并发调用同时失败
+    只减小一次，不会把限制直接压到底。
+    超出限制的调用按先后排队，队列满时立即抛出 OverloadedError，
+    排队超过 queue_timeout 秒同样抛出。线程安全，可同时用于事件循环和线程。
+    """
+
+    def __init__(self,
+                 initial_limit: int = 16,
+                 min_limit: int = 1,
+                 max_limit: int = 128,
+                 max_queue: int = 256,
+                 queue_timeout: float = 30.0,
+                 decrease_ratio: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.decrease_ratio = decrease_ratio
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._last_decrease = 0.0
+        # 最近成功调用耗时的指数平均，作为减小间隔和估算 Retry-After 的依据
+        self._latency = 1.0
+        self._stats = {"completed": 0, "overloads": 0, "shed": 0, "queue_timeouts": 0, "retries": 0}
+
+    def _try_acquire(self, waiter_factory: Callable[[], _Waiter]) -> Optional[_Waiter]:
+        """有空位时直接占用并返回 None，否则排队并返回等待者"""
+        with self._lock:
+            if self._in_flight < int(self.limit) and not self._waiters:
+                self._in_flight += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._stats["shed"] += 1
+                raise OverloadedError("LLM request queue is full", self.retry_after())
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """放弃排队，返回是否已经拿到了位置（拿到时由调用方决定使用或释放）"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _grant_waiters(self) -> None:
+        """在持有锁时把空出的位置交给排队最久的等待者"""
+        while self._waiters and self._in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            if waiter.loop is not None:
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            else:
+                waiter.event.set()
+
+    async def acquire(self) -> None:
+        """异步占用一个位置"""
+        loop = asyncio.get_running_loop()
+        waiter = self._try_acquire(lambda: _Waiter(loop))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self._stats["queue_timeouts"] += 1
+                raise OverloadedError("Timed out waiting for an LLM slot", self.retry_after())
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release(None)
+            raise
+
+    def acquire_sync(self) -> None:
+        """在线程中占用一个位置"""
+        waiter = self._try_acquire(_Waiter)
+        if waiter is None:
+            return
+        if not waiter.event.wait(self.queue_timeout or None) and not self._abandon(waiter):
+            self._stats["queue_timeouts"] += 1
+            raise OverloadedError("Timed out waiting for an LLM slot", self.retry_after())
+
+    def release(self, outcome: Optional[str], latency: Optional[float] = None) -> None:
+        """
+        释放位置并根据结果调整限制
+
+        Args:
+            outcome: "success"、"overload"（429/5xx/超时），其他失败或取消为 None（不调整）
+            latency: 本次调用耗时（秒）
+        """
+        with self._lock:
+            in_use = self._in_flight
+            self._in_flight -= 1
+            if latency is not None:
+                self._latency = 0.8 * self._latency + 0.2 * latency
+            if outcome == "success":
+                self._stats["completed"] += 1
+                # 只有并发真正用满时才增加，空闲时限制不会无限增长
+                if in_use >= int(self.limit):
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == "overload":
+                self._stats["overloads"] += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self._latency:
+                    self._last_decrease = now
+                    self.limit = max(self.min_limit, self.limit * self.decrease_ratio)
+            self._grant_waiters()
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self._stats["retries"] += 1
+
+    def retry_after(self) -> float:
+        """估算排到的等待时间（秒），用于503响应的 Retry-After"""
+        queued = len(self._waiters)
+        return max(1.0, round(self._latency * (queued + 1) / max(self.limit, 1.0), 1))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前限制、执行中和排队的调用数以及各类计数"""
+        with self._lock:
+            return dict(
+                self._stats,
+                limit=round(self.limit, 2),
+                in_flight=self._in_flight,
+                queued=len(self._waiters),
+                latency_ema=round(self._latency, 3)
+            )
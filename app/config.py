@@ -8,6 +8,8 @@ class Settings:
     # API配置
     API_HOST = os.getenv("API_HOST", "0.0.0.0")
     API_PORT = int(os.getenv("API_PORT", "8000"))
+    # 工作进程数，大于1时会话历史、角色和提案都通过共享的SQLite文件在进程间共享
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))
     
     # OpenAI配置
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -18,9 +20,102 @@ class Settings:
     default_temperature: float = 0.7
     max_tokens: int = 4000
 
+    # LLM HTTP连接池配置
+    LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+    LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+    LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+    # 上游LLM调用的自适应并发限制（AIMD）和排队，队列满或排队超时时接口返回503
+    LLM_LIMITER_ENABLED = os.getenv("LLM_LIMITER_ENABLED", "True").lower() == "true"
+    LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "16"))
+    LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+    LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", "128"))
+    LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    # 429、5xx、连接错误和超时的重试（带抖动的指数退避，优先使用 Retry-After）
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+
+    # 相同 (模型, 参数, 提示) 的并发调用只请求一次上游；结果缓存时间为0表示只合并进行中的调用
+    LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    LLM_RESULT_CACHE_TTL = float(os.getenv("LLM_RESULT_CACHE_TTL", "0"))
+    LLM_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("LLM_RESULT_CACHE_MAX_ENTRIES", "1000"))
+
+    # 自定义模型构造函数的导入路径（如 benchmarks.fake_llm:create_fake_llm），为空时使用 ChatOpenAI
+    LLM_FACTORY = os.getenv("LLM_FACTORY", "")
+
+    # 同步工具线程池大小
+    TOOL_THREAD_POOL_SIZE = int(os.getenv("TOOL_THREAD_POOL_SIZE", "8"))
+
+    # 消息路由配置
+    ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "True").lower() == "true"
+    ROUTER_USE_LLM = os.getenv("ROUTER_USE_LLM", "True").lower() == "true"
+    ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+
+    # 风险评估结果缓存配置（磁盘路径为空表示只使用内存缓存）
+    RISK_CACHE_ENABLED = os.getenv("RISK_CACHE_ENABLED", "True").lower() == "true"
+    RISK_CACHE_MAX_ENTRIES = int(os.getenv("RISK_CACHE_MAX_ENTRIES", "10000"))
+    RISK_CACHE_TTL = float(os.getenv("RISK_CACHE_TTL", "3600"))
+    RISK_CACHE_DISK_PATH = os.getenv("RISK_CACHE_DISK_PATH", "")
+
+    # 预先风险评估：与主回答并发执行，高风险时用危机资源回复替换回答，
+    # 启用时Agent不再绑定风险评估工具；模型为空表示使用默认模型
+    RISK_PREFLIGHT_ENABLED = os.getenv("RISK_PREFLIGHT_ENABLED", "True").lower() == "true"
+    RISK_ASSESSMENT_MODEL = os.getenv("RISK_ASSESSMENT_MODEL", "")
+    # 等待评估结果的最长时间（秒，含一次重试）；超时或结果无法解析时按未评估处理，只用危机关键词兜底
+    RISK_PREFLIGHT_TIMEOUT = float(os.getenv("RISK_PREFLIGHT_TIMEOUT", "10"))
+
+    # 同一会话中相同消息仍在处理时的策略: queue（排队）、reject（返回409）、coalesce（共享结果）
+    CONVERSATION_DUPLICATE_POLICY = os.getenv("CONVERSATION_DUPLICATE_POLICY", "queue").lower()
+    # 多进程部署时跨进程会话锁文件所在目录
+    CONVERSATION_LOCK_DIR = os.getenv("CONVERSATION_LOCK_DIR", "./data/locks")
+
+    # 批量对话配置（限速为每秒请求数，0 表示不限速）
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "64"))
+    BATCH_RATE_LIMIT = float(os.getenv("BATCH_RATE_LIMIT", "0"))
+
+    # 提案存储配置（路径为空表示只保存在内存中）
+    PROPOSAL_DB_PATH = os.getenv("PROPOSAL_DB_PATH", "./data/proposals.sqlite3")
+    PROPOSAL_PAGE_SIZE = int(os.getenv("PROPOSAL_PAGE_SIZE", "20"))
+
+    # 资源检索配置
+    RESOURCE_SEARCH_TOP_K = int(os.getenv("RESOURCE_SEARCH_TOP_K", "5"))
+
     # 应用配置
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+    # 会话存储配置
+    CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "sqlite" if API_WORKERS > 1 else "json")  # json, journal, sqlite
+    CONVERSATION_DIR = os.getenv("CONVERSATION_DIR", "./data/conversations")
+    JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "False").lower() == "true"
+    JOURNAL_COMPACT_THRESHOLD = int(os.getenv("JOURNAL_COMPACT_THRESHOLD", "200"))
+    JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", "60"))
+    CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "./data/conversations.sqlite3")
+    # 单进程部署时会话角色的存储路径（为空表示只保存在内存中），多进程部署时使用 CONVERSATION_DB_PATH
+    ROLE_DB_PATH = os.getenv("ROLE_DB_PATH", "./data/roles.sqlite3")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_COMMIT_INTERVAL = float(os.getenv("SQLITE_COMMIT_INTERVAL", "0.002"))
+    SQLITE_MAX_BATCH = int(os.getenv("SQLITE_MAX_BATCH", "256"))
+
+    # 会话缓存配置（0 表示不限制）
+    CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+    CONVERSATION_CACHE_MAX_BYTES = int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    CONVERSATION_CACHE_IDLE_TTL = float(os.getenv("CONVERSATION_CACHE_IDLE_TTL", "1800"))
+
+    # 会话异步持久化配置
+    MEMORY_IO_WORKERS = int(os.getenv("MEMORY_IO_WORKERS", "4"))
+    MEMORY_WRITE_DELAY = float(os.getenv("MEMORY_WRITE_DELAY", "0"))
+
+    # 聊天历史窗口配置（token预算为0表示发送全部历史）
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "False").lower() == "true"
+    # 已转换历史窗口缓存的内存上限（字节，0 表示不限制），条数上限与会话缓存相同
+    HISTORY_CACHE_MAX_BYTES = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
     
     # 验证OpenAI API密钥是否存在
     def validate(self):
@@ -30,9 +125,21 @@ class Settings:
         
         if missing_keys:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_keys)}")
+
+        # 多进程部署时状态必须放在进程间共享的存储中
+        if self.API_WORKERS > 1:
+            if self.CONVERSATION_STORE.lower() != "sqlite":
+                raise ValueError("API_WORKERS > 1 requires CONVERSATION_STORE=sqlite")
+            if not self.PROPOSAL_DB_PATH:
+                raise ValueError("API_WORKERS > 1 requires PROPOSAL_DB_PATH")
         
         return True
 
+    @property
+    def shared_state(self) -> bool:
+        """是否以多进程方式部署，需要在进程间共享会话状态"""
+        return self.API_WORKERS > 1
+
     def setup_environment(self):
         """设置环境变量用于LangChain"""
         os.environ["OPENAI_API_BASE"] = self.BASE_URL
@@ -1,21 +1,95 @@
 from langchain_core.messages import HumanMessage, AIMessage
-import json
-import os
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import sys
+import threading
+
+from app.cache import LRUCache
+from app.config import settings
+from app.metrics import span
+from app.storage import ConversationStore, create_store
+
+logger = logging.getLogger(__name__)
+
+# 每条消息除内容外的近似开销（dict、角色、时间戳）
+_MESSAGE_OVERHEAD_BYTES = 256
+
+
+def _estimate_message_size(message: Dict) -> int:
+    """估算一条消息在内存中占用的字节数"""
+    return _MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.get("content", ""))
+
+
+def _estimate_size(messages: List[Dict]) -> int:
+    """估算会话在内存中占用的字节数"""
+    return sum(_estimate_message_size(msg) for msg in messages)
+
 
 class ConversationMemory:
-    """简单的会话管理器，生产环境应使用数据库"""
+    """会话管理器，内存中只保留有界的LRU缓存，持久化由可插拔的存储后端完成
+
+    同步方法（get_conversation、add_message）会在调用线程上直接读写存储；
+    异步方法（aget_conversation、aadd_message）把磁盘I/O放到专用线程池中，
+    并按会话合并写入：同一会话在一次写入进行期间追加的消息会在下一次写入中一并提交。
+
+    多进程部署（shared=True）时，其他进程可能写入同一会话：命中缓存后会用
+    存储中的消息条数校验缓存，不一致则重新加载；新消息写入存储后才返回。
+    """
     
-    def __init__(self, storage_dir="./data/conversations"):
-        self.storage_dir = storage_dir
-        # 确保存储目录存在
-        os.makedirs(self.storage_dir, exist_ok=True)
-        self.conversations = {}
+    def __init__(self,
+                 storage_dir: Optional[str] = None,
+                 store: Optional[ConversationStore] = None,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 idle_ttl: Optional[float] = None,
+                 io_workers: Optional[int] = None,
+                 write_delay: Optional[float] = None,
+                 shared: Optional[bool] = None):
+        self.storage_dir = storage_dir or settings.CONVERSATION_DIR
+        # 存储后端，默认根据配置创建（json、journal 或 sqlite）
+        self.store = store or create_store(storage_dir=self.storage_dir)
+        self._lock = threading.RLock()
+        # 尚未持久化的消息
+        self._pending: Dict[str, List[Dict]] = {}
+        # 已被淘汰但仍有待写消息的会话，写回完成前继续以它为准
+        self._evicted: Dict[str, List[Dict]] = {}
+        # 正在写入的会话，保证同一会话同一时间只有一个写入者
+        self._flushing = set()
+        # 同一会话的写入完成时通知等待者
+        self._flush_done = threading.Condition(self._lock)
+        # 正在锁外从存储加载的会话 -> [加载者数, 加载期间完成的写入次数]
+        self._loading: Dict[str, List[int]] = {}
+        self.conversations = LRUCache(
+            max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES if max_entries is None else max_entries,
+            max_bytes=settings.CONVERSATION_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+            idle_ttl=settings.CONVERSATION_CACHE_IDLE_TTL if idle_ttl is None else idle_ttl,
+            sizeof=_estimate_size,
+            on_evict=self._on_evict
+        )
+        
+        # 异步路径使用的I/O线程池和每个会话的后台写入任务
+        self._executor = ThreadPoolExecutor(
+            max_workers=io_workers or settings.MEMORY_IO_WORKERS,
+            thread_name_prefix="memory-io"
+        )
+        self.write_delay = settings.MEMORY_WRITE_DELAY if write_delay is None else write_delay
+        self._flush_tasks: Dict[str, asyncio.Task] = {}
+        # 是否与其他进程共享存储，默认在多进程部署时开启
+        self.shared = settings.shared_state if shared is None else shared
     
     def get_messages(self, conversation_id: str) -> List:
         """获取指定会话的消息记录 返回LangChain消息格式"""
-        raw_messages = self.get_conversation(conversation_id)
+        return self._to_langchain(self.get_conversation(conversation_id))
+    
+    async def aget_messages(self, conversation_id: str) -> List:
+        """get_messages 的异步版本"""
+        return self._to_langchain(await self.aget_conversation(conversation_id))
+    
+    @staticmethod
+    def _to_langchain(raw_messages: List[Dict]) -> List:
         messages = []
         
         for msg in raw_messages:
@@ -26,36 +100,255 @@ class ConversationMemory:
         
         return messages
     
+    def _get_cached(self, conversation_id: str) -> Optional[List[Dict]]:
+        """只查内存，不做任何I/O"""
+        with self._lock:
+            history = self.conversations.get(conversation_id)
+            if history is None:
+                # 写回尚未完成时，淘汰的版本比存储中的新
+                history = self._resolve(conversation_id)
+            return history
+    
+    def _is_stale(self, conversation_id: str, history: List[Dict]) -> bool:
+        """缓存的会话是否落后于存储（其他进程写入过该会话）"""
+        with self._lock:
+            # 本进程还有未写完的消息时，内存中的版本更新
+            if (conversation_id in self._pending or conversation_id in self._flushing
+                    or conversation_id in self._evicted):
+                return False
+            cached = len(history)
+        persisted = self.store.count(conversation_id)
+        return persisted is not None and persisted != cached
+
     def get_conversation(self, conversation_id: str) -> List[Dict]:
         """获取会话历史"""
         # 先从内存中查找
-        if conversation_id in self.conversations:
-            return self.conversations[conversation_id]
-        
-        # 从文件中加载
-        file_path = os.path.join(self.storage_dir, f"{conversation_id}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.conversations[conversation_id] = json.load(f)
-            return self.conversations[conversation_id]
+        history = self._get_cached(conversation_id)
+        if history is not None and self.shared and self._is_stale(conversation_id, history):
+            with self._lock:
+                # pop 不会触发淘汰回调，缓存的版本已经全部持久化
+                if self.conversations.peek(conversation_id) is history:
+                    self.conversations.pop(conversation_id)
+            history = None
+        if history is None:
+            history = self._load(conversation_id)
+        self._write_back_evicted()
+        return history
+    
+    def _resolve(self, conversation_id: str) -> Optional[List[Dict]]:
+        """返回内存中权威的会话列表（缓存或尚未写回的淘汰版本），调用方需持有锁"""
+        history = self.conversations.peek(conversation_id)
+        if history is None and conversation_id in self._evicted:
+            history = self._evicted[conversation_id]
+            self.conversations.set(conversation_id, history)
+        return history
+    
+    def _load(self, conversation_id: str) -> List[Dict]:
+        """缓存未命中时从存储后端加载并放入缓存"""
+        with self._lock:
+            history = self._resolve(conversation_id)
+            if history is not None:
+                return history
+            loading = self._loading.setdefault(conversation_id, [0, 0])
+            loading[0] += 1
+            writes = loading[1]
         
-        # 不存在则创建新会话
-        self.conversations[conversation_id] = []
-        return []
+        # 在锁外从存储后端加载，不阻塞其他会话；检查完写入计数之前保持登记，
+        # 否则在加载结束和检查之间完成的写入不会被计入
+        try:
+            while True:
+                with span("store_load", type(self.store).__name__):
+                    loaded = self.store.load(conversation_id)
+                
+                with self._lock:
+                    # 加载期间可能已有其他线程放入缓存，或追加了消息后又被淘汰
+                    history = self._resolve(conversation_id)
+                    if history is not None:
+                        return history
+                    if loading[1] == writes:
+                        # 不存在则创建新会话
+                        history = loaded if loaded is not None else []
+                        self.conversations.set(conversation_id, history)
+                        return history
+                    # 加载期间有写入完成，读到的可能是旧版本，在锁外重新加载
+                    writes = loading[1]
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    self._loading.pop(conversation_id, None)
+    
+    async def aget_conversation(self, conversation_id: str) -> List[Dict]:
+        """get_conversation 的异步版本，缓存未命中时在线程池中加载"""
+        # 多进程部署时命中缓存也要查询存储做校验，同样放到线程池中
+        history = None if self.shared else self._get_cached(conversation_id)
+        if history is None:
+            loop = asyncio.get_running_loop()
+            history = await loop.run_in_executor(self._executor, self.get_conversation, conversation_id)
+        self._schedule_evicted()
+        return history
+    
+    def _append_in_memory(self, conversation_id: str, message: Dict[str, str]) -> bool:
+        """把消息追加到内存中的会话；会话不在内存中时返回 False，由调用方加载后重试"""
+        with self._lock:
+            # 调用方加载会话后它可能已被淘汰、重新加载，以内存中的权威版本为准
+            history = self._resolve(conversation_id)
+            if history is None:
+                return False
+            
+            # 添加时间戳
+            message["timestamp"] = datetime.now().isoformat()
+            history.append(message)
+            self._pending.setdefault(conversation_id, []).append(message)
+            
+            # 在缓存的大小估算上加上新消息（不重新计算整个会话），可能触发其他会话被淘汰
+            if not self.conversations.grow(conversation_id, _estimate_message_size(message)):
+                self.conversations.set(conversation_id, history)
+            return True
     
     def add_message(self, conversation_id: str, message: Dict[str, str]) -> None:
         """添加消息到会话"""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
+        # 先加载已有历史，避免覆盖尚未读入内存的会话
+        self.get_conversation(conversation_id)
+        while not self._append_in_memory(conversation_id, message):
+            # 已被淘汰且全部写完，在锁外从存储重新加载
+            self._load(conversation_id)
+        
+        # 持久化新消息
+        self.flush(conversation_id)
+        self._write_back_evicted()
+    
+    async def aadd_message(self, conversation_id: str, message: Dict[str, str], wait: bool = False) -> None:
+        """
+        add_message 的异步版本
+        
+        消息立即进入内存，持久化由该会话的后台写入任务完成。
         
-        # 添加时间戳
-        message["timestamp"] = datetime.now().isoformat()
-        self.conversations[conversation_id].append(message)
+        Args:
+            conversation_id: 会话ID
+            message: 消息字典
+            wait: 是否等待本条消息写入存储后再返回（多进程部署时总是等待，
+                  保证下一个请求落到其他进程时也能读到）
+        """
+        await self.aget_conversation(conversation_id)
+        while not self._append_in_memory(conversation_id, message):
+            # 已被淘汰且全部写完，在I/O线程池中重新加载，不阻塞事件循环
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._load, conversation_id)
+        self._schedule_flush(conversation_id)
+        self._schedule_evicted()
         
-        # 保存到文件
-        self._save_conversation(conversation_id)
+        if wait or self.shared:
+            await self.aflush(conversation_id)
+    
+    def flush(self, conversation_id: str) -> None:
+        """把会话中尚未持久化的消息写入存储后端
+        
+        如果其他线程正在写入同一会话，先等它写完（它会接着写完期间追加的新消息），
+        返回时调用前追加的消息都已经持久化。
+        """
+        with self._lock:
+            while conversation_id in self._flushing:
+                self._flush_done.wait()
+            self._flushing.add(conversation_id)
+        
+        try:
+            while True:
+                with self._lock:
+                    pending = self._pending.pop(conversation_id, None)
+                    if not pending:
+                        if (self._evicted.pop(conversation_id, None) is not None
+                                and self.conversations.peek(conversation_id) is None):
+                            self.store.evict(conversation_id)
+                        return
+                    history = self.conversations.peek(conversation_id)
+                    if history is None:
+                        history = self._evicted.get(conversation_id, [])
+                    if self.store.rewrites_history:
+                        # 整体重写型后端在锁外序列化，先复制一份
+                        history = list(history)
+                
+                try:
+                    with span("store_write", type(self.store).__name__):
+                        self.store.append(conversation_id, pending, history)
+                except Exception:
+                    # 写入失败时保留待写消息，下次再试
+                    with self._lock:
+                        self._pending[conversation_id] = pending + self._pending.get(conversation_id, [])
+                    raise
+                with self._lock:
+                    # 通知正在锁外加载该会话的线程，它读到的可能是写入前的版本
+                    if conversation_id in self._loading:
+                        self._loading[conversation_id][1] += 1
+        finally:
+            with self._lock:
+                self._flushing.discard(conversation_id)
+                self._flush_done.notify_all()
+    
+    def _schedule_flush(self, conversation_id: str) -> None:
+        """为会话安排后台写入任务，已有任务时合并到该任务中"""
+        if conversation_id in self._flush_tasks:
+            return
+        self._flush_tasks[conversation_id] = asyncio.get_running_loop().create_task(
+            self._flush_in_background(conversation_id)
+        )
+    
+    async def _flush_in_background(self, conversation_id: str) -> None:
+        try:
+            if self.write_delay:
+                # 短暂等待，让紧接着到来的消息合并到同一次写入
+                await asyncio.sleep(self.write_delay)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.flush, conversation_id)
+        except Exception as e:
+            logger.error(f"Failed to persist conversation {conversation_id}: {str(e)}")
+        finally:
+            self._flush_tasks.pop(conversation_id, None)
+        
+        # 写入期间又有新消息且没有其他写入者接手时，再安排一次
+        with self._lock:
+            needs_flush = conversation_id in self._pending and conversation_id not in self._flushing
+        if needs_flush:
+            self._schedule_flush(conversation_id)
+    
+    async def aflush(self, conversation_id: Optional[str] = None) -> None:
+        """等待指定会话（不指定则为全部会话）的后台写入完成"""
+        while True:
+            if conversation_id is None:
+                tasks = list(self._flush_tasks.values())
+            else:
+                task = self._flush_tasks.get(conversation_id)
+                tasks = [task] if task else []
+            if not tasks:
+                return
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _on_evict(self, conversation_id: str, history: List[Dict]) -> None:
+        """会话被淘汰时记下尚未持久化（或正在写入）的消息，由调用方在锁外写回；
+        已经全部持久化的会话通知存储后端释放为它保存的状态"""
+        with self._lock:
+            if conversation_id in self._pending or conversation_id in self._flushing:
+                self._evicted[conversation_id] = history
+            else:
+                self.store.evict(conversation_id)
+    
+    def _write_back_evicted(self) -> None:
+        """同步写回被淘汰会话中的待写消息"""
+        for conversation_id in list(self._evicted):
+            try:
+                self.flush(conversation_id)
+            except Exception as e:
+                logger.error(f"Failed to write back evicted conversation {conversation_id}: {str(e)}")
+    
+    def _schedule_evicted(self) -> None:
+        """在后台写回被淘汰会话中的待写消息"""
+        for conversation_id in list(self._evicted):
+            self._schedule_flush(conversation_id)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """返回会话缓存的命中、未命中和淘汰计数"""
+        return self.conversations.stats()
     
-
     # def add_message(self, conversation_id, role, content):
     #     """添加消息到对话历史
         
@@ -73,8 +366,14 @@ class ConversationMemory:
     #         "timestamp": datetime.now().isoformat()
     #     })
     
-    def _save_conversation(self, conversation_id: str) -> None:
-        """保存会话到文件"""
-        file_path = os.path.join(self.storage_dir, f"{conversation_id}.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.conversations[conversation_id], f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    async def aclose(self) -> None:
+        """等待后台写入完成后关闭"""
+        await self.aflush()
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+    
+    def close(self) -> None:
+        """写回所有待写消息并关闭存储后端"""
+        for conversation_id in list(self._pending):
+            self.flush(conversation_id)
+        self._executor.shutdown(wait=True)
+        self.store.close()
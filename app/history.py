@@ -0,0 +1,206 @@
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Optional
+import logging
+import re
+import sys
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.cache import LRUCache
+from app.config import settings
+from app.database import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的固定开销（角色、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+# 缓存窗口内存估算：每个窗口和每条已转换消息的固定开销（字节）
+_WINDOW_OVERHEAD_BYTES = 512
+_MESSAGE_OVERHEAD_BYTES = 600
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# tiktoken 编码器，首次使用时加载；False 表示不可用
+_encoding = None
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:  # tiktoken 未安装或编码文件不可用时使用估算
+            _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数，没有 tiktoken 时按中文每字一个、其他每4个字符一个估算"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# 摘要函数: (需要折叠的消息, 之前的摘要) -> 新摘要
+Summarizer = Callable[[List[BaseMessage], Optional[str]], Awaitable[str]]
+
+
+class _ConversationWindow:
+    """单个会话已转换的LangChain消息及其token计数
+
+    不引用 ConversationMemory 中的原始消息列表（否则会话被淘汰后列表仍被窗口留在内存中），
+    只记下已处理的条数和最后一条已处理消息的标识，用来判断新取到的原始消息是否是同一会话的延续。
+    """
+
+    __slots__ = ("raw_count", "tail", "messages", "cumulative", "summary", "summary_upto", "nbytes")
+
+    def __init__(self):
+        self.raw_count = 0            # 已处理的原始消息数
+        self.tail = None              # raw_messages[raw_count - 1] 的标识
+        self.messages: List[BaseMessage] = []
+        self.cumulative = [0]         # cumulative[i] = messages[:i] 的token总数
+        self.summary: Optional[str] = None
+        self.summary_upto = 0         # 摘要已覆盖 messages[:summary_upto]
+        self.nbytes = _WINDOW_OVERHEAD_BYTES  # 内存占用估算
+
+    @staticmethod
+    def identity(msg: Dict):
+        return msg.get("role"), msg.get("content"), msg.get("timestamp")
+
+    def continues(self, raw_messages: List[Dict]) -> bool:
+        """raw_messages 的前 raw_count 条是否就是已处理的消息（会话被淘汰后重新加载也成立）"""
+        if self.raw_count > len(raw_messages):
+            return False
+        return self.raw_count == 0 or self.identity(raw_messages[self.raw_count - 1]) == self.tail
+
+
+class ChatHistoryManager:
+    """按token预算截取的增量聊天历史
+
+    每个会话缓存已转换的 HumanMessage/AIMessage 列表和每条消息的token数，
+    新消息只做增量转换。窗口从最新消息往前取，直到用完token预算。
+    配置了 summarizer 时，超出窗口的旧消息会被折叠成滚动摘要，
+    摘要只在折叠范围扩大时重新计算一次，之后重复使用。
+    """
+
+    def __init__(self,
+                 memory: ConversationMemory,
+                 token_budget: Optional[int] = None,
+                 summarizer: Optional[Summarizer] = None,
+                 token_counter: Callable[[str], int] = count_tokens):
+        """
+        Args:
+            memory: 会话存储
+            token_budget: 历史窗口的token预算，0 表示不截取
+            summarizer: 可选的摘要函数，用于折叠窗口之外的旧消息
+            token_counter: token计数函数
+        """
+        self.memory = memory
+        self.token_budget = settings.HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        # 按条数和字节数限制，与会话缓存的内存预算分开计算
+        self._windows = LRUCache(
+            max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+            max_bytes=settings.HISTORY_CACHE_MAX_BYTES,
+            idle_ttl=settings.CONVERSATION_CACHE_IDLE_TTL,
+            sizeof=lambda window: window.nbytes
+        )
+
+    def _sync(self, conversation_id: str, raw_messages: List[Dict]) -> _ConversationWindow:
+        """把原始消息中新增的部分转换并追加到缓存中"""
+        window = self._windows.get(conversation_id)
+        if window is None or not window.continues(raw_messages):
+            # 首次访问，或会话内容已被改写，需要重建
+            window = _ConversationWindow()
+            self._windows.set(conversation_id, window)
+
+        added = 0
+        for msg in raw_messages[window.raw_count:]:
+            if msg["role"] == "user":
+                message = HumanMessage(content=msg["content"])
+            elif msg["role"] == "assistant":
+                message = AIMessage(content=msg["content"])
+            else:
+                continue
+            window.messages.append(message)
+            window.cumulative.append(
+                window.cumulative[-1] + self.token_counter(msg["content"]) + _MESSAGE_OVERHEAD_TOKENS
+            )
+            added += _MESSAGE_OVERHEAD_BYTES + sys.getsizeof(msg["content"])
+        if len(raw_messages) > window.raw_count:
+            window.raw_count = len(raw_messages)
+            window.tail = window.identity(raw_messages[-1])
+        self._resize(conversation_id, window, added)
+        return window
+
+    def _resize(self, conversation_id: str, window: _ConversationWindow, delta: int) -> None:
+        """窗口内容变化后更新缓存中的大小估算（可能触发淘汰）"""
+        if delta:
+            window.nbytes += delta
+            self._windows.grow(conversation_id, delta)
+
+    def _window_start(self, window: _ConversationWindow, budget: int) -> int:
+        """找到使 messages[start:] 不超过预算的最小 start"""
+        total = window.cumulative[-1]
+        return bisect_left(window.cumulative, total - budget)
+
+    def _summary_message(self, summary: str) -> SystemMessage:
+        return SystemMessage(content=f"以下是此前对话的摘要:\n{summary}")
+
+    def _summary_tokens(self, window: _ConversationWindow) -> int:
+        if not window.summary:
+            return 0
+        return self.token_counter(window.summary) + _MESSAGE_OVERHEAD_TOKENS
+
+    def get_window(self, conversation_id: str) -> List[BaseMessage]:
+        """获取会话在token预算内的历史（同步版本，不生成新摘要）"""
+        window = self._sync(conversation_id, self.memory.get_conversation(conversation_id))
+        return self._build(window)
+
+    async def aget_window(self, conversation_id: str) -> List[BaseMessage]:
+        """获取会话在token预算内的历史，必要时先更新滚动摘要"""
+        window = self._sync(conversation_id, await self.memory.aget_conversation(conversation_id))
+        if self.summarizer is not None and self.token_budget:
+            await self._maybe_summarize(conversation_id, window)
+        return self._build(window)
+
+    def _build(self, window: _ConversationWindow) -> List[BaseMessage]:
+        if not self.token_budget:
+            return list(window.messages)
+
+        if window.summary:
+            budget = self.token_budget - self._summary_tokens(window)
+            start = max(window.summary_upto, self._window_start(window, budget))
+            return [self._summary_message(window.summary)] + window.messages[start:]
+
+        start = self._window_start(window, self.token_budget)
+        return window.messages[start:]
+
+    async def _maybe_summarize(self, conversation_id: str, window: _ConversationWindow) -> None:
+        budget = self.token_budget - self._summary_tokens(window)
+        if self._window_start(window, budget) <= window.summary_upto:
+            return
+
+        # 一次折叠到只剩一半预算，避免每轮都重新生成摘要
+        fold_upto = self._window_start(window, self.token_budget // 2)
+        folded = window.messages[window.summary_upto:fold_upto]
+        if not folded:
+            return
+
+        try:
+            summary = await self.summarizer(folded, window.summary)
+        except Exception as e:
+            # 摘要失败时退回纯窗口截取
+            logger.error(f"Failed to summarize conversation history: {str(e)}")
+            return
+        delta = sys.getsizeof(summary) - (sys.getsizeof(window.summary) if window.summary else 0)
+        window.summary = summary
+        window.summary_upto = fold_upto
+        self._resize(conversation_id, window, delta)
+
+    def stats(self) -> Dict:
+        """返回历史缓存的统计信息"""
+        return self._windows.stats()
@@ -1,6 +1,21 @@
 from langchain_openai import ChatOpenAI
-from typing import Optional
+from langchain_core.messages import BaseMessage
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from email.utils import parsedate_to_datetime
+import asyncio
+import hashlib
+import importlib
+import json
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+from app.concurrency import AdaptiveLimiter, SingleFlight
 from app.config import settings
+from app.metrics import metrics_handler, span
 
         # self.llm = ChatOpenAI(
         #     temperature=0.5,
@@ -8,6 +23,286 @@ from app.config import settings
         #     openai_api_key=settings.OPENAI_API_KEY
         # )
 
+# 上游调用的自适应并发限制，关闭时为 None（仍然会按配置重试）
+llm_limiter: Optional[AdaptiveLimiter] = AdaptiveLimiter(
+    initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+    max_queue=settings.LLM_QUEUE_MAX,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT
+) if settings.LLM_LIMITER_ENABLED else None
+
+# 可重试的HTTP状态码，其中 429/503/504 同时是过载信号，会让并发限制减小
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_OVERLOAD_STATUS = {429, 503, 504}
+
+
+def _parse_retry_after(error: Exception) -> Optional[float]:
+    """读取错误响应中的 retry-after-ms / retry-after（秒数或HTTP日期）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _classify_error(error: Exception) -> Tuple[bool, bool]:
+    """返回 (是否可重试, 是否为过载信号)"""
+    if isinstance(error, openai.APITimeoutError):
+        return True, True
+    if isinstance(error, openai.APIConnectionError):
+        return True, False
+    status = getattr(error, "status_code", None)
+    return status in _RETRYABLE_STATUS, status in _OVERLOAD_STATUS
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """下一次重试前的等待时间，不应重试时返回 None
+
+    有 Retry-After 时至少等待该时长（再加最多10%的抖动，错开同时被限流的请求），
+    超过最大等待时间则放弃；没有时使用 full jitter 指数退避。
+    """
+    retryable, _ = _classify_error(error)
+    if not retryable or attempt >= settings.LLM_MAX_RETRIES:
+        return None
+    retry_after = _parse_retry_after(error)
+    if retry_after is not None:
+        if retry_after > settings.LLM_RETRY_MAX_DELAY:
+            return None
+        return retry_after * random.uniform(1.0, 1.1)
+    return random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _overload_outcome(error: Exception) -> Optional[str]:
+    """失败调用对并发限制的反馈：过载信号为 "overload"，其他失败不调整"""
+    return "overload" if _classify_error(error)[1] else None
+
+
+async def _acall_limited(func: Callable[[], Awaitable[Any]]) -> Any:
+    """在并发限制内执行一次异步模型调用，失败时按策略重试"""
+    attempt = 0
+    while True:
+        if llm_limiter is not None:
+            with span("llm_queue"):
+                await llm_limiter.acquire()
+        start = time.perf_counter()
+        # 被取消等未完成的调用保持 None，不调整限制
+        outcome, latency = None, None
+        try:
+            result = await func()
+            outcome, latency = "success", time.perf_counter() - start
+            return result
+        except Exception as e:
+            outcome = _overload_outcome(e)
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+        finally:
+            if llm_limiter is not None:
+                llm_limiter.release(outcome, latency)
+        attempt += 1
+        if llm_limiter is not None:
+            llm_limiter.record_retry()
+        await asyncio.sleep(delay)
+
+
+def _call_limited(func: Callable[[], Any]) -> Any:
+    """_acall_limited 的同步版本"""
+    attempt = 0
+    while True:
+        if llm_limiter is not None:
+            with span("llm_queue"):
+                llm_limiter.acquire_sync()
+        start = time.perf_counter()
+        outcome, latency = None, None
+        try:
+            result = func()
+            outcome, latency = "success", time.perf_counter() - start
+            return result
+        except Exception as e:
+            outcome = _overload_outcome(e)
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+        finally:
+            if llm_limiter is not None:
+                llm_limiter.release(outcome, latency)
+        attempt += 1
+        if llm_limiter is not None:
+            llm_limiter.record_retry()
+        time.sleep(delay)
+
+
+async def _astream_limited(factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+    """在并发限制内执行一次流式调用，整个流结束前一直占用位置
+
+    只在收到第一个块之前重试，已经输出内容后出错直接抛出。
+    """
+    attempt = 0
+    while True:
+        if llm_limiter is not None:
+            with span("llm_queue"):
+                await llm_limiter.acquire()
+        start = time.perf_counter()
+        outcome, latency, started = None, None, False
+        try:
+            async for chunk in factory():
+                started = True
+                yield chunk
+            outcome, latency = "success", time.perf_counter() - start
+            return
+        except Exception as e:
+            outcome = _overload_outcome(e)
+            delay = None if started else _retry_delay(e, attempt)
+            if delay is None:
+                raise
+        finally:
+            if llm_limiter is not None:
+                llm_limiter.release(outcome, latency)
+        attempt += 1
+        if llm_limiter is not None:
+            llm_limiter.record_retry()
+        await asyncio.sleep(delay)
+
+
+def _stream_limited(factory: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+    """_astream_limited 的同步版本"""
+    attempt = 0
+    while True:
+        if llm_limiter is not None:
+            with span("llm_queue"):
+                llm_limiter.acquire_sync()
+        start = time.perf_counter()
+        outcome, latency, started = None, None, False
+        try:
+            for chunk in factory():
+                started = True
+                yield chunk
+            outcome, latency = "success", time.perf_counter() - start
+            return
+        except Exception as e:
+            outcome = _overload_outcome(e)
+            delay = None if started else _retry_delay(e, attempt)
+            if delay is None:
+                raise
+        finally:
+            if llm_limiter is not None:
+                llm_limiter.release(outcome, latency)
+        attempt += 1
+        if llm_limiter is not None:
+            llm_limiter.record_retry()
+        time.sleep(delay)
+
+
+class AdaptiveLimitMixin:
+    """聊天模型的混入类：每次上游调用都经过 llm_limiter 的并发限制和重试
+
+    放在模型类之前继承，如 class LimitedChatOpenAI(AdaptiveLimitMixin, ChatOpenAI)。
+    模型自身的重试应关闭（ChatOpenAI 的 max_retries=0），由这里统一重试。
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        generate = super()._generate
+        return _call_limited(lambda: generate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        agenerate = super()._agenerate
+        return await _acall_limited(lambda: agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        stream = super()._stream
+        yield from _stream_limited(lambda: stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        astream = super()._astream
+        async for chunk in _astream_limited(lambda: astream(messages, stop=stop, run_manager=run_manager, **kwargs)):
+            yield chunk
+
+
+class LimitedChatOpenAI(AdaptiveLimitMixin, ChatOpenAI):
+    """带自适应并发限制的 ChatOpenAI"""
+
+
+# 进程内共享的LLM客户端，按 (model, temperature, streaming, max_tokens) 复用
+_llm_registry: Dict[Tuple[str, float, bool, int], ChatOpenAI] = {}
+_registry_lock = threading.Lock()
+_registry_stats = {"hits": 0, "misses": 0}
+
+# 所有客户端共用的HTTP连接池（启用keep-alive）
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_http_stats = {"requests": 0}
+
+
+# 可替换的模型构造函数: (model, temperature, streaming, max_tokens) -> 聊天模型
+# 为 None 时使用 ChatOpenAI；基准测试等场景可以换成本地的假模型。
+# 返回的模型类需要继承 AdaptiveLimitMixin 才会经过并发限制
+_llm_factory: Optional[Callable[..., Any]] = None
+
+
+def _load_factory(path: str) -> Callable[..., Any]:
+    """按 'package.module:function' 形式的路径导入模型构造函数"""
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        module_name, _, attr = path.rpartition(".")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def set_llm_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """替换模型构造函数（None 表示恢复 ChatOpenAI），已创建的实例会被清空"""
+    global _llm_factory
+    with _registry_lock:
+        _llm_factory = factory
+        _llm_registry.clear()
+
+
+def _count_request(request: httpx.Request) -> None:
+    _http_stats["requests"] += 1
+
+
+async def _acount_request(request: httpx.Request) -> None:
+    _http_stats["requests"] += 1
+
+
+def _get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """创建（首次调用时）并返回共享的同步/异步HTTP客户端"""
+    global _http_client, _http_async_client
+    if _http_client is None:
+        limits = httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY
+        )
+        timeout = httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+        _http_client = httpx.Client(
+            limits=limits,
+            timeout=timeout,
+            event_hooks={"request": [_count_request]}
+        )
+        _http_async_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            event_hooks={"request": [_acount_request]}
+        )
+    return _http_client, _http_async_client
+
+
 def get_chat_llm_instance(
     model_name: Optional[str] = None,
     temperature: Optional[float] = None,
@@ -15,14 +310,16 @@ def get_chat_llm_instance(
     max_tokens: Optional[int] = None
 ) -> ChatOpenAI:
     """
-    创建并返回配置好的ChatOpenAI实例
-    
+    获取配置好的ChatOpenAI实例
+
+    相同参数的调用返回同一个实例，所有实例共享一个HTTP连接池。
+
     Args:
         model_name: 模型名称，如果不指定则使用配置中的默认模型
         temperature: 温度参数，控制输出随机性，0表示最确定性，1表示最创造性
         streaming: 是否使用流式输出
         max_tokens: 最大生成标记数
-        
+
     Returns:
         配置好的ChatOpenAI实例
     """
@@ -30,14 +327,141 @@ def get_chat_llm_instance(
     model = model_name or settings.OPENAI_MODEL
     temp = temperature if temperature is not None else settings.default_temperature
     max_tokens = max_tokens or settings.max_tokens
-    
-    # 创建ChatOpenAI实例
-    llm = ChatOpenAI(
-        model=model,
-        temperature=temp,
-        streaming=streaming,
-        max_tokens=max_tokens,
-        api_key=settings.OPENAI_API_KEY
-    )
-    
-    return llm
\ No newline at end of file
+
+    key = (model, temp, streaming, max_tokens)
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+        if llm is not None:
+            _registry_stats["hits"] += 1
+            return llm
+
+        _registry_stats["misses"] += 1
+        if _llm_factory is not None:
+            llm = _llm_factory(model=model, temperature=temp, streaming=streaming, max_tokens=max_tokens)
+            llm.callbacks = [metrics_handler]
+            _llm_registry[key] = llm
+            return llm
+
+        http_client, http_async_client = _get_http_clients()
+
+        # 创建ChatOpenAI实例（重试由并发限制层负责）
+        llm = LimitedChatOpenAI(
+            model=model,
+            temperature=temp,
+            streaming=streaming,
+            max_tokens=max_tokens,
+            api_key=settings.OPENAI_API_KEY,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0,
+            # 记录每次调用的耗时和token用量
+            callbacks=[metrics_handler]
+        )
+        _llm_registry[key] = llm
+
+    return llm
+
+
+def get_specialized_llm(temperature: float = 0.0, model_name: Optional[str] = None) -> ChatOpenAI:
+    """获取用于分类、评估等辅助任务的非流式LLM实例"""
+    return get_chat_llm_instance(model_name=model_name, temperature=temperature)
+
+
+# 相同调用的合并层，可选短时结果缓存
+_single_flight = SingleFlight(
+    result_ttl=settings.LLM_RESULT_CACHE_TTL,
+    max_entries=settings.LLM_RESULT_CACHE_MAX_ENTRIES
+)
+
+
+def _call_key(llm: Any, prompt: Union[str, List[BaseMessage]]) -> str:
+    """由模型的全部参数（模型名、温度等）和提示内容计算合并键"""
+    if isinstance(prompt, str):
+        text = prompt
+    else:
+        text = json.dumps([(message.type, message.content) for message in prompt], ensure_ascii=False)
+    payload = "\x00".join([type(llm).__name__, llm._get_llm_string(), text])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def ainvoke_shared(llm: Any, prompt: Union[str, List[BaseMessage]]) -> BaseMessage:
+    """
+    异步调用模型，相同 (模型, 参数, 提示) 的并发调用共享同一次上游请求
+
+    适用于与用户无关、可以共享结果的辅助调用（分类、风险评估、提案分析）。
+    返回的消息对象由所有调用方共享，不要修改。
+    """
+    if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+        return await llm.ainvoke(prompt)
+    return await _single_flight.do(_call_key(llm, prompt), lambda: llm.ainvoke(prompt))
+
+
+def invoke_shared(llm: Any, prompt: Union[str, List[BaseMessage]]) -> BaseMessage:
+    """ainvoke_shared 的同步版本，在工具线程中调用"""
+    if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+        return llm.invoke(prompt)
+    return _single_flight.do_sync(_call_key(llm, prompt), lambda: llm.invoke(prompt))
+
+
+def _pool_snapshot(client: Optional[Any]) -> Dict[str, int]:
+    """读取httpx底层连接池的连接数（依赖httpcore内部结构，读取失败时返回空）"""
+    try:
+        connections = client._transport._pool.connections
+    except AttributeError:
+        return {}
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle
+    }
+
+
+def get_llm_limiter_stats() -> Optional[Dict[str, Any]]:
+    """返回上游调用并发限制的状态（当前限制、在途数、排队数等），关闭时为 None"""
+    return llm_limiter.stats() if llm_limiter else None
+
+
+def get_llm_pool_stats() -> Dict[str, Any]:
+    """返回客户端注册表和HTTP连接池的使用情况"""
+    with _registry_lock:
+        lookups = _registry_stats["hits"] + _registry_stats["misses"]
+        stats = {
+            "clients": len(_llm_registry),
+            "registry_hits": _registry_stats["hits"],
+            "registry_misses": _registry_stats["misses"],
+            "registry_hit_rate": _registry_stats["hits"] / lookups if lookups else 0.0,
+        }
+
+    max_connections = settings.LLM_POOL_MAX_CONNECTIONS
+    sync_pool = _pool_snapshot(_http_client)
+    async_pool = _pool_snapshot(_http_async_client)
+    active = sync_pool.get("active", 0) + async_pool.get("active", 0)
+    stats["http"] = {
+        "requests": _http_stats["requests"],
+        "max_connections": max_connections,
+        "sync_pool": sync_pool,
+        "async_pool": async_pool,
+        "utilization": active / max_connections if max_connections else 0.0
+    }
+    stats["single_flight"] = _single_flight.stats()
+    if llm_limiter is not None:
+        stats["limiter"] = llm_limiter.stats()
+    return stats
+
+
+async def close_llm_clients() -> None:
+    """关闭共享的HTTP连接池（应用关闭时调用）"""
+    global _http_client, _http_async_client
+    with _registry_lock:
+        _llm_registry.clear()
+        http_client, http_async_client = _http_client, _http_async_client
+        _http_client = _http_async_client = None
+    if http_client is not None:
+        http_client.close()
+    if http_async_client is not None:
+        await http_async_client.aclose()
+
+
+if settings.LLM_FACTORY:
+    set_llm_factory(_load_factory(settings.LLM_FACTORY))
@@ -0,0 +1,202 @@
+"""请求内分阶段计时和 Prometheus 指标"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+# 各阶段耗时：history_load（读取历史）、llm（每次模型调用）、tool（每次工具调用）、persist（保存消息）
+STAGE_LATENCY = Histogram(
+    "agent_stage_duration_seconds",
+    "Duration of each processing stage",
+    ["stage", "name"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUEST_LATENCY = Histogram(
+    "agent_request_duration_seconds",
+    "End-to-end duration of chat requests",
+    ["endpoint"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+# type: prompt、completion，以及 cached（prompt 中命中服务端提示缓存的部分）
+LLM_TOKENS = Counter(
+    "agent_llm_tokens_total",
+    "Tokens consumed by LLM calls",
+    ["model", "type"]
+)
+
+# 当前请求的计时记录，未开启时为 None
+_request_spans: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("request_spans", default=None)
+
+
+def _record(stage: str, name: str, duration: float) -> None:
+    STAGE_LATENCY.labels(stage, name).observe(duration)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append({"stage": stage, "name": name, "ms": round(duration * 1000, 2)})
+
+
+@contextmanager
+def span(stage: str, name: str = "") -> Iterator[None]:
+    """记录一段代码的耗时，同时计入直方图和当前请求的计时记录"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, name, time.perf_counter() - start)
+
+
+@contextmanager
+def request_timer(endpoint: str) -> Iterator[List[Dict[str, Any]]]:
+    """为一次请求开启计时记录，返回的列表收集本次请求内的所有阶段耗时"""
+    spans: List[Dict[str, Any]] = []
+    token = _request_spans.set(spans)
+    start = time.perf_counter()
+    try:
+        yield spans
+    finally:
+        REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+        _request_spans.reset(token)
+
+
+def summarize_spans(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按阶段汇总耗时，用于响应的 details"""
+    totals: Dict[str, float] = {}
+    for item in spans:
+        totals[item["stage"]] = round(totals.get(item["stage"], 0.0) + item["ms"], 2)
+    return {"totals_ms": totals, "spans": list(spans)}
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """LangChain 回调：记录每次模型调用、工具调用的耗时和 token 用量"""
+
+    # 同步执行，保证与调用方处于同一上下文，记录能进入当前请求
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[UUID, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage: str, name: str) -> None:
+        with self._lock:
+            self._starts[run_id] = (stage, name, time.perf_counter())
+
+    def _end(self, run_id: UUID) -> Optional[str]:
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is None:
+            return None
+        stage, name, start = started
+        _record(stage, name, time.perf_counter() - start)
+        return name
+
+    @staticmethod
+    def _model_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+        params = kwargs.get("invocation_params") or {}
+        return params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "unknown"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        model = self._end(run_id) or "unknown"
+        prompt_tokens, completion_tokens, cached_tokens = _token_usage(response)
+        if prompt_tokens:
+            LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+        if cached_tokens:
+            LLM_TOKENS.labels(model, "cached").inc(cached_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "tool", (serialized or {}).get("name") or "unknown")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+
+def _token_usage(response: LLMResult) -> tuple:
+    """从模型返回中取出 (prompt tokens, completion tokens, 命中缓存的 prompt tokens)"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        details = usage.get("prompt_tokens_details") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), details.get("cached_tokens") or 0
+
+    # 流式输出没有 llm_output，用消息上的 usage_metadata
+    prompt_tokens = completion_tokens = cached_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += metadata.get("input_tokens", 0)
+            completion_tokens += metadata.get("output_tokens", 0)
+            cached_tokens += (metadata.get("input_token_details") or {}).get("cache_read") or 0
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+def token_totals() -> Dict[str, Dict[str, float]]:
+    """按模型汇总进程启动以来的 token 计数，如 {"gpt-4o": {"prompt": ..., "cached": ...}}"""
+    totals: Dict[str, Dict[str, float]] = {}
+    for metric in LLM_TOKENS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                model_totals = totals.setdefault(sample.labels["model"], {})
+                model_totals[sample.labels["type"]] = sample.value
+    return totals
+
+
+metrics_handler = MetricsCallbackHandler()
+
+
+class _StatsCollector:
+    """在抓取时把已有的统计字典（缓存、连接池、路由等）导出为 gauge"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Optional[Dict[str, Any]]]] = {}
+
+    def register(self, source: str, func: Callable[[], Optional[Dict[str, Any]]]) -> None:
+        self._sources[source] = func
+
+    def collect(self):
+        gauge = GaugeMetricFamily("agent_service_stat", "Internal statistics", labels=["source", "key"])
+        for source, func in list(self._sources.items()):
+            try:
+                stats = func()
+            except Exception:
+                continue
+            for key, value in _flatten(stats or {}):
+                gauge.add_metric([source, key], value)
+        yield gauge
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = ""):
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, float(value)
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_stats(source: str, func: Callable[[], Optional[Dict[str, Any]]]) -> None:
+    """注册一个统计来源，/metrics 抓取时调用并导出其中的数值"""
+    _stats_collector.register(source, func)
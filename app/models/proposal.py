@@ -1,19 +1,34 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import sqlite3
+import threading
 import uuid
 
+
+VOTE_OPTIONS = ("support", "oppose")
+
+
 class Proposal:
-    """提案管理类"""
+    """提案管理类
+
+    由 ProposalManager 创建或读取的提案绑定到管理器，投票、评论和关闭操作
+    直接写入持久化存储；单独创建的提案只在内存中修改。
+    """
     def __init__(self, title: str, description: str, proposal_id: Optional[str] = None):
         self.proposal_id = proposal_id or str(uuid.uuid4())
         self.title = title
         self.description = description
         self.votes = {"support": 0, "oppose": 0}
-        self.voters = set()  # 记录已投票用户
+        # 已投票用户；绑定管理器的提案为 None，投票记录在数据库中，用 has_voted 查询
+        self.voters: Optional[set] = set()
         self.created_at = datetime.now().isoformat()
         self.status = "active"  # active, closed
         self.comments = []
-    
+        self._manager: Optional["ProposalManager"] = None
+        # 保证去重和计数是一个原子操作
+        self._lock = threading.Lock()
+
     def add_vote(self, voter_id: str, vote: str) -> bool:
         """添加投票
         
@@ -21,46 +36,79 @@ class Proposal:
             voter_id: 投票者ID
             vote: 投票选择 ('support' 或 'oppose')
         """
-        if self.status != "active":
-            return False
-            
-        if voter_id in self.voters:
-            return False
-            
-        if vote not in ["support", "oppose"]:
-            return False
-            
-        self.votes[vote] += 1
-        self.voters.add(voter_id)
-        return True
-    
+        return self.add_votes([(voter_id, vote)])[0]
+
+    def add_votes(self, ballots: List[Tuple[str, str]]) -> List[bool]:
+        """批量投票，返回每张选票是否被计入
+
+        Args:
+            ballots: (投票者ID, 投票选择) 列表
+        """
+        if self._manager is not None:
+            results = self._manager.add_votes(self.proposal_id, ballots)
+            with self._lock:
+                for (_, vote), accepted in zip(ballots, results):
+                    if accepted:
+                        self.votes[vote] += 1
+            return results
+
+        results = []
+        with self._lock:
+            for voter_id, vote in ballots:
+                accepted = (
+                    self.status == "active"
+                    and vote in VOTE_OPTIONS
+                    and voter_id not in self.voters
+                )
+                if accepted:
+                    self.voters.add(voter_id)
+                    self.votes[vote] += 1
+                results.append(accepted)
+        return results
+
+    def has_voted(self, voter_id: str) -> bool:
+        """检查用户是否已对本提案投票"""
+        if self._manager is not None:
+            return self._manager.has_voted(self.proposal_id, voter_id)
+        with self._lock:
+            return voter_id in self.voters
+
     def add_comment(self, voter_id: str, comment: str) -> bool:
         """添加评论"""
         if self.status != "active":
             return False
-            
-        self.comments.append({
+
+        entry = {
             "voter_id": voter_id,
             "comment": comment,
             "timestamp": datetime.now().isoformat()
-        })
+        }
+        if self._manager is not None and not self._manager.add_comment(self.proposal_id, entry):
+            return False
+
+        self.comments.append(entry)
         return True
-    
+
     def close_proposal(self):
         """关闭提案"""
-        self.status = "closed"
-    
+        if self._manager is not None:
+            self._manager.close_proposal(self.proposal_id)
+        with self._lock:
+            self.status = "closed"
+
     def get_results(self) -> Dict:
         """获取投票结果"""
-        total = sum(self.votes.values())
-        support_percentage = (self.votes["support"] / total * 100) if total > 0 else 0
-        oppose_percentage = (self.votes["oppose"] / total * 100) if total > 0 else 0
-        
+        with self._lock:
+            votes = dict(self.votes)
+        total = sum(votes.values())
+        support_percentage = (votes["support"] / total * 100) if total > 0 else 0
+        oppose_percentage = (votes["oppose"] / total * 100) if total > 0 else 0
+
         return {
             "proposal_id": self.proposal_id,
             "title": self.title,
             "description": self.description,
-            "votes": self.votes,
+            "votes": votes,
             "total_votes": total,
             "support_percentage": support_percentage,
             "oppose_percentage": oppose_percentage,
@@ -69,39 +117,247 @@ class Proposal:
         }
 
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS proposals (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    proposal_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    support INTEGER NOT NULL DEFAULT 0,
+    oppose INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_proposals_status_seq ON proposals (status, seq);
+CREATE INDEX IF NOT EXISTS idx_proposals_created_at ON proposals (created_at);
+CREATE TABLE IF NOT EXISTS voters (
+    id INTEGER PRIMARY KEY,
+    voter_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS proposal_ballots (
+    proposal_seq INTEGER NOT NULL,
+    voter INTEGER NOT NULL,
+    vote INTEGER NOT NULL,
+    PRIMARY KEY (proposal_seq, voter)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS proposal_comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    proposal_seq INTEGER NOT NULL,
+    voter_id TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_proposal_comments_proposal ON proposal_comments (proposal_seq, id);
+"""
+
+_SELECT_PROPOSAL = (
+    "SELECT seq, proposal_id, title, description, status, created_at, support, oppose "
+    "FROM proposals WHERE proposal_id = ?"
+)
+_SELECT_COMMENTS = (
+    "SELECT voter_id, comment, timestamp FROM proposal_comments "
+    "WHERE proposal_seq = ? ORDER BY id"
+)
+
+# 投票时同时检查提案状态，检查和写入在同一条语句中完成
+_INSERT_BALLOT = (
+    "INSERT OR IGNORE INTO proposal_ballots (proposal_seq, voter, vote) "
+    "SELECT seq, ?, ? FROM proposals WHERE seq = ? AND status = 'active'"
+)
+
+
 class ProposalManager:
-    """提案管理器"""
-    def __init__(self):
-        self.proposals = {}
-    
+    """提案管理器
+
+    提案保存在SQLite中（db_path 为 ":memory:" 时只在进程内）。按 (status, seq) 和
+    created_at 建立二级索引，列表按创建顺序用游标分页，每页的代价与页大小相关，
+    与提案总数无关；投票总数随投票在同一事务中增量更新，列表时不再重新统计。
+    """
+
+    # 分页列表每页的最大条数
+    MAX_PAGE_SIZE = 1000
+
+    def __init__(self, db_path: str = ":memory:"):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        # 提案操作都是短事务，共用一个连接并串行执行
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if db_path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def _bind(self, row: tuple) -> Proposal:
+        seq, proposal_id, title, description, status, created_at, support, oppose = row
+        proposal = Proposal(title, description, proposal_id)
+        proposal.created_at = created_at
+        proposal.status = status
+        proposal.votes = {"support": support, "oppose": oppose}
+        proposal.comments = [
+            {"voter_id": voter_id, "comment": comment, "timestamp": timestamp}
+            for voter_id, comment, timestamp in self._conn.execute(_SELECT_COMMENTS, (seq,))
+        ]
+        proposal.voters = None
+        proposal._manager = self
+        return proposal
+
     def create_proposal(self, title: str, description: str) -> Proposal:
         """创建新提案"""
         proposal = Proposal(title, description)
-        self.proposals[proposal.proposal_id] = proposal
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO proposals (proposal_id, title, description, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (proposal.proposal_id, title, description, proposal.status, proposal.created_at)
+            )
+        proposal.voters = None
+        proposal._manager = self
         return proposal
-    
+
     def get_proposal(self, proposal_id: str) -> Optional[Proposal]:
         """获取指定提案"""
-        return self.proposals.get(proposal_id)
-    
+        with self._lock:
+            row = self._conn.execute(_SELECT_PROPOSAL, (proposal_id,)).fetchone()
+            return self._bind(row) if row else None
+
+    def add_vote(self, proposal_id: str, voter_id: str, vote: str) -> bool:
+        """投票：记录投票者并在同一事务中更新该选项的计数
+
+        提案不存在、已关闭、选项无效或该用户已投过票时返回 False
+        """
+        return self.add_votes(proposal_id, [(voter_id, vote)])[0]
+
+    def add_votes(self, proposal_id: str, ballots: List[Tuple[str, str]]) -> List[bool]:
+        """批量投票，所有选票在一个事务中写入，返回每张选票是否被计入
+
+        去重依赖 (提案, 投票者) 主键，状态检查和写入在同一条 INSERT 中完成，
+        多个线程或进程同时投票时每个投票者也只会被计一次。
+        """
+        results = [False] * len(ballots)
+        increments = {option: 0 for option in VOTE_OPTIONS}
+
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT seq, status FROM proposals WHERE proposal_id = ?", (proposal_id,)
+            ).fetchone()
+            # 已关闭的提案不再接受投票，也不为投票者写入 voters 表
+            if row is None or row[1] != "active":
+                return results
+            seq = row[0]
+
+            for i, (voter_id, vote) in enumerate(ballots):
+                if vote not in VOTE_OPTIONS:
+                    continue
+                inserted = self._conn.execute(
+                    _INSERT_BALLOT, (self._intern_voter(voter_id), VOTE_OPTIONS.index(vote), seq)
+                ).rowcount
+                if inserted:
+                    results[i] = True
+                    increments[vote] += 1
+
+            if any(increments.values()):
+                self._conn.execute(
+                    "UPDATE proposals SET support = support + ?, oppose = oppose + ? WHERE seq = ?",
+                    (increments["support"], increments["oppose"], seq)
+                )
+        return results
+
+    def _intern_voter(self, voter_id: str) -> int:
+        """返回投票者在 voters 表中的整数编号（调用方需持有锁并处于事务中）"""
+        self._conn.execute("INSERT OR IGNORE INTO voters (voter_id) VALUES (?)", (voter_id,))
+        return self._conn.execute("SELECT id FROM voters WHERE voter_id = ?", (voter_id,)).fetchone()[0]
+
+    def has_voted(self, proposal_id: str, voter_id: str) -> bool:
+        """检查用户是否已对提案投票"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM proposal_ballots "
+                "JOIN proposals ON proposals.seq = proposal_ballots.proposal_seq "
+                "JOIN voters ON voters.id = proposal_ballots.voter "
+                "WHERE proposals.proposal_id = ? AND voters.voter_id = ?",
+                (proposal_id, voter_id)
+            ).fetchone() is not None
+
+    def add_comment(self, proposal_id: str, entry: Dict[str, str]) -> bool:
+        """保存评论，提案不存在或已关闭时返回 False"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT seq FROM proposals WHERE proposal_id = ? AND status = 'active'",
+                (proposal_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            self._conn.execute(
+                "INSERT INTO proposal_comments (proposal_seq, voter_id, comment, timestamp) "
+                "VALUES (?, ?, ?, ?)",
+                (row[0], entry["voter_id"], entry["comment"], entry["timestamp"])
+            )
+            return True
+
+    def list_proposals_page(self,
+                            status: Optional[str] = None,
+                            limit: int = 20,
+                            cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        按创建顺序分页列出提案
+
+        Args:
+            status: 只列出该状态的提案，None 表示全部
+            limit: 每页数量，限制在 1 到 MAX_PAGE_SIZE 之间
+            cursor: 上一页返回的游标，None 表示从第一页开始
+
+        Returns:
+            (提案摘要列表, 下一页游标)，没有下一页时游标为 None
+        """
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        after = max(cursor or 0, 0)
+        query = (
+            "SELECT seq, proposal_id, title, status, created_at, support + oppose FROM proposals "
+            + ("WHERE status = ? AND seq > ? " if status is not None else "WHERE seq > ? ")
+            + "ORDER BY seq LIMIT ?"
+        )
+        params = (status, after, limit + 1) if status is not None else (after, limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        proposals = [
+            {
+                "proposal_id": proposal_id,
+                "title": title,
+                "status": row_status,
+                "created_at": created_at,
+                "vote_count": vote_count
+            }
+            for _, proposal_id, title, row_status, created_at, vote_count in rows[:limit]
+        ]
+        return proposals, next_cursor
+
     def list_proposals(self, status: Optional[str] = None) -> List[Dict]:
         """列出所有提案"""
         proposals = []
-        for p_id, proposal in self.proposals.items():
-            if status is None or proposal.status == status:
-                proposals.append({
-                    "proposal_id": p_id,
-                    "title": proposal.title,
-                    "status": proposal.status,
-                    "created_at": proposal.created_at,
-                    "vote_count": sum(proposal.votes.values())
-                })
-        return proposals
-    
+        cursor = None
+        while True:
+            page, cursor = self.list_proposals_page(status, limit=self.MAX_PAGE_SIZE, cursor=cursor)
+            proposals.extend(page)
+            if cursor is None:
+                return proposals
+
     def close_proposal(self, proposal_id: str) -> bool:
         """关闭提案"""
-        proposal = self.get_proposal(proposal_id)
-        if proposal:
-            proposal.close_proposal()
-            return True
-        return False
\ No newline at end of file
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE proposals SET status = 'closed' WHERE proposal_id = ?",
+                (proposal_id,)
+            ).rowcount > 0
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -1,4 +1,5 @@
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
 
 # 系统提示
 COUNSELOR_SYSTEM_PROMPT = """你是一位专业的心理咨询师，同时也是社区的重要参与者，具有双重角色。
@@ -50,18 +51,27 @@ COUNSELOR_SYSTEM_PROMPT = """你是一位专业的心理咨询师，同时也是
 始终保持温暖、专业、非判断的态度。记住你的目标是支持用户的心理健康旅程。
 """
 
+# 系统提示作为现成的消息放在最前面，不再逐次格式化，每次请求的前缀逐字节相同，
+# 便于模型服务端的提示缓存命中；会变化的历史和用户输入都放在它之后
+COUNSELOR_SYSTEM_MESSAGE = SystemMessage(content=COUNSELOR_SYSTEM_PROMPT)
+
 # 聊天提示模板
 COUNSELOR_CHAT_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", COUNSELOR_SYSTEM_PROMPT),
+    COUNSELOR_SYSTEM_MESSAGE,
     MessagesPlaceholder(variable_name="chat_history"),
     ("human", "{input}"),
     MessagesPlaceholder(variable_name="agent_scratchpad"),
 ])
 
-# 风险评估提示
-RISK_ASSESSMENT_PROMPT = """评估以下用户消息是否包含任何心理健康危机信号:
+# 不带工具的单轮咨询提示（路由判定为明确的心理咨询消息时使用）
+COUNSELOR_DIRECT_PROMPT = ChatPromptTemplate.from_messages([
+    COUNSELOR_SYSTEM_MESSAGE,
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+])
 
-用户消息: {message}
+# 风险评估提示（固定的说明在前，用户消息在最后，保持前缀不变）
+RISK_ASSESSMENT_PROMPT = """评估下面的用户消息是否包含任何心理健康危机信号。
 
 按以下类别评估风险等级(无风险/低风险/中风险/高风险):
 1. 自伤或自杀想法
@@ -72,4 +82,30 @@ RISK_ASSESSMENT_PROMPT = """评估以下用户消息是否包含任何心理健
 6. 物质滥用问题
 
 仅返回JSON格式的风险评估结果，不要添加其他解释。
-"""
\ No newline at end of file
+
+用户消息: {message}
+"""
+
+RISK_ASSESSMENT_TEMPLATE = PromptTemplate.from_template(RISK_ASSESSMENT_PROMPT)
+
+# 预先风险评估判定为高风险时替换模型回答的危机支持回复（不经过模型，内容固定）
+CRISIS_RESPONSE_TEMPLATE = """听到你现在这么难受，我很担心你的安全。你不需要一个人扛着这些，现在就可以联系专业的危机支持：
+
+{crisis_lines}
+
+如果你已经有伤害自己或他人的打算，或者身处危险之中，请立即拨打急救电话 120 或报警电话 110，或者请身边信任的人陪着你。
+
+我会一直在这里听你说。愿意的话，可以告诉我你现在在哪里、身边有没有人可以陪着你？"""
+
+# 历史摘要提示
+HISTORY_SUMMARY_PROMPT = """请把下面的心理咨询对话整理成简洁的摘要，供后续对话参考。
+保留用户的主要困扰、情绪变化、已提到的风险信号、已给出的建议以及尚未解决的问题，不要添加对话中没有的信息。
+
+已有摘要:
+{previous_summary}
+
+新增对话:
+{conversation}
+
+更新后的摘要:
+"""
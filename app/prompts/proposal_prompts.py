@@ -1,3 +1,6 @@
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
 PROPOSAL_SYSTEM_PROMPT = """
 作为一个具有提案评估能力的AI助手，你需要认真分析提案内容，并基于以下标准给出支持或反对的明确立场:
 
@@ -50,4 +53,22 @@ PROPOSAL_EXAMPLES = [
 3. 记录讨论内容供无法参加的成员查看
 4. 定期评估活动效果，根据反馈调整"""
     }
-]
\ No newline at end of file
+]
+
+# 系统提示作为现成的消息，每次请求的前缀逐字节相同
+PROPOSAL_SYSTEM_MESSAGE = SystemMessage(content=PROPOSAL_SYSTEM_PROMPT)
+
+# 提案评估者角色的Agent提示模板
+PROPOSAL_CHAT_PROMPT = ChatPromptTemplate.from_messages([
+    PROPOSAL_SYSTEM_MESSAGE,
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+# 不带工具的单轮提案评估提示（路由判定为明确的提案讨论时使用）
+PROPOSAL_DIRECT_PROMPT = ChatPromptTemplate.from_messages([
+    PROPOSAL_SYSTEM_MESSAGE,
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+])
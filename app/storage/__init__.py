@@ -0,0 +1,50 @@
+"""会话存储后端"""
+
+from app.storage.base import ConversationStore
+from app.storage.json_store import JsonFileStore
+from app.storage.journal_store import JournalStore
+from app.storage.sqlite_store import SQLiteStore, migrate_json_conversations
+from app.config import settings
+
+
+def create_store(backend: str = None, storage_dir: str = None) -> ConversationStore:
+    """
+    根据配置创建会话存储后端
+
+    Args:
+        backend: 后端类型 'json'、'journal' 或 'sqlite'，不指定则使用配置
+        storage_dir: 存储目录，不指定则使用配置（sqlite 后端使用 CONVERSATION_DB_PATH）
+
+    Returns:
+        存储后端实例
+    """
+    backend = (backend or settings.CONVERSATION_STORE).lower()
+    storage_dir = storage_dir or settings.CONVERSATION_DIR
+
+    if backend == "json":
+        return JsonFileStore(storage_dir)
+    if backend == "journal":
+        return JournalStore(
+            storage_dir,
+            fsync=settings.JOURNAL_FSYNC,
+            compact_threshold=settings.JOURNAL_COMPACT_THRESHOLD,
+            compact_interval=settings.JOURNAL_COMPACT_INTERVAL
+        )
+    if backend == "sqlite":
+        return SQLiteStore(
+            settings.CONVERSATION_DB_PATH,
+            synchronous=settings.SQLITE_SYNCHRONOUS,
+            commit_interval=settings.SQLITE_COMMIT_INTERVAL,
+            max_batch=settings.SQLITE_MAX_BATCH
+        )
+    raise ValueError(f"Unknown conversation store: {backend}")
+
+
+__all__ = [
+    "ConversationStore",
+    "JsonFileStore",
+    "JournalStore",
+    "SQLiteStore",
+    "create_store",
+    "migrate_json_conversations"
+]
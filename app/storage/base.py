@@ -0,0 +1,42 @@
+from typing import Dict, List, Optional
+
+
+class ConversationStore:
+    """会话存储后端的基类
+
+    ConversationMemory 负责内存中的会话列表，存储后端只负责持久化。
+    子类需要实现 load 和 append。
+    """
+
+    # append 是否需要完整的会话列表（整体重写型后端为 True）
+    rewrites_history = False
+
+    def load(self, conversation_id: str) -> Optional[List[Dict]]:
+        """加载会话的全部消息，会话不存在时返回 None"""
+        raise NotImplementedError
+
+    def append(self, conversation_id: str, messages: List[Dict], history: List[Dict]) -> None:
+        """持久化新增的消息
+
+        Args:
+            conversation_id: 会话ID
+            messages: 本次新增的消息
+            history: 追加之后完整的会话消息列表（整体重写型后端使用）
+        """
+        raise NotImplementedError
+
+    def count(self, conversation_id: str) -> Optional[int]:
+        """返回已持久化的消息条数，用于检查其他进程是否写入过该会话；不支持时返回 None"""
+        return None
+
+    def evict(self, conversation_id: str) -> None:
+        """会话从内存缓存中淘汰且没有待写消息时调用，后端可以释放为该会话保存的状态"""
+        pass
+
+    def list_conversations(self) -> List[str]:
+        """列出所有已持久化的会话ID"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """释放后端占用的资源"""
+        pass
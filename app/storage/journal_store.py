@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+from app.storage.base import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+
+class JournalStore(ConversationStore):
+    """追加写日志（JSONL）存储后端
+
+    每个会话由两个文件组成:
+    - <id>.json:  快照，格式与 JsonFileStore 相同（兼容旧数据）
+    - <id>.jsonl: 日志，每条新消息追加一行
+
+    追加消息只写一行日志，写入量与消息大小成正比，而不是与会话长度成正比。
+    后台线程定期把日志合并进快照（压缩），不占用请求路径。
+    """
+
+    def __init__(self,
+                 storage_dir: str = "./data/conversations",
+                 fsync: bool = False,
+                 compact_threshold: int = 200,
+                 compact_interval: float = 60.0,
+                 lock_stripes: int = 64):
+        """
+        Args:
+            storage_dir: 存储目录
+            fsync: 每次追加后是否调用 os.fsync，保证掉电不丢数据
+            compact_threshold: 日志行数超过该值时安排压缩
+            compact_interval: 后台压缩线程的检查间隔（秒），0 表示不启动后台线程
+            lock_stripes: 会话锁的数量，会话ID按哈希分到这些锁上
+        """
+        self.storage_dir = storage_dir
+        self.fsync = fsync
+        self.compact_threshold = compact_threshold
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+        # 锁的数量固定，不随会话数增长；不同会话可能共用一把锁，只影响并发度
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._locks_guard = threading.Lock()
+        # 内存中的会话当前日志中的行数，会话被淘汰（evict）时移除
+        self._journal_lines: Dict[str, int] = {}
+        self._compact_candidates = set()
+
+        self._stop_event = threading.Event()
+        self._compactor = None
+        if compact_interval > 0:
+            self._compactor = threading.Thread(
+                target=self._compact_loop,
+                args=(compact_interval,),
+                name="journal-compactor",
+                daemon=True
+            )
+            self._compactor.start()
+
+    def _snapshot_path(self, conversation_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{conversation_id}.json")
+
+    def _journal_path(self, conversation_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{conversation_id}.jsonl")
+
+    def _lock_for(self, conversation_id: str) -> threading.Lock:
+        return self._locks[zlib.crc32(conversation_id.encode("utf-8")) % len(self._locks)]
+
+    def _read_snapshot(self, conversation_id: str) -> Optional[List[Dict]]:
+        file_path = self._snapshot_path(conversation_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _read_journal(self, conversation_id: str) -> Optional[List[Dict]]:
+        file_path = self._journal_path(conversation_id)
+        if not os.path.exists(file_path):
+            return None
+
+        entries = []
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下写了一半的最后一行，忽略即可
+                    logger.warning(f"Skipping torn journal line in {file_path}")
+        return entries
+
+    def _read_locked(self, conversation_id: str) -> Optional[List[Dict]]:
+        snapshot = self._read_snapshot(conversation_id)
+        journal = self._read_journal(conversation_id)
+        if snapshot is None and journal is None:
+            return None
+
+        snapshot = snapshot or []
+        journal = journal or []
+
+        # 压缩在替换快照之后、清空日志之前中断时，日志内容已经在快照末尾
+        if journal and len(journal) <= len(snapshot) and snapshot[-len(journal):] == journal:
+            journal = []
+            self._truncate_journal(conversation_id)
+
+        self._journal_lines[conversation_id] = len(journal)
+        return snapshot + journal
+
+    def _truncate_journal(self, conversation_id: str) -> None:
+        with open(self._journal_path(conversation_id), 'w', encoding='utf-8'):
+            pass
+
+    def load(self, conversation_id: str) -> Optional[List[Dict]]:
+        with self._lock_for(conversation_id):
+            return self._read_locked(conversation_id)
+
+    def append(self, conversation_id: str, messages: List[Dict], history: List[Dict]) -> None:
+        lines = "".join(
+            json.dumps(message, ensure_ascii=False) + "\n" for message in messages
+        )
+        with self._lock_for(conversation_id):
+            with open(self._journal_path(conversation_id), 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+            count = self._journal_lines.get(conversation_id, 0) + len(messages)
+            self._journal_lines[conversation_id] = count
+            if count >= self.compact_threshold:
+                with self._locks_guard:
+                    self._compact_candidates.add(conversation_id)
+
+    def compact(self, conversation_id: str) -> None:
+        """把日志合并进快照并清空日志"""
+        with self._lock_for(conversation_id):
+            journal = self._read_journal(conversation_id)
+            if not journal:
+                self._journal_lines.pop(conversation_id, None)
+                return
+
+            messages = self._read_locked(conversation_id) or []
+            snapshot_path = self._snapshot_path(conversation_id)
+            tmp_path = snapshot_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(messages, f, ensure_ascii=False)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, snapshot_path)
+
+            self._truncate_journal(conversation_id)
+            self._journal_lines.pop(conversation_id, None)
+
+    def evict(self, conversation_id: str) -> None:
+        """会话离开内存后不再记录它的日志行数，下次加载时从日志文件重新统计"""
+        with self._lock_for(conversation_id):
+            self._journal_lines.pop(conversation_id, None)
+
+    def compact_pending(self) -> int:
+        """压缩所有超过阈值的会话，返回压缩的会话数"""
+        with self._locks_guard:
+            candidates = list(self._compact_candidates)
+            self._compact_candidates.clear()
+
+        for conversation_id in candidates:
+            try:
+                self.compact(conversation_id)
+            except Exception as e:
+                logger.error(f"Failed to compact conversation {conversation_id}: {str(e)}")
+        return len(candidates)
+
+    def _compact_loop(self, interval: float) -> None:
+        while not self._stop_event.wait(interval):
+            self.compact_pending()
+
+    def list_conversations(self) -> List[str]:
+        ids = set()
+        for name in os.listdir(self.storage_dir):
+            if name.endswith(".json"):
+                ids.add(name[:-len(".json")])
+            elif name.endswith(".jsonl"):
+                ids.add(name[:-len(".jsonl")])
+        return sorted(ids)
+
+    def close(self) -> None:
+        self._stop_event.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        self.compact_pending()
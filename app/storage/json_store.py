@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+from app.storage.base import ConversationStore
+
+
+class JsonFileStore(ConversationStore):
+    """每个会话一个JSON文件，每次追加都重写整个文件"""
+
+    rewrites_history = True
+
+    def __init__(self, storage_dir: str = "./data/conversations"):
+        self.storage_dir = storage_dir
+        # 确保存储目录存在
+        os.makedirs(self.storage_dir, exist_ok=True)
+
+    def _path(self, conversation_id: str) -> str:
+        return os.path.join(self.storage_dir, f"{conversation_id}.json")
+
+    def load(self, conversation_id: str) -> Optional[List[Dict]]:
+        file_path = self._path(conversation_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def append(self, conversation_id: str, messages: List[Dict], history: List[Dict]) -> None:
+        # 先写临时文件再替换，并发的 load 不会读到写了一半的文件；
+        # 临时文件名唯一，其他进程同时写同一会话时互不覆盖
+        file_path = self._path(conversation_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.storage_dir, prefix=f"{conversation_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(history, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def list_conversations(self) -> List[str]:
+        return [
+            name[:-len(".json")]
+            for name in os.listdir(self.storage_dir)
+            if name.endswith(".json")
+        ]
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from typing import Dict, List, Optional
+
+from app.storage.base import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    extra TEXT
+);
+-- 会话内按插入顺序（id）读取；时间戳由各进程的时钟生成，不能用来排序
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id
+    ON messages (conversation_id, id);
+DROP INDEX IF EXISTS idx_messages_conversation_timestamp;
+"""
+
+# 固定的SQL文本，sqlite3 会按文本缓存预编译语句
+_SELECT_MESSAGES = (
+    "SELECT role, content, timestamp, extra FROM messages "
+    "WHERE conversation_id = ? ORDER BY id"
+)
+_INSERT_MESSAGE = (
+    "INSERT INTO messages (conversation_id, role, content, timestamp, extra) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+_EXISTS_CONVERSATION = "SELECT 1 FROM messages WHERE conversation_id = ? LIMIT 1"
+_COUNT_MESSAGES = "SELECT COUNT(*) FROM messages WHERE conversation_id = ?"
+_LIST_CONVERSATIONS = "SELECT DISTINCT conversation_id FROM messages"
+
+_BASE_KEYS = ("role", "content", "timestamp")
+
+
+def _to_row(conversation_id: str, message: Dict) -> tuple:
+    extra = {k: v for k, v in message.items() if k not in _BASE_KEYS}
+    return (
+        conversation_id,
+        message.get("role", ""),
+        message.get("content", ""),
+        message.get("timestamp"),
+        json.dumps(extra, ensure_ascii=False) if extra else None
+    )
+
+
+def _from_row(row: tuple) -> Dict:
+    role, content, timestamp, extra = row
+    message = {"role": role, "content": content, "timestamp": timestamp}
+    if extra:
+        message.update(json.loads(extra))
+    return message
+
+
+class _ReaderConnection(sqlite3.Connection):
+    """读连接（子类可以被弱引用，用来跟踪各线程的读连接）"""
+
+
+class _WriteRequest:
+    """提交给写线程的一批消息"""
+
+    __slots__ = ("rows", "done", "error")
+
+    def __init__(self, rows: List[tuple]):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class SQLiteStore(ConversationStore):
+    """基于SQLite（WAL模式）的会话存储后端
+
+    读操作使用每个线程独立的连接（close 时全部关闭）；写操作统一交给一个写线程，
+    写线程把并发请求中的写入合并到同一个事务中提交（group commit），
+    append 在所在事务提交后才返回。
+    """
+
+    def __init__(self,
+                 db_path: str = "./data/conversations.sqlite3",
+                 synchronous: str = "NORMAL",
+                 commit_interval: float = 0.002,
+                 max_batch: int = 256):
+        """
+        Args:
+            db_path: 数据库文件路径
+            synchronous: PRAGMA synchronous 取值（OFF/NORMAL/FULL）
+            commit_interval: 写线程收到第一条写入后等待更多写入的时间（秒）
+            max_batch: 单个事务最多合并的写请求数
+        """
+        self.db_path = db_path
+        self.synchronous = synchronous
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        # 建表并切换到WAL模式（WAL设置持久保存在数据库文件中）
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        conn.close()
+
+        self._local = threading.local()
+        # 所有线程的读连接；线程结束后它的连接随 threading.local 一起释放，自动从集合中移除
+        self._readers: "weakref.WeakSet[_ReaderConnection]" = weakref.WeakSet()
+        self._readers_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[_WriteRequest]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        self._closed = False
+
+        self.commits = 0
+        self.written_rows = 0
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=64, **kwargs)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self._closed:
+                raise RuntimeError("SQLiteStore is closed")
+            # 连接只在创建它的线程中使用，允许 close() 在其他线程中关闭它
+            conn = self._local.conn = self._connect(factory=_ReaderConnection, check_same_thread=False)
+            with self._readers_lock:
+                self._readers.add(conn)
+        return conn
+
+    def load(self, conversation_id: str) -> Optional[List[Dict]]:
+        rows = self._reader().execute(_SELECT_MESSAGES, (conversation_id,)).fetchall()
+        if not rows:
+            return None
+        return [_from_row(row) for row in rows]
+
+    def has_conversation(self, conversation_id: str) -> bool:
+        return self._reader().execute(_EXISTS_CONVERSATION, (conversation_id,)).fetchone() is not None
+
+    def count(self, conversation_id: str) -> Optional[int]:
+        # 走 (conversation_id, id) 索引，只扫描该会话的索引项
+        return self._reader().execute(_COUNT_MESSAGES, (conversation_id,)).fetchone()[0]
+
+    def append(self, conversation_id: str, messages: List[Dict], history: List[Dict]) -> None:
+        if self._closed:
+            raise RuntimeError("SQLiteStore is closed")
+        request = _WriteRequest([_to_row(conversation_id, message) for message in messages])
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+    def import_conversation(self, conversation_id: str, messages: List[Dict]) -> None:
+        """在单个事务中写入整段会话（迁移使用）"""
+        self.append(conversation_id, messages, messages)
+
+    def list_conversations(self) -> List[str]:
+        return [row[0] for row in self._reader().execute(_LIST_CONVERSATIONS)]
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        running = True
+        while running:
+            request = self._queue.get()
+            if request is None:
+                break
+
+            # 收集同一时间窗口内的其他写请求，合并为一个事务
+            batch = [request]
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=self.commit_interval)
+                except queue.Empty:
+                    break
+                if request is None:
+                    running = False
+                    break
+                batch.append(request)
+
+            self._commit_batch(conn, batch)
+        conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[_WriteRequest]) -> None:
+        try:
+            with conn:
+                for request in batch:
+                    conn.executemany(_INSERT_MESSAGE, request.rows)
+            self.commits += 1
+            self.written_rows += sum(len(request.rows) for request in batch)
+        except Exception as e:
+            logger.error(f"SQLite group commit failed: {str(e)}")
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """返回写线程的提交次数和写入行数"""
+        return {"commits": self.commits, "written_rows": self.written_rows}
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        with self._readers_lock:
+            readers = list(self._readers)
+            self._readers.clear()
+        for conn in readers:
+            conn.close()
+        self._local.conn = None
+
+
+def migrate_json_conversations(source_dir: str, store: "SQLiteStore") -> Dict[str, int]:
+    """
+    把 data/conversations 下的JSON（及JSONL日志）会话一次性导入SQLite
+
+    已存在于数据库中的会话会被跳过，因此可以重复执行。
+
+    Args:
+        source_dir: JSON会话文件所在目录
+        store: 目标SQLite存储
+
+    Returns:
+        包含 migrated / skipped / failed / messages 计数的字典
+    """
+    from app.storage.journal_store import JournalStore
+
+    # JournalStore 同时读取 <id>.json 快照和 <id>.jsonl 日志，兼容两种旧格式
+    source = JournalStore(source_dir, compact_interval=0)
+    result = {"migrated": 0, "skipped": 0, "failed": 0, "messages": 0}
+
+    for conversation_id in source.list_conversations():
+        if store.has_conversation(conversation_id):
+            result["skipped"] += 1
+            continue
+        try:
+            messages = source.load(conversation_id) or []
+            if not messages:
+                result["skipped"] += 1
+                continue
+            store.import_conversation(conversation_id, messages)
+            result["migrated"] += 1
+            result["messages"] += len(messages)
+        except Exception as e:
+            logger.error(f"Failed to migrate conversation {conversation_id}: {str(e)}")
+            result["failed"] += 1
+
+    return result
@@ -0,0 +1,26 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import contextvars
+import functools
+
+from app.config import settings
+
+# 同步工具专用的有界线程池，避免阻塞事件循环，也避免占满默认线程池
+_tool_executor = ThreadPoolExecutor(
+    max_workers=settings.TOOL_THREAD_POOL_SIZE,
+    thread_name_prefix="tool"
+)
+
+
+async def run_sync_tool(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在工具线程池中执行同步函数（携带当前的上下文变量，如会话ID）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_tool_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def submit_sync_tool(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """在工具线程池中后台执行同步函数（携带当前的上下文变量），供同步调用方并发执行"""
+    context = contextvars.copy_context()
+    return _tool_executor.submit(functools.partial(context.run, func, *args, **kwargs))
@@ -1,22 +1,20 @@
 from langchain.tools import BaseTool
 from langchain_core.prompts import PromptTemplate
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import json
 
 from app.config import settings
-from app.llm import get_chat_llm_instance
+from app.llm import ainvoke_shared, get_chat_llm_instance, invoke_shared
 from app.models.proposal import ProposalManager
+from app.tools.executor import run_sync_tool
 
 # 全局提案管理器
-proposal_manager = ProposalManager()
+proposal_manager = ProposalManager(settings.PROPOSAL_DB_PATH or ":memory:")
 
-# 提案评估提示
+# 提案评估提示（固定的说明在前，提案内容在最后，保持前缀不变）
 PROPOSAL_ANALYSIS_PROMPT = """
 你需要评估一个社区治理提案，并决定是支持还是反对。保持客观理性，既关注社区利益也关注个人权益。
 
-提案标题: {title}
-提案内容: {description}
-
 请分析这个提案:
 1. 提案的目的和潜在影响
 2. 提案的优点和缺点
@@ -25,9 +23,24 @@ PROPOSAL_ANALYSIS_PROMPT = """
 
 最后，明确给出你的投票决定(支持或反对)并解释理由。
 
+提案标题: {title}
+提案内容: {description}
+
 你的分析:
 """
 
+PROPOSAL_ANALYSIS_TEMPLATE = PromptTemplate.from_template(PROPOSAL_ANALYSIS_PROMPT)
+
+def _optional_int(value: Any) -> Optional[int]:
+    """解析工具参数中的整数，未提供时返回 None，无法解析时抛出 ValueError"""
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except TypeError:
+        raise ValueError(value)
+
+
 class ProposalTool(BaseTool):
     name: str = "proposal_tool"
     description: str = "管理社区治理提案和投票。可用于创建提案、查看提案、进行投票和获取结果。"
@@ -60,17 +73,33 @@ class ProposalTool(BaseTool):
             
         elif action == "list":
             status = kwargs.get("status")
-            
-            proposals = proposal_manager.list_proposals(status)
+            try:
+                limit = _optional_int(kwargs.get("limit"))
+            except ValueError:
+                return f"列出提案失败：limit 必须是整数，收到 {kwargs.get('limit')!r}"
+            try:
+                cursor = _optional_int(kwargs.get("cursor"))
+                if cursor is not None and cursor < 0:
+                    raise ValueError(cursor)
+            except ValueError:
+                return f"列出提案失败：无效的游标 {kwargs.get('cursor')!r}，请使用上一页返回的 cursor"
+            
+            # 每页最多 PROPOSAL_PAGE_SIZE 条，避免一次把大量提案放进上下文
+            page_size = settings.PROPOSAL_PAGE_SIZE
+            limit = page_size if limit is None else max(1, min(limit, page_size))
+            proposals, next_cursor = proposal_manager.list_proposals_page(status, limit=limit, cursor=cursor)
             
             if not proposals:
-                return "当前没有提案"
+                return "没有更多提案" if cursor else "当前没有提案"
             
             proposals_text = "\n\n".join([
                 f"#{p['proposal_id']} - {p['title']} (状态: {p['status']}, 投票数: {p['vote_count']})"
                 for p in proposals
             ])
             
+            if next_cursor is not None:
+                proposals_text += f"\n\n还有更多提案，使用 cursor={next_cursor} 查看下一页"
+            
             return f"提案列表:\n\n{proposals_text}"
             
         elif action == "view":
@@ -127,29 +156,45 @@ class ProposalTool(BaseTool):
             
         elif action == "analyze":
             proposal_id = kwargs.get("proposal_id", "")
+            error, analysis_prompt = self._prepare_analysis(proposal_id)
+            if error:
+                return error
             
-            if not proposal_id:
-                return "分析提案失败：缺少提案ID"
+            # 使用LLM进行分析，同一提案的并发分析共享一次调用
+            llm = get_chat_llm_instance(temperature=0.3)
+            analysis_result = invoke_shared(llm, analysis_prompt)
             
-            proposal = proposal_manager.get_proposal(proposal_id)
-            if not proposal:
-                return f"分析提案失败：找不到ID为 {proposal_id} 的提案"
+            return f"提案 #{proposal_id} 的分析:\n\n{analysis_result.content}"
             
-            # 使用LLM进行分析
-            prompt = PromptTemplate(
-                template=PROPOSAL_ANALYSIS_PROMPT,
-                input_variables=["title", "description"]
-            )
+        else:
+            return f"未知操作：{action}。支持的操作有：create, list, view, vote, analyze。"
+    
+    async def _arun(self, action: str, **kwargs: Any) -> str:
+        """异步运行提案工具：分析操作直接异步调用LLM，其余操作在工具线程池中执行"""
+        if action == "analyze":
+            proposal_id = kwargs.get("proposal_id", "")
+            error, analysis_prompt = await run_sync_tool(self._prepare_analysis, proposal_id)
+            if error:
+                return error
             
             llm = get_chat_llm_instance(temperature=0.3)
-            analysis_prompt = prompt.format(
-                title=proposal.title,
-                description=proposal.description
-            )
-            
-            analysis_result = ""
+            analysis_result = await ainvoke_shared(llm, analysis_prompt)
             
             return f"提案 #{proposal_id} 的分析:\n\n{analysis_result.content}"
-            
-        else:
-            return f"未知操作：{action}。支持的操作有：create, list, view, vote, analyze。"
\ No newline at end of file
+        
+        return await run_sync_tool(self._run, action, **kwargs)
+    
+    def _prepare_analysis(self, proposal_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """构造提案分析提示，返回 (错误信息, 分析提示)"""
+        if not proposal_id:
+            return "分析提案失败：缺少提案ID", None
+        
+        proposal = proposal_manager.get_proposal(proposal_id)
+        if not proposal:
+            return f"分析提案失败：找不到ID为 {proposal_id} 的提案", None
+        
+        analysis_prompt = PROPOSAL_ANALYSIS_TEMPLATE.format(
+            title=proposal.title,
+            description=proposal.description
+        )
+        return None, analysis_prompt
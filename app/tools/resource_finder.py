@@ -1,46 +1,160 @@
 from langchain.tools import BaseTool
 import json
+import logging
 import os
-from typing import Dict, List, Optional  # 添加导入
+import threading
+from typing import Any, Dict, List, Optional, Tuple  # 添加导入
+
+from app.config import settings
+from app.tools.executor import run_sync_tool
+from app.tools.resource_index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_NAMES = {
+    "crisis_lines": "危机热线",
+    "self_help": "自助资源",
+    "professional_services": "专业服务",
+    "apps": "应用程序"
+}
+
+DEFAULT_RESOURCE_PATH = "data/resources/mental_health_resources.json"
+
+# 资源文件不存在或没有危机热线时使用的默认热线
+SAMPLE_CRISIS_LINES = [
+    {
+        "name": "全国心理健康危机热线",
+        "phone": "400-161-9995",
+        "description": "24/7心理健康支持热线"
+    }
+]
+
+
+def load_crisis_lines(resource_path: str = DEFAULT_RESOURCE_PATH) -> List[Dict]:
+    """读取资源文件中的危机热线（不建立检索索引），读取失败或为空时返回默认热线"""
+    try:
+        with open(resource_path, 'r', encoding='utf-8') as f:
+            crisis_lines = json.load(f).get("crisis_lines")
+    except FileNotFoundError:
+        crisis_lines = None
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Failed to load crisis lines from {resource_path}: {str(e)}")
+        crisis_lines = None
+    return crisis_lines or list(SAMPLE_CRISIS_LINES)
 
 class ResourceFinderTool(BaseTool):
     name: str = "resource_finder"  # 添加类型注解
     description: str = "查找适合用户的心理健康资源"  # 添加类型注解
+    resource_path: str = DEFAULT_RESOURCE_PATH
+    resources: Dict[str, List[Dict]] = {}
+    top_k: int = 5
+    index: Any = None
+    # 建立索引时资源文件的 (修改时间, 大小)，变化后重建索引
+    file_signature: Optional[Tuple[int, int]] = None
+    # 最近一次加载失败时资源文件的签名，文件没有再变化时不重复加载
+    failed_signature: Optional[Tuple[int, int]] = None
+    reload_lock: Any = None
+    # 正在后台重建索引的线程，没有重建时为 None
+    reload_thread: Any = None
     
-    def __init__(self, resource_path="data/resources/mental_health_resources.json"):
-        super().__init__()
-        self.resource_path = resource_path
-        self.resources = self._load_resources()
+    def __init__(self, resource_path=DEFAULT_RESOURCE_PATH, top_k: Optional[int] = None):
+        super().__init__(
+            resource_path=resource_path,
+            top_k=settings.RESOURCE_SEARCH_TOP_K if top_k is None else top_k
+        )
+        self.reload_lock = threading.Lock()
+        self._reload()
     
-    def _load_resources(self):
-        """加载资源数据"""
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
         try:
-            if not os.path.exists(self.resource_path):
-                # 创建示例资源
-                self._create_sample_resources()
+            stat = os.stat(self.resource_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _load_resources(self) -> Dict[str, List[Dict]]:
+        """加载资源数据，文件不存在时先创建示例资源；读取或解析失败时抛出异常"""
+        if not os.path.exists(self.resource_path):
+            # 创建示例资源
+            self._create_sample_resources()
+        
+        with open(self.resource_path, 'r', encoding='utf-8') as f:
+            resources = json.load(f)
+        if not isinstance(resources, dict):
+            raise ValueError("resources file must contain a JSON object")
+        return resources
+    
+    def _reload(self) -> None:
+        """加载资源文件并重建倒排索引
+
+        文件无法读取或解析时（例如正在被改写）保留原来的索引，记下这个版本的文件签名，
+        文件再次变化后才重试。
+        """
+        signature = self._file_signature()
+        try:
+            resources = self._load_resources()
+            if signature is None:
+                # 示例资源是在加载时刚创建的
+                signature = self._file_signature()
             
-            with open(self.resource_path, 'r', encoding='utf-8') as f:
-                resources = json.load(f)
-            return resources
+            documents = [
+                (category, item)
+                for category, items in resources.items()
+                for item in items
+            ]
+            # 先建好新索引再整体替换，查询中的线程继续使用旧索引
+            index = BM25Index(documents)
         except Exception as e:
-            print(f"加载资源失败: {str(e)}")
-            return {
-                "crisis_lines": [],
-                "self_help": [],
-                "professional_services": [],
-                "apps": []
-            }
+            logger.error(f"Failed to load resources from {self.resource_path}: {str(e)}")
+            self.failed_signature = signature
+            if self.index is None:
+                # 首次加载就失败时先使用空索引
+                self.index = BM25Index([])
+            return
+        
+        self.index = index
+        self.resources = resources
+        self.file_signature = signature
+        self.failed_signature = None
+        logger.info(f"Indexed {len(documents)} resources from {self.resource_path}")
+    
+    def _is_stale(self) -> bool:
+        """资源文件是否变成了尚未尝试加载过的新版本"""
+        signature = self._file_signature()
+        return signature != self.file_signature and signature != self.failed_signature
+    
+    def _ensure_fresh(self) -> BM25Index:
+        """资源文件在磁盘上变化时在后台线程重建索引，重建完成前查询继续使用旧索引"""
+        if self._is_stale():
+            with self.reload_lock:
+                if self.reload_thread is None and self._is_stale():
+                    self.reload_thread = threading.Thread(
+                        target=self._background_reload,
+                        name="resource-index-reload",
+                        daemon=True
+                    )
+                    self.reload_thread.start()
+        return self.index
+    
+    def _background_reload(self) -> None:
+        try:
+            self._reload()
+        except Exception as e:
+            logger.error(f"Failed to rebuild resource index: {str(e)}")
+        finally:
+            with self.reload_lock:
+                self.reload_thread = None
+    
+    def wait_for_reload(self, timeout: Optional[float] = None) -> None:
+        """等待进行中的后台重建完成"""
+        thread = self.reload_thread
+        if thread is not None:
+            thread.join(timeout)
     
     def _create_sample_resources(self):
         """创建示例资源数据"""
         sample_resources = {
-            "crisis_lines": [
-                {
-                    "name": "全国心理健康危机热线",
-                    "phone": "400-161-9995",
-                    "description": "24/7心理健康支持热线"
-                }
-            ],
+            "crisis_lines": list(SAMPLE_CRISIS_LINES),
             "self_help": [
                 {
                     "name": "正念冥想指南",
@@ -81,36 +195,22 @@ class ResourceFinderTool(BaseTool):
             json.dump(sample_resources, f, ensure_ascii=False, indent=2)
     
     def _run(self, query: str) -> str:
-        """根据查询找到相关资源"""
-        # 简单的关键词匹配示例
-        keywords = query.lower().split()
-        matched_resources = {}
-        
-        for category, items in self.resources.items():
-            matched = []
-            for item in items:
-                description = item.get("description", "").lower()
-                name = item.get("name", "").lower()
-                
-                if any(keyword in description or keyword in name for keyword in keywords):
-                    matched.append(item)
-            
-            if matched:
-                matched_resources[category] = matched
+        """根据查询找到相关资源，按 BM25 得分返回前 top_k 个"""
+        results = self._ensure_fresh().search(query, self.top_k)
         
-        if not matched_resources:
+        if not results:
             return "未找到与查询匹配的资源。请尝试提供更多信息或使用不同的关键词。"
         
+        # 按类别分组，类别顺序取该类别中最高得分的顺序
+        matched_resources: Dict[str, List[Dict]] = {}
+        for _, category, item in results:
+            matched_resources.setdefault(category, []).append(item)
+        
         # 格式化结果
         result = "以下是可能有帮助的资源:\n\n"
         
         for category, items in matched_resources.items():
-            category_name = {
-                "crisis_lines": "危机热线",
-                "self_help": "自助资源",
-                "professional_services": "专业服务",
-                "apps": "应用程序"
-            }.get(category, category)
+            category_name = CATEGORY_NAMES.get(category, category)
             
             result += f"## {category_name}\n"
             
@@ -124,6 +224,6 @@ class ResourceFinderTool(BaseTool):
         
         return result
     
-    def _arun(self, query: str) -> str:
-        """异步执行，调用同步方法"""
-        return self._run(query)
\ No newline at end of file
+    async def _arun(self, query: str) -> str:
+        """异步执行，在工具线程池中调用同步方法"""
+        return await run_sync_tool(self._run, query)
\ No newline at end of file
@@ -0,0 +1,105 @@
+from array import array
+from collections import Counter
+import heapq
+import math
+import re
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+# 中日韩字符范围：假名、CJK扩展A、CJK基本区、兼容汉字、谚文
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+# 连续的中日韩字符 或 连续的字母数字
+_TOKEN_PATTERN = re.compile(f'[{_CJK_CHARS}]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile(f'[{_CJK_CHARS}]')
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """分词：中日韩文本切成相邻字二元组，其余按字母数字串切分
+
+    中文没有空格分隔，按空格切分对中文查询不起作用；二元组不需要词典，
+    "抑郁自助" -> ["抑郁", "郁自", "自助"]。单个汉字的片段切成一元组。
+
+    unigrams 为 True 时（建立索引用）每个汉字同时作为一元组输出，
+    这样单字查询（如"睡"）也能命中"睡眠"这样只被切成二元组的文本；
+    查询仍只用二元组，多字查询的排序不受一元组影响。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+                if unigrams:
+                    tokens.extend(run)
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class BM25Index:
+    """资源名称和描述上的倒排索引，按 BM25 排序
+
+    构建后只读，可以在多个线程中同时查询；数据变化时整体重建新的索引。
+    """
+
+    def __init__(self, documents: List[Tuple[str, Dict[str, Any]]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            documents: (类别, 资源) 列表
+        """
+        self.k1 = k1
+        self.b = b
+        self.documents = documents
+
+        # 词 -> (文档编号数组, 词频数组)
+        postings: Dict[str, Tuple[array, array]] = {}
+        lengths = array("I")
+        for doc_id, (_, item) in enumerate(documents):
+            tokens = tokenize(f"{item.get('name', '')} {item.get('description', '')}", unigrams=True)
+            lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                entry = postings.get(token)
+                if entry is None:
+                    entry = postings[token] = (array("I"), array("H"))
+                entry[0].append(doc_id)
+                entry[1].append(min(tf, 0xFFFF))
+
+        self._postings = postings
+        self._lengths = lengths
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+        count = len(documents)
+        self._idf = {
+            token: math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            for token, (ids, _) in postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, str, Dict[str, Any]]]:
+        """返回得分最高的 top_k 个资源: [(得分, 类别, 资源), ...]"""
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return []
+
+        k1 = self.k1
+        lengths = self._lengths
+        norm = k1 * (1 - self.b)
+        length_factor = k1 * self.b / self._avg_length if self._avg_length else 0.0
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            idf = self._idf[term]
+            ids, tfs = entry
+            for doc_id, tf in zip(ids, tfs):
+                denominator = tf + norm + length_factor * lengths[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / denominator
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda pair: (pair[1], -pair[0]))
+        return [(score, *self.documents[doc_id]) for doc_id, score in best]
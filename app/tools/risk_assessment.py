@@ -1,56 +1,137 @@
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
 import json
-from typing import Optional, Type, List  # 添加导入
+from typing import Any, Dict, Optional, Type, List  # 添加导入
 
 from app.config import settings
-from app.prompts.counseling_prompts import RISK_ASSESSMENT_PROMPT
+from app.llm import ainvoke_shared, get_specialized_llm, invoke_shared
+from app.prompts.counseling_prompts import RISK_ASSESSMENT_TEMPLATE
+from app.tools.risk_cache import risk_cache
+
+# 风险等级，按严重程度排列；无法解析模型输出时为 unknown
+RISK_LEVELS = ["none", "low", "medium", "high"]
+
+_LEVEL_ALIASES = {
+    "高风险": "high", "high risk": "high", "high": "high",
+    "中风险": "medium", "medium risk": "medium", "medium": "medium", "moderate": "medium",
+    "低风险": "low", "low risk": "low", "low": "low",
+    "无风险": "none", "no risk": "none", "none": "none",
+}
+
+
+def parse_risk_level(value: Any) -> Optional[str]:
+    """把模型返回的风险等级（中文或英文）归一为 RISK_LEVELS 之一，无法识别时返回 None"""
+    if not isinstance(value, str):
+        return None
+    return _LEVEL_ALIASES.get(value.strip().lower())
+
 
 class RiskAssessmentTool(BaseTool):
     name: str = "risk_assessment"  # 添加类型注解
     description: str = "评估用户消息中是否存在心理健康风险信号"  # 添加类型注解
-    
+
+    def _build_prompt(self, message: str) -> str:
+        """构造评估提示（模板在模块加载时编译一次）"""
+        return RISK_ASSESSMENT_TEMPLATE.format(message=message)
+
+    @staticmethod
+    def _get_llm():
+        """评估使用确定性输出，可配置为更便宜的模型"""
+        return get_specialized_llm(temperature=0.0, model_name=settings.RISK_ASSESSMENT_MODEL or None)
+
+    def assess(self, message: str) -> Dict[str, Any]:
+        """
+        执行风险评估，返回结构化结果
+
+        Returns:
+            {"level": 总体风险等级, "categories": {类别: 等级}, "high_risk_categories": [高风险类别]}，
+            无法解析模型输出时 level 为 unknown，并附带原始输出 raw
+        """
+        # 使用共享的LLM客户端进行评估
+        llm = self._get_llm()
+
+        # 相同（归一化后）消息的评估结果直接从缓存返回
+        cache_key = risk_cache.make_key(message, llm.model_name)
+        if settings.RISK_CACHE_ENABLED:
+            cached = self._from_cache(risk_cache.get(cache_key))
+            if cached is not None:
+                return cached
+
+        risk_result = invoke_shared(llm, self._build_prompt(message))
+        assessment = self._parse_assessment(risk_result.content)
+
+        if settings.RISK_CACHE_ENABLED and self._is_cacheable(assessment):
+            risk_cache.set(cache_key, json.dumps(assessment, ensure_ascii=False))
+        return assessment
+
+    async def aassess(self, message: str) -> Dict[str, Any]:
+        """异步执行风险评估，LLM调用不阻塞事件循环"""
+        llm = self._get_llm()
+
+        cache_key = risk_cache.make_key(message, llm.model_name)
+        if settings.RISK_CACHE_ENABLED:
+            cached = self._from_cache(await risk_cache.aget(cache_key))
+            if cached is not None:
+                return cached
+
+        risk_result = await ainvoke_shared(llm, self._build_prompt(message))
+        assessment = self._parse_assessment(risk_result.content)
+
+        if settings.RISK_CACHE_ENABLED and self._is_cacheable(assessment):
+            await risk_cache.aset(cache_key, json.dumps(assessment, ensure_ascii=False))
+        return assessment
+
+    @staticmethod
+    def _is_cacheable(assessment: Dict[str, Any]) -> bool:
+        """只缓存得出了明确风险等级的结果；解析失败的结果缓存后，同一消息在TTL内都不会再评估"""
+        return assessment["level"] in RISK_LEVELS and "raw" not in assessment
+
+    @classmethod
+    def _from_cache(cls, cached: Optional[str]) -> Optional[Dict[str, Any]]:
+        """读取缓存的结果，不可缓存的旧条目视为未命中"""
+        if cached is None:
+            return None
+        assessment = json.loads(cached)
+        return assessment if cls._is_cacheable(assessment) else None
+
     def _run(self, message: str) -> str:
         """执行风险评估"""
-        
-        # 创建评估提示
-        prompt = PromptTemplate(
-            template=RISK_ASSESSMENT_PROMPT,
-            input_variables=["message"]
-        )
-        
-        # 使用LLM进行评估
-        llm = ChatOpenAI(
-            temperature=0.0,
-            model_name=settings.OPENAI_MODEL,
-            openai_api_key=settings.OPENAI_API_KEY
-        )
-        
-        # 获取评估结果
-        risk_prompt = prompt.format(message=message)
-        risk_result = llm.invoke(risk_prompt)
-        
+        return self._format_result(self.assess(message))
+
+    async def _arun(self, message: str) -> str:
+        """异步执行风险评估"""
+        return self._format_result(await self.aassess(message))
+
+    @staticmethod
+    def _parse_assessment(content: str) -> Dict[str, Any]:
+        """解析LLM返回的评估结果"""
         try:
             # 尝试解析JSON结果
-            risk_data = json.loads(risk_result.content)
-            
+            risk_data = json.loads(content)
+            categories = {
+                category: parse_risk_level(level) or "unknown"
+                for category, level in risk_data.items()
+            }
+        except (json.JSONDecodeError, AttributeError):
+            # 如果无法解析JSON，保留原始结果
+            return {"level": "unknown", "categories": {}, "high_risk_categories": [], "raw": content}
+
+        known = [level for level in categories.values() if level in RISK_LEVELS]
+        return {
+            "level": max(known, key=RISK_LEVELS.index) if known else "unknown",
+            "categories": categories,
             # 检查高风险情况
-            high_risks = []
-            for category, level in risk_data.items():
-                if level.lower() in ["高风险", "high risk", "high"]:
-                    high_risks.append(category)
-            
-            if high_risks:
-                return f"""检测到高风险信号：{', '.join(high_risks)}。
+            "high_risk_categories": [category for category, level in categories.items() if level == "high"]
+        }
+
+    @staticmethod
+    def _format_result(assessment: Dict[str, Any]) -> str:
+        """把结构化结果整理成给Agent看的文本"""
+        high_risks = assessment["high_risk_categories"]
+        if high_risks:
+            return f"""检测到高风险信号：{', '.join(high_risks)}。
                 建议提供危机支持资源，并鼓励用户寻求专业帮助。"""
-            
-            return "未检测到高风险信号。继续提供支持性对话。"
-            
-        except (json.JSONDecodeError, AttributeError):
-            # 如果无法解析JSON，返回原始结果
-            return f"风险评估结果: {risk_result.content}"
-    
-    def _arun(self, message: str) -> str:
-        """异步执行，调用同步方法"""
-        return self._run(message)
\ No newline at end of file
+
+        if assessment["level"] == "unknown" and "raw" in assessment:
+            return f"风险评估结果: {assessment['raw']}"
+
+        return "未检测到高风险信号。继续提供支持性对话。"
@@ -0,0 +1,144 @@
+from typing import Any, Dict, Optional
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from app.cache import LRUCache
+from app.config import settings
+from app.prompts.counseling_prompts import RISK_ASSESSMENT_PROMPT
+from app.tools.executor import run_sync_tool
+
+# 缓存值的格式（结构化评估结果的JSON），格式变化时递增
+RESULT_FORMAT = "structured-1"
+
+# 提示模板和结果格式的内容哈希，修改后旧的缓存结果自动失效
+PROMPT_VERSION = hashlib.sha256(
+    "\x00".join([RISK_ASSESSMENT_PROMPT, RESULT_FORMAT]).encode("utf-8")
+).hexdigest()[:12]
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_TRAILING_PUNCTUATION_PATTERN = re.compile(r'[\s。．.！!？?，,、~～…]+$')
+
+
+def normalize_message(message: str) -> str:
+    """归一化消息文本：全角转半角、小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", message).lower().strip()
+    text = _WHITESPACE_PATTERN.sub(" ", text)
+    return _TRAILING_PUNCTUATION_PATTERN.sub("", text)
+
+
+class RiskAssessmentCache:
+    """风险评估结果缓存
+
+    键为 (提示版本, 模型, 归一化消息) 的SHA-256。内存层是带TTL的LRU缓存，
+    可选的SQLite磁盘层在进程重启后仍然有效。
+    """
+
+    _PRUNE_EVERY = 1000
+
+    def __init__(self,
+                 max_entries: int = 10000,
+                 ttl: float = 3600,
+                 disk_path: Optional[str] = None):
+        self.ttl = ttl
+        self._memory = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.disk_path = disk_path
+        self._local = threading.local()
+        self._disk_writes = 0
+        self.disk_hits = 0
+
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            conn = self._connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS risk_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+
+    @staticmethod
+    def make_key(message: str, model: str) -> str:
+        """计算缓存键"""
+        payload = "\x00".join([PROMPT_VERSION, model, normalize_message(message)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.disk_path, timeout=30)
+        return conn
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value, created_at FROM risk_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row[0]
+
+    def _disk_set(self, key: str, value: str) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO risk_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._disk_writes += 1
+            if self.ttl and self._disk_writes % self._PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM risk_cache WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，内存未命中时查询磁盘层并回填内存"""
+        value = self._memory.get(key)
+        if value is None and self.disk_path:
+            value = self._disk_get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self._memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存（内存层和磁盘层）"""
+        self._memory.set(key, value)
+        if self.disk_path:
+            self._disk_set(key, value)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get 的异步版本，磁盘层查询在工具线程池中执行"""
+        value = self._memory.get(key)
+        if value is None and self.disk_path:
+            value = await run_sync_tool(self._disk_get, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._memory.set(key, value)
+        return value
+
+    async def aset(self, key: str, value: str) -> None:
+        """set 的异步版本"""
+        self._memory.set(key, value)
+        if self.disk_path:
+            await run_sync_tool(self._disk_set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中情况，hit_rate 同时计入内存层和磁盘层命中"""
+        stats = self._memory.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["memory_hits"] = stats["hits"]
+        stats["disk_hits"] = self.disk_hits
+        stats["hits"] = stats["hits"] + self.disk_hits
+        stats["misses"] = stats["misses"] - self.disk_hits
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# 全局风险评估缓存
+risk_cache = RiskAssessmentCache(
+    max_entries=settings.RISK_CACHE_MAX_ENTRIES,
+    ttl=settings.RISK_CACHE_TTL,
+    disk_path=settings.RISK_CACHE_DISK_PATH or None
+)
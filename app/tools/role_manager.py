@@ -1,54 +1,151 @@
+from contextvars import ContextVar
 from enum import Enum
 from langchain.tools import BaseTool
 from typing import Optional, Dict, Any
+import os
+import sqlite3
+import threading
+
+from app.cache import LRUCache
+from app.config import settings
+from app.tools.executor import run_sync_tool
 
 class AgentRole(Enum):
     """Agent的可能角色"""
     COUNSELOR = "counselor"
     PROPOSAL_EVALUATOR = "proposal_evaluator"
 
+# 当前请求所属的会话ID，由 CounselorAgent 在处理请求时设置，工具据此读写该会话的角色
+current_conversation_id: ContextVar[Optional[str]] = ContextVar("current_conversation_id", default=None)
+
+
+_ROLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversation_roles (
+    conversation_id TEXT PRIMARY KEY,
+    role TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class RoleStore:
+    """按会话保存Agent角色，不同会话之间互不影响
+
+    角色保存在SQLite中（db_path 为 ":memory:" 时只在进程内），空闲、淘汰或重启后不会丢失。
+    单进程部署时最近用过的会话角色保留在LRU缓存中，未命中时再查询数据库；
+    shared 为真（多进程部署）时每次读取都查询数据库，保证看到其他进程的切换。
+    """
+
+    # 默认角色为心理咨询师
+    DEFAULT_ROLE = AgentRole.COUNSELOR
+
+    def __init__(self, db_path: str = ":memory:", shared: bool = False):
+        self.db_path = db_path
+        self.shared = shared
+        self._roles = LRUCache(
+            max_entries=settings.CONVERSATION_CACHE_MAX_ENTRIES,
+            idle_ttl=settings.CONVERSATION_CACHE_IDLE_TTL
+        )
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        # 角色读写都是单条语句，共用一个连接并串行执行
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if db_path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(_ROLE_SCHEMA)
+            self._conn.commit()
+
+    def get_role(self, conversation_id: Optional[str]) -> AgentRole:
+        """获取会话的当前角色"""
+        if conversation_id is None:
+            return self.DEFAULT_ROLE
+        if not self.shared:
+            role = self._roles.get(conversation_id)
+            if role is not None:
+                return role
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT role FROM conversation_roles WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        role = AgentRole(row[0]) if row else self.DEFAULT_ROLE
+        if not self.shared:
+            self._roles.set(conversation_id, role)
+        return role
+
+    def set_role(self, conversation_id: Optional[str], role: AgentRole) -> None:
+        """设置会话的角色"""
+        if conversation_id is None:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversation_roles (conversation_id, role) VALUES (?, ?)",
+                    (conversation_id, role.value)
+                )
+            if not self.shared:
+                self._roles.set(conversation_id, role)
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 全局角色存储，多进程部署时与会话历史放在同一个SQLite文件中
+role_store = RoleStore(
+    (settings.CONVERSATION_DB_PATH if settings.shared_state else settings.ROLE_DB_PATH) or ":memory:",
+    shared=settings.shared_state
+)
+
+
 class RoleManagerTool(BaseTool):
-    """管理Agent的当前角色"""
-    
+    """管理当前会话中Agent的角色"""
+
     name: str = "role_manager"
     description: str = "管理Agent的当前角色，在心理咨询师和提案评估者之间切换。"
-    
-    # 默认角色为心理咨询师
-    current_role: AgentRole = AgentRole.COUNSELOR
-    
+
     def _run(self, action: str, **kwargs: Any) -> Dict[str, Any]:
         """
-        改变或查询当前角色
-        
+        改变或查询当前会话的角色
+
         Args:
             action: 'switch' 或 'get'
             role: 要切换到的角色 (当action为'switch'时)
-        
+
         Returns:
             包含当前角色的字典
         """
+        conversation_id = current_conversation_id.get()
+
         if action == "switch":
             role_str = kwargs.get("role", "").lower()
-            
+
             if role_str in ["counselor", "心理咨询师"]:
-                self.current_role = AgentRole.COUNSELOR
+                role_store.set_role(conversation_id, AgentRole.COUNSELOR)
             elif role_str in ["proposal_evaluator", "提案评估者"]:
-                self.current_role = AgentRole.PROPOSAL_EVALUATOR
+                role_store.set_role(conversation_id, AgentRole.PROPOSAL_EVALUATOR)
             else:
-                return {"error": f"未知角色: {role_str}", "current_role": self.current_role.value}
-        
-        return {"current_role": self.current_role.value}
-    
-    def _arun(self, action: str, **kwargs: Any) -> Dict[str, Any]:
-        """异步运行(简单调用同步方法)"""
-        return self._run(action, **kwargs)
-    
-    def is_counselor(self) -> bool:
-        """检查当前是否为心理咨询师角色"""
-        return self.current_role == AgentRole.COUNSELOR
-    
-    def is_proposal_evaluator(self) -> bool:
-        """检查当前是否为提案评估者角色"""
-        return self.current_role == AgentRole.PROPOSAL_EVALUATOR
-    
-    
\ No newline at end of file
+                return {"error": f"未知角色: {role_str}", "current_role": self.get_role().value}
+
+        return {"current_role": self.get_role().value}
+
+    async def _arun(self, action: str, **kwargs: Any) -> Dict[str, Any]:
+        """异步运行，在工具线程池中调用同步方法"""
+        return await run_sync_tool(self._run, action, **kwargs)
+
+    def get_role(self, conversation_id: Optional[str] = None) -> AgentRole:
+        """获取会话的角色，不指定会话时使用当前请求的会话"""
+        if conversation_id is None:
+            conversation_id = current_conversation_id.get()
+        return role_store.get_role(conversation_id)
+
+    def is_counselor(self, conversation_id: Optional[str] = None) -> bool:
+        """检查会话当前是否为心理咨询师角色"""
+        return self.get_role(conversation_id) == AgentRole.COUNSELOR
+
+    def is_proposal_evaluator(self, conversation_id: Optional[str] = None) -> bool:
+        """检查会话当前是否为提案评估者角色"""
+        return self.get_role(conversation_id) == AgentRole.PROPOSAL_EVALUATOR
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from app.config import settings
+
+
+async def run_batch(args) -> int:
+    # 导入时会创建Agent和LLM客户端，放在配置验证之后
+    from app.agents.agent import CounselorAgent
+    from app.batch import BatchRunner, parse_batch_lines
+    from app.database import ConversationMemory
+    from app.history import ChatHistoryManager
+    from app.llm import close_llm_clients
+
+    agent = CounselorAgent()
+    memory = ConversationMemory(storage_dir=args.conversation_dir)
+    history_manager = ChatHistoryManager(
+        memory,
+        summarizer=agent.summarize_history if settings.HISTORY_SUMMARY_ENABLED else None
+    )
+    runner = BatchRunner(
+        agent,
+        memory,
+        history_manager,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        include_steps=args.include_steps
+    )
+
+    # 输入逐行读取、边读边处理
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    total = failed = 0
+    try:
+        async for result in runner.run(parse_batch_lines(source)):
+            total += 1
+            failed += "error" in result
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        await memory.aclose()
+        await close_llm_clients()
+
+    print(f"批量对话完成: 共 {total} 条, 失败 {failed} 条", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量回放用户消息，JSONL输入，逐条输出JSONL结果")
+    parser.add_argument("--input", default="-", help="输入JSONL文件，'-' 表示标准输入")
+    parser.add_argument("--output", default="-", help="输出JSONL文件，'-' 表示标准输出")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY, help="同时处理的会话数")
+    parser.add_argument("--rate-limit", type=float, default=settings.BATCH_RATE_LIMIT, help="每秒最多处理的消息数，0 表示不限速")
+    parser.add_argument("--include-steps", action="store_true", help="输出工具调用步骤")
+    parser.add_argument("--conversation-dir", default=settings.CONVERSATION_DIR, help="会话存储目录")
+    args = parser.parse_args()
+
+    try:
+        settings.validate()
+        settings.setup_environment()
+        sys.exit(asyncio.run(run_batch(args)))
+    except Exception as e:
+        print(f"批量对话失败: {str(e)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,204 @@
+"""
+/api/chat 端到端负载测试（使用本地假模型，不需要 OpenAI 密钥）
+
+在进程内启动应用（httpx ASGITransport），用 benchmarks.fake_llm 替换模型，
+按指定并发发送请求。每个会话先预置指定轮数的历史。报告吞吐量、延迟的
+p50/p95/p99 和各阶段平均耗时，结果写入JSON文件，便于跟踪性能回归。
+
+用法:
+    python -m benchmarks.bench_chat_api --requests 200 --concurrency 20 --history 20 \\
+        --latency 0.2 --tokens-per-second 50 --tool-call-rate 0.3 --output results.json
+
+    # 长会话下比较完整历史和增量返回的响应大小
+    python -m benchmarks.bench_chat_api --history 500 --conversations 10 --history-mode delta
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+def _configure_environment(args, data_dir: str) -> None:
+    """在导入应用之前设置环境变量"""
+    os.environ.update({
+        "LLM_FACTORY": "benchmarks.fake_llm:create_fake_llm",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_LLM_RESPONSE_TOKENS": str(args.response_tokens),
+        "FAKE_LLM_TOOL_CALL_RATE": str(args.tool_call_rate),
+        "CONVERSATION_DIR": os.path.join(data_dir, "conversations"),
+        "CONVERSATION_DB_PATH": os.path.join(data_dir, "conversations.sqlite3"),
+        "PROPOSAL_DB_PATH": "",
+        "RISK_CACHE_DISK_PATH": "",
+    })
+    if args.store:
+        os.environ["CONVERSATION_STORE"] = args.store
+
+
+# 混合不同类型的消息：咨询类走路由的单轮链，其余交给带工具的Agent
+_MESSAGES = [
+    "我最近总是焦虑，晚上睡不着怎么办？",
+    "你好，今天想和你随便聊聊。",
+    "能帮我看看现在有哪些进行中的事情吗？",
+    "谢谢你上次的建议。",
+]
+
+
+def _percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def _token_snapshot(token_totals) -> dict:
+    """所有模型的 token 计数之和，按类型（prompt/completion/cached）"""
+    totals = {}
+    for model_totals in token_totals().values():
+        for kind, value in model_totals.items():
+            totals[kind] = totals.get(kind, 0) + value
+    return totals
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def _run(args) -> dict:
+    import httpx
+    from app import api
+    from app.metrics import token_totals
+
+    # 请求日志会明显拖慢压测，只保留警告和错误
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # 预置历史
+    conversation_ids = [f"bench-{i}" for i in range(args.conversations)]
+    for conversation_id in conversation_ids:
+        for turn in range(args.history):
+            api.memory.add_message(conversation_id, {"role": "user", "content": f"第{turn}轮：最近压力很大，睡不好。"})
+            api.memory.add_message(conversation_id, {"role": "assistant", "content": "听起来你最近很辛苦，可以多说说吗？"})
+
+    latencies, errors, stage_totals, response_bytes = [], 0, {}, []
+    cursors = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=api.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def one(i: int):
+            nonlocal errors
+            conversation_id = conversation_ids[i % len(conversation_ids)]
+            payload = {
+                "message": f"请求{i}：{_MESSAGES[i % len(_MESSAGES)]}",
+                "conversation_id": conversation_id,
+                "include_timings": True,
+                "history_mode": args.history_mode
+            }
+            if args.history_mode == "delta" and conversation_id in cursors:
+                payload["cursor"] = cursors[conversation_id]
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/chat", json=payload)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors += 1
+                return
+            latencies.append(elapsed)
+            response_bytes.append(len(response.content))
+            body = response.json()
+            cursors[conversation_id] = body.get("cursor")
+            timings = (body.get("details") or {}).get("timings") or {}
+            for stage, ms in timings.get("totals_ms", {}).items():
+                stage_totals.setdefault(stage, []).append(ms)
+
+        # 预热：创建Agent执行器、连接等一次性开销不计入结果
+        await one(-1)
+        latencies.clear()
+        stage_totals.clear()
+        response_bytes.clear()
+        tokens_before = _token_snapshot(token_totals)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+
+    await api.memory.aclose()
+
+    # 预热之后的 token 用量，cached 为命中（模拟的）服务端提示缓存的部分
+    tokens = {kind: value - tokens_before.get(kind, 0) for kind, value in _token_snapshot(token_totals).items()}
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "requests": args.requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2)
+        } if latencies else {},
+        "llm_tokens": {kind: int(value) for kind, value in sorted(tokens.items())},
+        "prompt_cache_hit_ratio": round(tokens.get("cached", 0) / tokens["prompt"], 3) if tokens.get("prompt") else 0.0,
+        "response_bytes_mean": round(statistics.mean(response_bytes)) if response_bytes else 0,
+        "stage_mean_ms": {
+            stage: round(statistics.mean(values), 2) for stage, values in sorted(stage_totals.items())
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/chat 端到端负载测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=50, help="请求分布到的会话数")
+    parser.add_argument("--history", type=int, default=10, help="每个会话预置的对话轮数")
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型首token延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--tool-call-rate", type=float, default=0.3)
+    parser.add_argument("--history-mode", choices=["full", "delta", "none"], default="full",
+                        help="响应中 messages 的返回方式")
+    parser.add_argument("--store", choices=["json", "journal", "sqlite"], default=None)
+    parser.add_argument("--output", default=None, help="结果JSON文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        _configure_environment(args, data_dir)
+        # AgentExecutor 的 verbose 输出转到标准错误，标准输出只保留结果JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(_run(args))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        latency = result["latency_ms"]
+        print(f"throughput={result['throughput_rps']} rps p50={latency.get('p50')}ms "
+              f"p95={latency.get('p95')}ms p99={latency.get('p99')}ms errors={result['errors']} -> {args.output}",
+              file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
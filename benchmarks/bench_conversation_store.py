@@ -0,0 +1,124 @@
+"""
+会话存储后端基准测试
+
+对比 JsonFileStore（每条消息重写整个文件）与 JournalStore（追加写日志）的
+写入耗时、写放大（实际写入字节 / 消息字节）以及加载耗时。
+
+用法:
+    python -m benchmarks.bench_conversation_store --messages 50 200 1000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from app.storage import JsonFileStore, JournalStore
+
+
+def _make_message(i: int) -> dict:
+    role = "user" if i % 2 == 0 else "assistant"
+    return {
+        "role": role,
+        "content": f"第{i}条消息：最近工作压力很大，晚上总是睡不好，想聊一聊。" * 3,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def run_json(num_messages: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonFileStore(tmp)
+        history = []
+        payload_bytes = 0
+        written_bytes = 0
+
+        start = time.perf_counter()
+        for i in range(num_messages):
+            message = _make_message(i)
+            history.append(message)
+            payload_bytes += len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+            store.append("bench", [message], history)
+            # 整体重写：每次写入的字节数就是当前文件大小
+            written_bytes += _dir_size(tmp)
+        write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store.load("bench")
+        load_time = time.perf_counter() - start
+
+        return {
+            "write_time": write_time,
+            "written_bytes": written_bytes,
+            "payload_bytes": payload_bytes,
+            "load_time": load_time
+        }
+
+
+def run_journal(num_messages: int, fsync: bool, compact_threshold: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JournalStore(tmp, fsync=fsync, compact_threshold=compact_threshold, compact_interval=0)
+        history = []
+        payload_bytes = 0
+        written_bytes = 0
+
+        start = time.perf_counter()
+        for i in range(num_messages):
+            message = _make_message(i)
+            history.append(message)
+            payload_bytes += len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+            before = _dir_size(tmp)
+            store.append("bench", [message], history)
+            written_bytes += _dir_size(tmp) - before
+        write_time = time.perf_counter() - start
+
+        # 压缩在后台线程进行，单独计时并计入写放大
+        start = time.perf_counter()
+        store.compact_pending()
+        compact_time = time.perf_counter() - start
+        snapshot_path = os.path.join(tmp, "bench.json")
+        if os.path.exists(snapshot_path):
+            written_bytes += os.path.getsize(snapshot_path)
+
+        start = time.perf_counter()
+        store.load("bench")
+        load_time = time.perf_counter() - start
+
+        store.close()
+        return {
+            "write_time": write_time,
+            "written_bytes": written_bytes,
+            "payload_bytes": payload_bytes,
+            "load_time": load_time,
+            "compact_time": compact_time
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话存储后端基准测试")
+    parser.add_argument("--messages", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--fsync", action="store_true", help="JournalStore 每次追加后 fsync")
+    parser.add_argument("--compact-threshold", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'backend':<10}{'messages':>10}{'write(ms)':>12}{'per msg(us)':>14}"
+          f"{'write amp':>12}{'load(ms)':>10}")
+    for num_messages in args.messages:
+        results = {
+            "json": run_json(num_messages),
+            "journal": run_journal(num_messages, args.fsync, args.compact_threshold)
+        }
+        for name, r in results.items():
+            amplification = r["written_bytes"] / r["payload_bytes"]
+            print(f"{name:<10}{num_messages:>10}{r['write_time'] * 1000:>12.1f}"
+                  f"{r['write_time'] / num_messages * 1e6:>14.1f}"
+                  f"{amplification:>12.1f}{r['load_time'] * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
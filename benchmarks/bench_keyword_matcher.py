@@ -0,0 +1,86 @@
+"""
+关键词匹配微基准：逐关键词 `in` 扫描 对比 Aho-Corasick 自动机
+
+基线实现与原先的 MessageAnalyzer 相同：每次调用都把关键词转小写、
+对每个关键词扫描一遍消息、并重新编译 #id 正则。
+
+用法:
+    python -m benchmarks.bench_keyword_matcher --lengths 100 2000 20000 --extra-keywords 0 500
+"""
+
+import argparse
+import random
+import timeit
+
+from utils.keyword_matcher import KeywordMatcher
+from utils.message_analyzer import MessageAnalyzer
+
+
+def baseline_analyze(message: str, proposal_keywords, counseling_keywords) -> dict:
+    """原先的逐关键词扫描实现（两个类别都需要完整扫描）"""
+    lowered = message.lower()
+
+    is_proposal = False
+    for keyword in proposal_keywords:
+        if keyword.lower() in lowered:
+            is_proposal = True
+            break
+    if not is_proposal:
+        import re
+        is_proposal = re.search(r'#[a-zA-Z0-9]+', lowered) is not None
+
+    is_counseling = False
+    for keyword in counseling_keywords:
+        if keyword.lower() in lowered:
+            is_counseling = True
+            break
+
+    return {"is_proposal_related": is_proposal, "is_counseling_related": is_counseling}
+
+
+def _random_words(count: int, rng: random.Random) -> list:
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(4, 10))) for _ in range(count)]
+
+
+def _make_message(length: int, rng: random.Random) -> str:
+    # 不含任何关键词的消息是两种实现的最坏情况：每个关键词都要完整扫描
+    filler = "今天天气不错我们一起出去走走吧 the weather is nice today "
+    return (filler * (length // len(filler) + 1))[:length]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词匹配微基准")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 2000, 20000])
+    parser.add_argument("--extra-keywords", type=int, nargs="+", default=[0, 500])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'keywords':>10}{'length':>10}{'loop(us)':>12}{'automaton(us)':>15}{'speedup':>10}")
+    for extra in args.extra_keywords:
+        extra_words = _random_words(extra, rng)
+        proposal_keywords = MessageAnalyzer.PROPOSAL_KEYWORDS + extra_words[:extra // 2]
+        counseling_keywords = MessageAnalyzer.COUNSELING_KEYWORDS + extra_words[extra // 2:]
+        matcher = KeywordMatcher({"proposal": proposal_keywords, "counseling": counseling_keywords})
+        total_keywords = len(proposal_keywords) + len(counseling_keywords)
+
+        for length in args.lengths:
+            message = _make_message(length, rng)
+            number = max(1, args.number * 100 // max(length, 100))
+
+            loop_time = timeit.timeit(
+                lambda: baseline_analyze(message, proposal_keywords, counseling_keywords),
+                number=number
+            ) / number
+            automaton_time = timeit.timeit(
+                lambda: matcher.count_by_category(matcher.find_all(message)),
+                number=number
+            ) / number
+
+            print(f"{total_keywords:>10}{length:>10}{loop_time * 1e6:>12.1f}"
+                  f"{automaton_time * 1e6:>15.1f}{loop_time / automaton_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
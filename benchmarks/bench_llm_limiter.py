@@ -0,0 +1,95 @@
+"""
+上游LLM突发流量压测：自适应并发限制开启和关闭时的 429 次数、成功率和耗时（使用本地假模型）
+
+假模型的上游同时只能处理 --capacity 个请求，超出时返回 429（带 Retry-After）。
+一次性发起 --requests 个调用：
+    - 关闭限制：所有调用直接打到上游，只依赖带抖动的重试
+    - 开启限制：AIMD 根据 429 收缩并发，其余调用排队，队列满时立即返回 OverloadedError
+
+用法:
+    python -m benchmarks.bench_llm_limiter --requests 300 --capacity 8 --latency 0.2 --queue 200
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+
+async def _burst(llm, requests: int) -> dict:
+    from app.concurrency import OverloadedError
+
+    outcomes = {"ok": 0, "shed": 0, "failed": 0}
+    latencies = []
+
+    async def one(i: int):
+        start = time.perf_counter()
+        try:
+            await llm.ainvoke(f"突发请求 {i}")
+            outcomes["ok"] += 1
+            latencies.append(time.perf_counter() - start)
+        except OverloadedError:
+            outcomes["shed"] += 1
+        except Exception:
+            outcomes["failed"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    latencies.sort()
+    return dict(
+        outcomes,
+        wall_seconds=round(time.perf_counter() - started, 2),
+        p50_ms=round(latencies[len(latencies) // 2] * 1000) if latencies else None,
+        p99_ms=round(latencies[int(len(latencies) * 0.99)] * 1000) if latencies else None
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游LLM并发限制压测")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--capacity", type=int, default=8, help="模拟上游同时处理的请求数")
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型每次调用耗时（秒）")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--initial-limit", type=int, default=32)
+    parser.add_argument("--queue", type=int, default=200, help="等待队列长度")
+    parser.add_argument("--retries", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.update({
+        "LLM_FACTORY": "benchmarks.fake_llm:create_fake_llm",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": "0",
+        "FAKE_LLM_CAPACITY": str(args.capacity),
+        "FAKE_LLM_RETRY_AFTER": str(args.retry_after),
+        "LLM_MAX_RETRIES": str(args.retries),
+    })
+
+    from app import llm as llm_module
+    from app.concurrency import AdaptiveLimiter
+    from benchmarks import fake_llm
+
+    llm = llm_module.get_chat_llm_instance(temperature=0.0)
+    for enabled in (False, True):
+        llm_module.llm_limiter = AdaptiveLimiter(
+            initial_limit=args.initial_limit,
+            max_queue=args.queue,
+            queue_timeout=60
+        ) if enabled else None
+        for key in ("requests", "rejected", "max_in_flight"):
+            fake_llm.upstream_stats[key] = 0
+
+        result = asyncio.run(_burst(llm, args.requests))
+        upstream = fake_llm.upstream_stats
+        line = (f"limiter={'on ' if enabled else 'off'} ok={result['ok']} shed={result['shed']} "
+                f"failed={result['failed']} upstream_requests={upstream['requests']} "
+                f"429s={upstream['rejected']} wall={result['wall_seconds']}s "
+                f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+        if enabled:
+            stats = llm_module.llm_limiter.stats()
+            line += f" final_limit={stats['limit']} overloads={stats['overloads']} retries={stats['retries']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+会话持久化负载测试：事件循环上的同步I/O 对比 异步I/O
+
+模拟多个并发会话，每轮对话读取历史、追加用户消息、等待模拟的LLM延迟、
+追加助手消息。分别使用同步 API（在事件循环上直接读写文件）和异步 API
+（线程池 + 按会话合并写入），报告每轮耗时的 p50/p99 以及事件循环延迟。
+
+用法:
+    python -m benchmarks.bench_memory_io --sessions 50 --turns 10 --history 300
+"""
+
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from app.database import ConversationMemory
+from app.storage import create_store
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _seed(storage_dir: str, backend: str, sessions: int, history: int) -> None:
+    store = create_store(backend, storage_dir)
+    messages = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": "最近压力很大，总是睡不好，不知道该怎么调整自己的状态。" * 4,
+            "timestamp": datetime.now().isoformat()
+        }
+        for i in range(history)
+    ]
+    for s in range(sessions):
+        store.append(f"session-{s}", messages, messages)
+    store.close()
+
+
+async def _monitor_loop(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    """测量事件循环的调度延迟"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def _run(memory: ConversationMemory, use_async: bool, sessions: int, turns: int,
+               llm_latency: float) -> dict:
+    latencies = []
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop(stop, lags))
+
+    async def session(conversation_id: str):
+        for turn in range(turns):
+            start = time.perf_counter()
+            if use_async:
+                await memory.aget_conversation(conversation_id)
+                await memory.aadd_message(conversation_id, {"role": "user", "content": f"第{turn}轮"})
+            else:
+                memory.get_conversation(conversation_id)
+                memory.add_message(conversation_id, {"role": "user", "content": f"第{turn}轮"})
+            await asyncio.sleep(llm_latency)
+            if use_async:
+                await memory.aadd_message(conversation_id, {"role": "assistant", "content": "我在听。"})
+            else:
+                memory.add_message(conversation_id, {"role": "assistant", "content": "我在听。"})
+            latencies.append(time.perf_counter() - start - llm_latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(f"session-{s}") for s in range(sessions)))
+    if use_async:
+        await memory.aflush()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    return {
+        "turns_per_sec": sessions * turns / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_loop_lag_ms": max(lags) * 1000 if lags else 0.0,
+        "p99_loop_lag_ms": _percentile(lags, 99) * 1000 if lags else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话持久化负载测试")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--history", type=int, default=300, help="每个会话预置的消息数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="模拟的LLM延迟（秒）")
+    parser.add_argument("--backend", default="json", choices=["json", "journal"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'turns/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'loop lag p99':>14}{'loop lag max':>14}")
+    for use_async in (False, True):
+        storage_dir = tempfile.mkdtemp()
+        try:
+            _seed(storage_dir, args.backend, args.sessions, args.history)
+            memory = ConversationMemory(storage_dir, store=create_store(args.backend, storage_dir))
+            r = asyncio.run(_run(memory, use_async, args.sessions, args.turns, args.llm_latency))
+            memory.close()
+        finally:
+            shutil.rmtree(storage_dir, ignore_errors=True)
+
+        mode = "async" if use_async else "sync"
+        print(f"{mode:<8}{r['turns_per_sec']:>10.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['p99_loop_lag_ms']:>14.2f}{r['max_loop_lag_ms']:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+提案列表基准：内存字典全量扫描 对比 SQLite 二级索引分页
+
+基线与原先的 ProposalManager.list_proposals 相同：遍历所有提案、按状态过滤、
+并为每个提案重新求和投票数。
+
+用法:
+    python -m benchmarks.bench_proposal_listing --proposals 100000 --page-size 20
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app.models.proposal import Proposal, ProposalManager
+
+
+def baseline_list(proposals: dict, status=None) -> list:
+    """原先的全量扫描实现"""
+    result = []
+    for p_id, proposal in proposals.items():
+        if status is None or proposal.status == status:
+            result.append({
+                "proposal_id": p_id,
+                "title": proposal.title,
+                "status": proposal.status,
+                "created_at": proposal.created_at,
+                "vote_count": sum(proposal.votes.values())
+            })
+    return result
+
+
+def _timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提案列表基准")
+    parser.add_argument("--proposals", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--closed-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    closed_every = max(1, int(1 / args.closed_ratio)) if args.closed_ratio else 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ProposalManager(os.path.join(tmp, "proposals.sqlite3"))
+        baseline = {}
+
+        start = time.perf_counter()
+        for i in range(args.proposals):
+            proposal = manager.create_proposal(f"提案{i}", "描述")
+            plain = Proposal(proposal.title, proposal.description, proposal.proposal_id)
+            if closed_every and i % closed_every == 0:
+                manager.close_proposal(proposal.proposal_id)
+                plain.status = "closed"
+            baseline[plain.proposal_id] = plain
+        print(f"proposals={args.proposals} created in {time.perf_counter() - start:.1f}s")
+
+        # 取一个较深的游标，验证翻到后面的页同样不需要扫描前面的提案
+        _, deep_cursor = manager.list_proposals_page("active", limit=args.proposals // 2)
+
+        print(f"{'query':<34}{'median(ms)':>12}")
+        for status in (None, "active", "closed"):
+            print(f"{'dict scan status=' + str(status):<34}"
+                  f"{_timed(lambda: baseline_list(baseline, status), args.repeat):>12.3f}")
+            print(f"{'indexed first page status=' + str(status):<34}"
+                  f"{_timed(lambda: manager.list_proposals_page(status, args.page_size), args.repeat):>12.3f}")
+        print(f"{'indexed deep page status=active':<34}"
+              f"{_timed(lambda: manager.list_proposals_page('active', args.page_size, deep_cursor), args.repeat):>12.3f}")
+        manager.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+资源检索基准：逐条线性扫描 对比 倒排索引 + BM25
+
+生成指定数量的合成资源写入临时JSON文件，分别测量：
+- 原先的实现（按空格切分查询，对每个资源逐个关键词做子串匹配）
+- ResourceFinderTool 的索引构建时间、查询延迟，以及修改文件后的后台重建（重建期间查询不被阻塞）
+
+用法:
+    python -m benchmarks.bench_resource_search --resources 100000 --queries 200
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from app.tools.resource_finder import ResourceFinderTool
+
+_TOPICS = ["抑郁", "焦虑", "失眠", "压力", "冥想", "正念", "情绪", "家庭关系", "亲密关系", "职场",
+           "学业", "创伤", "孤独", "自我接纳", "强迫", "恐慌", "饮食", "成瘾", "哀伤", "愤怒管理"]
+_FORMS = ["自助手册", "在线课程", "练习指南", "支持小组", "咨询服务", "热线", "应用", "播客", "讲座", "工作坊"]
+_WORDS = ["基于", "认知行为疗法", "的", "帮助", "缓解", "改善", "理解", "应对", "日常", "专业",
+          "免费", "引导式", "呼吸练习", "记录", "分析", "提供", "青少年", "成年人", "CBT", "ACT"]
+_CATEGORIES = ["crisis_lines", "self_help", "professional_services", "apps"]
+
+_QUERIES = ["我最近总是失眠", "有没有缓解焦虑的应用", "想找抑郁自助手册", "冥想 正念",
+            "职场压力很大怎么办", "亲密关系咨询服务", "CBT 在线课程", "青少年 情绪 热线"]
+
+
+def _make_resources(count: int, rng: random.Random) -> dict:
+    resources = {category: [] for category in _CATEGORIES}
+    for i in range(count):
+        topic = rng.choice(_TOPICS)
+        form = rng.choice(_FORMS)
+        description = "".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 10))) + topic
+        resources[rng.choice(_CATEGORIES)].append({
+            "name": f"{topic}{form}{i}",
+            "description": description
+        })
+    return resources
+
+
+def baseline_search(resources: dict, query: str) -> dict:
+    """原先的 _run 匹配逻辑"""
+    keywords = query.lower().split()
+    matched_resources = {}
+    for category, items in resources.items():
+        matched = []
+        for item in items:
+            description = item.get("description", "").lower()
+            name = item.get("name", "").lower()
+            if any(keyword in description or keyword in name for keyword in keywords):
+                matched.append(item)
+        if matched:
+            matched_resources[category] = matched
+    return matched_resources
+
+
+def _percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"mean={statistics.mean(samples) * 1e3:8.2f}ms p50={p50 * 1e3:8.2f}ms p99={p99 * 1e3:8.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="资源检索基准")
+    parser.add_argument("--resources", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    resources = _make_resources(args.resources, rng)
+    queries = [rng.choice(_QUERIES) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mental_health_resources.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(resources, f, ensure_ascii=False)
+
+        start = time.perf_counter()
+        tool = ResourceFinderTool(resource_path=path, top_k=args.top_k)
+        print(f"resources={args.resources} initial load+index: {time.perf_counter() - start:.2f}s")
+
+        baseline_times = []
+        for query in queries[:max(1, args.queries // 10)]:
+            start = time.perf_counter()
+            baseline_search(resources, query)
+            baseline_times.append(time.perf_counter() - start)
+
+        indexed_times = []
+        for query in queries:
+            start = time.perf_counter()
+            tool._run(query)
+            indexed_times.append(time.perf_counter() - start)
+
+        print(f"linear scan : {_percentiles(baseline_times)}")
+        print(f"bm25 index  : {_percentiles(indexed_times)}")
+
+        # 修改文件后第一次查询触发后台重建，查询本身使用旧索引立即返回
+        resources["apps"].append({"name": "睡眠改善助手", "description": "帮助改善失眠的应用"})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(resources, f, ensure_ascii=False)
+        start = time.perf_counter()
+        tool._run("睡眠改善助手")
+        print(f"query after file change (served by old index): {(time.perf_counter() - start) * 1e3:.2f}ms")
+        start = time.perf_counter()
+        tool.wait_for_reload()
+        result = tool._run("睡眠改善助手")
+        print(f"background rebuild: {time.perf_counter() - start:.2f}s, "
+              f"new resource found: {'睡眠改善助手' in result}")
+
+
+if __name__ == "__main__":
+    main()
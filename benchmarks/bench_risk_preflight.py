@@ -0,0 +1,94 @@
+"""
+预先风险评估压测：风险评估作为Agent工具串行调用与和主回答并发执行时的单轮耗时（使用本地假模型）
+
+关闭预先评估时，假模型的Agent对每条消息先调用 risk_assessment 工具，拿到结果后再回答，
+一轮是三次串行的模型调用；开启时评估和主回答同时开始，Agent只调用一次模型。
+消息中混入少量危机消息，检查它们的回答是否被替换为危机支持回复。
+
+用法:
+    python -m benchmarks.bench_risk_preflight --requests 100 --concurrency 10 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+_MESSAGES = [
+    "我最近总是焦虑，晚上睡不着怎么办？",
+    "工作压力很大，感觉喘不过气。",
+    "和家里人吵架了，心情很差。",
+    "我真的不想活了，觉得一切都没有意义。",
+]
+
+
+async def _drive(agent, requests: int, concurrency: int) -> dict:
+    latencies, overrides, crisis = [], 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal overrides, crisis
+        message = f"请求{i}：{_MESSAGES[i % len(_MESSAGES)]}"
+        async with semaphore:
+            start = time.perf_counter()
+            result = await agent.generate_response(message, [], conversation_id=f"risk-{i}")
+            latencies.append(time.perf_counter() - start)
+        if "不想活" in message:
+            crisis += 1
+            # 关闭预先评估时危机消息只能靠Agent自己读工具结果，这里检查回答是否被替换
+            if result["response"] == agent.crisis_response:
+                overrides += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "wall_seconds": round(wall, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000),
+        "crisis_messages": crisis,
+        "crisis_overrides": overrides
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预先风险评估压测")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型首token延迟（秒）")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "LLM_FACTORY": "benchmarks.fake_llm:create_fake_llm",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": "0",
+        # Agent有风险评估工具时总是先调用它，没有时直接回答
+        "FAKE_LLM_TOOL_CALL_RATE": "1",
+        "FAKE_LLM_TOOLS": "risk_assessment",
+        "ROUTER_ENABLED": "False",
+        "RISK_CACHE_ENABLED": "False",
+        "PROPOSAL_DB_PATH": "",
+    })
+
+    from app.agents.agent import CounselorAgent
+    from app.config import settings
+    from benchmarks import fake_llm
+
+    for enabled in (False, True):
+        settings.RISK_PREFLIGHT_ENABLED = enabled
+        upstream_before = fake_llm.upstream_stats["requests"]
+        with contextlib.redirect_stdout(sys.stderr):
+            agent = CounselorAgent()
+            result = asyncio.run(_drive(agent, args.requests, args.concurrency))
+        calls = fake_llm.upstream_stats["requests"] - upstream_before
+        print(f"preflight={'on ' if enabled else 'off'} tools={[tool.name for tool in agent.tools]} "
+              f"llm_calls={calls} wall={result['wall_seconds']}s p50={result['p50_ms']}ms "
+              f"p99={result['p99_ms']}ms crisis_overrides={result['crisis_overrides']}/{result['crisis_messages']}")
+
+
+if __name__ == "__main__":
+    main()
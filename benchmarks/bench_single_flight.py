@@ -0,0 +1,90 @@
+"""
+热门提案的并发分析压测：相同提示的并发模型调用合并前后的上游调用次数（使用本地假模型）
+
+模拟大量用户同时分析同一个提案（ProposalTool 的 analyze 操作），分批到达，
+分别在关闭和开启 single-flight 时统计上游模型调用次数和耗时。
+
+用法:
+    python -m benchmarks.bench_single_flight --callers 200 --waves 5 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+
+def _upstream_calls() -> int:
+    """metrics 中记录的模型调用次数（stage=llm 的直方图样本数）"""
+    from app.metrics import STAGE_LATENCY
+    for metric in STAGE_LATENCY.collect():
+        return int(sum(
+            sample.value for sample in metric.samples
+            if sample.name.endswith("_count") and sample.labels.get("stage") == "llm"
+        ))
+    return 0
+
+
+async def _herd(tool, proposal_id: str, callers: int, waves: int, interval: float) -> dict:
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await tool._arun("analyze", proposal_id=proposal_id)
+        latencies.append(time.perf_counter() - start)
+
+    before = _upstream_calls()
+    started = time.perf_counter()
+    tasks = []
+    for wave in range(waves):
+        tasks.extend(asyncio.ensure_future(one()) for _ in range(callers // waves))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "callers": len(tasks),
+        "upstream_calls": _upstream_calls() - before,
+        "wall_seconds": round(wall, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="single-flight 合并压测")
+    parser.add_argument("--callers", type=int, default=200)
+    parser.add_argument("--waves", type=int, default=5, help="调用方分几批到达")
+    parser.add_argument("--interval", type=float, default=0.1, help="批次间隔（秒）")
+    parser.add_argument("--latency", type=float, default=0.5, help="假模型首token延迟（秒）")
+    parser.add_argument("--result-ttl", type=float, default=0, help="合并后结果的缓存时间（秒）")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "LLM_FACTORY": "benchmarks.fake_llm:create_fake_llm",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": "0",
+        "PROPOSAL_DB_PATH": "",
+        "LLM_RESULT_CACHE_TTL": str(args.result_ttl),
+    })
+
+    from app.config import settings
+    from app.tools.proposal_tool import ProposalTool, proposal_manager
+
+    tool = ProposalTool()
+    proposal = proposal_manager.create_proposal("增加社区每周线上讨论会", "每周组织一次线上技术趋势讨论")
+
+    for enabled in (False, True):
+        settings.LLM_SINGLE_FLIGHT_ENABLED = enabled
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(_herd(tool, proposal.proposal_id, args.callers, args.waves, args.interval))
+        print(f"single_flight={'on ' if enabled else 'off'} callers={result['callers']} "
+              f"upstream_calls={result['upstream_calls']} wall={result['wall_seconds']}s "
+              f"p50={result['p50_ms']}ms max={result['max_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+工具并发测试：验证工具执行期间事件循环保持响应
+
+用一个带固定延迟的替身LLM代替真实模型，并发执行多次 RiskAssessmentTool 和
+ResourceFinderTool，同时测量事件循环的调度延迟。对比旧实现（_arun 直接在
+事件循环上调用同步 _run）与新的异步实现。
+
+用法:
+    python -m benchmarks.bench_tool_concurrency --calls 20 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+import app.tools.risk_assessment as risk_assessment
+from app.tools import ResourceFinderTool, RiskAssessmentTool
+
+_RISK_JSON = '{"自伤或自杀想法": "无风险", "严重焦虑症状": "低风险"}'
+
+
+class _SlowLLM:
+    """同步调用阻塞线程、异步调用让出事件循环的替身LLM"""
+
+    model_name = "slow-llm"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _get_llm_string(self) -> str:
+        return f"{self.model_name}:{self.latency}"
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        return SimpleNamespace(content=_RISK_JSON)
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(content=_RISK_JSON)
+
+
+async def _monitor_loop(stop: asyncio.Event, lags: list, interval: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def _run(calls: int, blocking: bool) -> dict:
+    risk_tool = RiskAssessmentTool()
+    resource_tool = ResourceFinderTool()
+
+    async def call_risk(i):
+        if blocking:
+            return risk_tool._run(f"最近压力很大 {i}")
+        return await risk_tool._arun(f"最近压力很大 {i}")
+
+    async def call_resource(i):
+        if blocking:
+            return resource_tool._run("冥想 焦虑")
+        return await resource_tool._arun("冥想 焦虑")
+
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor_loop(stop, lags))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call_risk(i) for i in range(calls)),
+                         *(call_resource(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    return {"elapsed": elapsed, "max_lag": max(lags) if lags else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工具并发测试")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    risk_assessment.get_specialized_llm = lambda **kwargs: _SlowLLM(args.llm_latency)
+
+    print(f"{'mode':<10}{'elapsed(s)':>12}{'max loop lag(ms)':>18}")
+    results = {}
+    for mode, blocking in (("blocking", True), ("async", False)):
+        results[mode] = asyncio.run(_run(args.calls, blocking))
+        r = results[mode]
+        print(f"{mode:<10}{r['elapsed']:>12.2f}{r['max_lag'] * 1000:>18.1f}")
+
+    # 异步实现下，事件循环的最大延迟应远小于一次LLM调用的耗时
+    assert results["async"]["max_lag"] < args.llm_latency / 2, "event loop was blocked by a tool call"
+    print("OK: event loop stayed responsive while tools were running")
+
+
+if __name__ == "__main__":
+    main()
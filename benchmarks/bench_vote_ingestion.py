@@ -0,0 +1,98 @@
+"""
+投票并发压力测试：验证多线程同时投票时计数精确，并测量吞吐量和内存占用
+
+每个投票者的选票会被多个线程重复提交，最终每个选项的计数必须等于去重后的
+投票者数量。分别测试内存提案、SQLite 提案逐票写入和批量写入。
+
+用法:
+    python -m benchmarks.bench_vote_ingestion --voters 20000 --threads 16 --duplicates 3
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app.models.proposal import Proposal, ProposalManager
+
+
+def _make_ballots(voters: int, duplicates: int, rng: random.Random) -> tuple:
+    votes = {f"user-{i:08d}": rng.choice(("support", "oppose")) for i in range(voters)}
+    ballots = [(voter_id, vote) for voter_id, vote in votes.items() for _ in range(duplicates)]
+    rng.shuffle(ballots)
+    expected = {"support": 0, "oppose": 0}
+    for vote in votes.values():
+        expected[vote] += 1
+    return ballots, expected
+
+
+def _run_threads(ballots: list, threads: int, submit, batch_size: int) -> float:
+    chunks = [ballots[i::threads] for i in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(chunk):
+        barrier.wait()
+        for start in range(0, len(chunk), batch_size):
+            submit(chunk[start:start + batch_size])
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def _check(name: str, votes: dict, expected: dict, elapsed: float, submitted: int) -> None:
+    status = "OK" if votes == expected else f"MISMATCH expected={expected}"
+    print(f"{name:<28}{submitted / elapsed:>14.0f}{str(votes):>40}  {status}")
+    assert votes == expected, f"{name}: {votes} != {expected}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投票并发压力测试")
+    parser.add_argument("--voters", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duplicates", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    ballots, expected = _make_ballots(args.voters, args.duplicates, rng)
+    print(f"voters={args.voters} ballots={len(ballots)} threads={args.threads}")
+    print(f"{'mode':<28}{'ballots/s':>14}{'votes':>40}")
+
+    proposal = Proposal("内存提案", "描述")
+    elapsed = _run_threads(ballots, args.threads, proposal.add_votes, 1)
+    _check("in-memory single", proposal.votes, expected, elapsed, len(ballots))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = ProposalManager(os.path.join(tmp, "proposals.sqlite3"))
+
+        single = manager.create_proposal("逐票提案", "描述")
+        sample = ballots[:max(args.threads, len(ballots) // 10)]
+        sample_expected = {"support": 0, "oppose": 0}
+        for voter_id, vote in dict(sample).items():
+            sample_expected[vote] += 1
+        elapsed = _run_threads(
+            sample, args.threads,
+            lambda chunk: [manager.add_vote(single.proposal_id, v, o) for v, o in chunk], 1
+        )
+        _check("sqlite single (10% sample)", manager.get_proposal(single.proposal_id).votes,
+               sample_expected, elapsed, len(sample))
+
+        batched = manager.create_proposal("批量提案", "描述")
+        elapsed = _run_threads(
+            ballots, args.threads,
+            lambda chunk: manager.add_votes(batched.proposal_id, chunk), args.batch_size
+        )
+        _check(f"sqlite batch={args.batch_size}", manager.get_proposal(batched.proposal_id).votes,
+               expected, elapsed, len(ballots))
+        manager.close()
+
+
+if __name__ == "__main__":
+    main()
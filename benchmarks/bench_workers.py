@@ -0,0 +1,214 @@
+"""
+多进程部署吞吐量测试（使用本地假模型，不需要 OpenAI 密钥）
+
+对每个工作进程数启动一个独立的 uvicorn 服务（会话历史、角色和提案放在共享的
+SQLite 文件中），通过真实的HTTP连接按指定并发发送 /api/chat 请求，报告吞吐量、
+延迟和相对单进程的扩展效率。假模型默认没有延迟，请求耗时主要是本进程的CPU开销，
+吞吐量能否随进程数增长取决于可用的CPU核数（结果中记录了 cpu_count）。
+
+压测结束后会检查共享状态：每个会话在存储中的消息条数必须等于成功请求数的两倍
+（多个进程写同一会话时不丢消息），并检查请求确实分布到了多个工作进程。
+
+用法:
+    python -m benchmarks.bench_workers --workers 1 2 4 --requests 400 --concurrency 32 --output workers.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.bench_chat_api import _MESSAGES, _git_commit, _percentile
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server_env(args, workers: int, data_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "API_WORKERS": str(workers),
+        "LLM_FACTORY": "benchmarks.fake_llm:create_fake_llm",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "fake-key",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_LLM_RESPONSE_TOKENS": str(args.response_tokens),
+        "FAKE_LLM_TOOL_CALL_RATE": str(args.tool_call_rate),
+        "CONVERSATION_STORE": "sqlite",
+        "CONVERSATION_DB_PATH": os.path.join(data_dir, "conversations.sqlite3"),
+        "CONVERSATION_LOCK_DIR": os.path.join(data_dir, "locks"),
+        "PROPOSAL_DB_PATH": os.path.join(data_dir, "proposals.sqlite3"),
+        "RISK_CACHE_DISK_PATH": "",
+        "LOG_LEVEL": "WARNING",
+        "PYTHONPATH": os.getcwd() + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    return env
+
+
+async def _wait_ready(client, process, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("server did not become ready")
+
+
+async def _drive(args, workers: int, port: int) -> dict:
+    import httpx
+
+    conversation_ids = [f"workers-{workers}-{i}" for i in range(args.conversations)]
+    latencies, errors, succeeded = [], 0, {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300, limits=limits) as client:
+        async def one(i: int, conversation_id: str):
+            nonlocal errors
+            payload = {"message": f"请求{i}：{_MESSAGES[i % len(_MESSAGES)]}", "conversation_id": conversation_id}
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/chat", json=payload)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors += 1
+                return
+            latencies.append(elapsed)
+            succeeded[conversation_id] = succeeded.get(conversation_id, 0) + 1
+
+        # 预热：每个工作进程创建执行器、连接等一次性开销不计入结果
+        await asyncio.gather(*(one(-1, f"warmup-{workers}-{i}") for i in range(workers * 4)))
+        latencies.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            one(i, conversation_ids[i % len(conversation_ids)]) for i in range(args.requests)
+        ))
+        wall = time.perf_counter() - started
+
+        # 共享状态检查：不论请求落到哪个进程，会话中的消息都不能丢
+        lost = 0
+        for conversation_id in conversation_ids:
+            count = succeeded.get(conversation_id, 0)
+            response = await client.get(f"/api/conversations/{conversation_id}")
+            messages = response.json() if response.status_code == 200 else []
+            lost += abs(len(messages) - count * 2)
+
+        # 处理请求的工作进程（每次新建连接，由内核分配给不同进程）
+        pids = {
+            (await client.get("/health", headers={"Connection": "close"})).json().get("worker_pid")
+            for _ in range(workers * 8)
+        }
+
+    return {
+        "workers": workers,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2)
+        } if latencies else {},
+        "lost_messages": lost,
+        "distinct_worker_pids": len(pids)
+    }
+
+
+def _run_workers(args, workers: int) -> dict:
+    import httpx
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        port = _free_port()
+        command = [
+            sys.executable, "-m", "uvicorn", "app.api:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log"
+        ]
+        # 服务日志写入文件，启动失败时输出到标准错误
+        log_path = os.path.join(data_dir, "server.log")
+        log = open(log_path, "w", encoding="utf-8")
+        process = subprocess.Popen(command, env=_server_env(args, workers, data_dir),
+                                   stdout=log, stderr=subprocess.STDOUT)
+        try:
+            async def run():
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+                    await _wait_ready(client, process)
+                return await _drive(args, workers, port)
+            return asyncio.run(run())
+        except Exception:
+            log.flush()
+            with open(log_path, "r", encoding="utf-8") as f:
+                sys.stderr.write(f.read()[-4000:])
+            raise
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程部署吞吐量测试")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="依次测试的工作进程数")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--conversations", type=int, default=64, help="请求分布到的会话数")
+    parser.add_argument("--latency", type=float, default=0.0, help="假模型首token延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--tool-call-rate", type=float, default=0.3)
+    parser.add_argument("--output", default=None, help="结果JSON文件路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    runs = []
+    for workers in args.workers:
+        result = _run_workers(args, workers)
+        runs.append(result)
+        print(f"workers={workers} throughput={result['throughput_rps']} rps "
+              f"p50={result['latency_ms'].get('p50')}ms errors={result['errors']} "
+              f"lost={result['lost_messages']} pids={result['distinct_worker_pids']}", file=sys.stderr)
+
+    baseline = next((run["throughput_rps"] for run in runs if run["workers"] == 1), None)
+    for run in runs:
+        if baseline:
+            run["speedup"] = round(run["throughput_rps"] / baseline, 2)
+            run["scaling_efficiency"] = round(run["speedup"] / run["workers"], 2)
+
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "runs": runs
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
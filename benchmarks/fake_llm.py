@@ -0,0 +1,297 @@
+"""
+确定性的本地假聊天模型，用于基准测试和压测，不需要 OpenAI 密钥
+
+- 首token延迟和输出速度可配置，异步调用用 asyncio.sleep 模拟，不占用事件循环
+- 相同输入总是得到相同输出（由最后一条消息的哈希决定）
+- 绑定了 functions 的调用（Agent）按比例返回 function_call，工具结果回来后再给出最终回答
+- 风险评估、消息分析等要求JSON的提示返回可解析的JSON；消息含自杀等字样时风险评估为高风险
+- 返回 token_usage / usage_metadata，便于统计token指标
+- 和 ChatOpenAI 一样经过 app.llm 的自适应并发限制；可设置上游容量，
+  超出容量的并发请求返回 429（openai.RateLimitError，带 Retry-After）
+- 模拟服务端的提示前缀缓存：函数定义和消息按顺序拼接后以固定长度分块，
+  与之前某次调用逐字节相同的前缀计为命中缓存的token（cached_tokens）
+
+通过 LLM_FACTORY=benchmarks.fake_llm:create_fake_llm 启用，参数用环境变量配置:
+    FAKE_LLM_LATENCY            首token延迟（秒），默认 0.2
+    FAKE_LLM_TOKENS_PER_SECOND  输出速度，默认 50，0 表示瞬间完成
+    FAKE_LLM_RESPONSE_TOKENS    每次回答的token数，默认 40
+    FAKE_LLM_TOOL_CALL_RATE     Agent 调用工具的比例（0~1），默认 0.3
+    FAKE_LLM_TOOLS              允许调用的工具名（逗号分隔），默认为空，按内置顺序选择
+    FAKE_LLM_CACHE_BLOCK        前缀缓存的分块长度（字符），默认 256，0 表示不模拟缓存
+    FAKE_LLM_CAPACITY           上游同时处理的请求数上限，默认 0（不限制）
+    FAKE_LLM_RETRY_AFTER        429 响应的 Retry-After（秒），默认 0.5，空表示不返回
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+import openai
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, FunctionMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.llm import AdaptiveLimitMixin
+
+_RISK_RESULT = {
+    "自伤或自杀想法": "无风险",
+    "伤害他人想法": "无风险",
+    "严重抑郁症状": "低风险",
+    "严重焦虑症状": "低风险",
+    "精神病性症状": "无风险",
+    "物质滥用问题": "无风险"
+}
+_HIGH_RISK_RESULT = dict(_RISK_RESULT, **{"自伤或自杀想法": "高风险", "严重抑郁症状": "中风险"})
+_HIGH_RISK_WORDS = ("自杀", "不想活", "结束生命")
+_ANALYSIS_RESULT = {
+    "is_proposal_related": False,
+    "is_counseling_related": True,
+    "primary_type": "counseling",
+    "confidence": 0.9
+}
+_WORDS = ["我", "理解", "你", "的", "感受", "，", "这", "很", "正常", "。", "我们", "可以", "一起", "慢慢", "聊聊"]
+
+# 工具调用时优先选择的函数及参数，均不依赖外部服务
+_PREFERRED_CALLS = [
+    ("role_manager", {"action": "get"}),
+    ("risk_assessment", None),
+    ("proposal_tool", {"action": "list"}),
+]
+
+
+# 所有假模型实例共享的前缀缓存（分块前缀的哈希），有界
+_PREFIX_CACHE_MAX_ENTRIES = 100000
+_prefix_cache: "OrderedDict[bytes, None]" = OrderedDict()
+_prefix_cache_lock = threading.Lock()
+
+# 模拟的上游：所有假模型实例共享容量和计数
+upstream_stats = {"requests": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0}
+_upstream_lock = threading.Lock()
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class FakeUpstreamChatModel(BaseChatModel):
+    """确定性假聊天模型（模拟的上游本身，不经过并发限制）"""
+
+    model_name: str = "fake-chat"
+    latency: float = 0.2
+    tokens_per_second: float = 50.0
+    response_tokens: int = 40
+    tool_call_rate: float = 0.3
+    tool_names: Optional[List[str]] = None
+    cache_block: int = 256
+    capacity: int = 0
+    retry_after: Optional[float] = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _plan(self, messages: List[BaseMessage], functions: Optional[List[Dict]]) -> AIMessage:
+        """决定这次调用返回的消息（不含延迟）"""
+        last = messages[-1] if messages else None
+        text = str(last.content) if last is not None else ""
+        seed = _digest(text)
+
+        if functions and not isinstance(last, (FunctionMessage, ToolMessage)):
+            # 以确定的比例发起一次函数调用
+            if (seed % 1000) / 1000 < self.tool_call_rate:
+                call = self._choose_call(functions, text)
+                if call is not None:
+                    return AIMessage(content="", additional_kwargs={"function_call": call})
+
+        if "primary_type" in text:
+            return AIMessage(content=json.dumps(_ANALYSIS_RESULT, ensure_ascii=False))
+        if "JSON" in text:
+            # 只看提示末尾的用户消息，评估类别的说明里本身就有“自杀”
+            message = text.rsplit("用户消息", 1)[-1]
+            high = any(word in message for word in _HIGH_RISK_WORDS)
+            return AIMessage(content=json.dumps(_HIGH_RISK_RESULT if high else _RISK_RESULT, ensure_ascii=False))
+
+        words = [_WORDS[(seed >> (i % 48)) % len(_WORDS)] for i in range(self.response_tokens)]
+        return AIMessage(content="".join(words))
+
+    def _choose_call(self, functions: List[Dict], text: str) -> Optional[Dict[str, str]]:
+        available = {function.get("name") for function in functions}
+        if self.tool_names is not None:
+            available &= set(self.tool_names)
+        for name, arguments in _PREFERRED_CALLS:
+            if name in available:
+                if arguments is None:
+                    arguments = {"message": text}
+                return {"name": name, "arguments": json.dumps(arguments, ensure_ascii=False)}
+        return None
+
+    @contextmanager
+    def _upstream(self) -> Iterator[None]:
+        """占用模拟上游的一个处理位置，超出容量时抛出 429"""
+        with _upstream_lock:
+            upstream_stats["requests"] += 1
+            if self.capacity and upstream_stats["in_flight"] >= self.capacity:
+                upstream_stats["rejected"] += 1
+                headers = {} if self.retry_after is None else {"retry-after": str(self.retry_after)}
+                request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+                response = httpx.Response(429, headers=headers, request=request)
+                raise openai.RateLimitError("Rate limit exceeded", response=response, body=None)
+            upstream_stats["in_flight"] += 1
+            upstream_stats["max_in_flight"] = max(upstream_stats["max_in_flight"], upstream_stats["in_flight"])
+        try:
+            yield
+        finally:
+            with _upstream_lock:
+                upstream_stats["in_flight"] -= 1
+
+    def _cached_chars(self, messages: List[BaseMessage], functions: Optional[List[Dict]]) -> int:
+        """与之前的调用逐字节相同的最长分块前缀的长度，并记录本次的前缀"""
+        if not self.cache_block:
+            return 0
+        text = json.dumps(functions or [], ensure_ascii=False) + "".join(
+            f"{m.type}:{m.content}\n" for m in messages
+        )
+        block = self.cache_block
+        hasher = hashlib.sha256()
+        cached, hit = 0, True
+        with _prefix_cache_lock:
+            for end in range(block, len(text) + 1, block):
+                hasher.update(text[end - block:end].encode("utf-8"))
+                key = hasher.digest()
+                if hit and key in _prefix_cache:
+                    _prefix_cache.move_to_end(key)
+                    cached = end
+                    continue
+                hit = False
+                _prefix_cache[key] = None
+            while len(_prefix_cache) > _PREFIX_CACHE_MAX_ENTRIES:
+                _prefix_cache.popitem(last=False)
+        return cached
+
+    def _usage(self,
+               messages: List[BaseMessage],
+               message: AIMessage,
+               functions: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 2 + 1
+        completion_tokens = max(1, len(str(message.content)))
+        cached_tokens = min(prompt_tokens, self._cached_chars(messages, functions) // 2)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    def _duration(self, message: AIMessage) -> float:
+        tokens = len(str(message.content)) or 1
+        return self.latency + (tokens / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+    def _result(self,
+                messages: List[BaseMessage],
+                message: AIMessage,
+                functions: Optional[List[Dict]] = None) -> ChatResult:
+        usage = self._usage(messages, message, functions)
+        message.usage_metadata = {
+            "input_tokens": usage["prompt_tokens"],
+            "output_tokens": usage["completion_tokens"],
+            "total_tokens": usage["total_tokens"],
+            "input_token_details": {"cache_read": usage["prompt_tokens_details"]["cached_tokens"]}
+        }
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model_name}
+        )
+
+    def _generate(self,
+                  messages: List[BaseMessage],
+                  stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None,
+                  **kwargs: Any) -> ChatResult:
+        message = self._plan(messages, kwargs.get("functions"))
+        with self._upstream():
+            time.sleep(self._duration(message))
+        return self._result(messages, message, kwargs.get("functions"))
+
+    async def _agenerate(self,
+                         messages: List[BaseMessage],
+                         stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                         **kwargs: Any) -> ChatResult:
+        message = self._plan(messages, kwargs.get("functions"))
+        with self._upstream():
+            await asyncio.sleep(self._duration(message))
+        return self._result(messages, message, kwargs.get("functions"))
+
+    def _stream(self,
+                messages: List[BaseMessage],
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message = self._plan(messages, kwargs.get("functions"))
+        with self._upstream():
+            time.sleep(self.latency)
+            if not message.content:
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", additional_kwargs=message.additional_kwargs))
+                return
+            for char in str(message.content):
+                if self.tokens_per_second:
+                    time.sleep(1 / self.tokens_per_second)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=char))
+                if run_manager:
+                    run_manager.on_llm_new_token(char, chunk=chunk)
+                yield chunk
+
+    async def _astream(self,
+                       messages: List[BaseMessage],
+                       stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._plan(messages, kwargs.get("functions"))
+        with self._upstream():
+            await asyncio.sleep(self.latency)
+            if not message.content:
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", additional_kwargs=message.additional_kwargs))
+                return
+            for char in str(message.content):
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=char))
+                if run_manager:
+                    await run_manager.on_llm_new_token(char, chunk=chunk)
+                yield chunk
+
+
+class FakeChatModel(AdaptiveLimitMixin, FakeUpstreamChatModel):
+    """经过 app.llm 并发限制和重试的假聊天模型，与 LimitedChatOpenAI 对应"""
+
+
+def create_fake_llm(model: str = "fake-chat",
+                    temperature: float = 0.0,
+                    streaming: bool = False,
+                    max_tokens: Optional[int] = None) -> FakeChatModel:
+    """LLM_FACTORY 使用的构造函数，参数与 get_chat_llm_instance 一致"""
+    retry_after = os.getenv("FAKE_LLM_RETRY_AFTER", "0.5")
+    tool_names = os.getenv("FAKE_LLM_TOOLS", "")
+    return FakeChatModel(
+        model_name=f"fake-{model}",
+        latency=float(os.getenv("FAKE_LLM_LATENCY", "0.2")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+        response_tokens=int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "40")),
+        tool_call_rate=float(os.getenv("FAKE_LLM_TOOL_CALL_RATE", "0.3")),
+        tool_names=[name.strip() for name in tool_names.split(",") if name.strip()] or None,
+        cache_block=int(os.getenv("FAKE_LLM_CACHE_BLOCK", "256")),
+        capacity=int(os.getenv("FAKE_LLM_CAPACITY", "0")),
+        retry_after=float(retry_after) if retry_after else None
+    )
@@ -11,12 +11,13 @@ if __name__ == "__main__":
         # 设置环境变量
         settings.setup_environment()
         
-        # 启动服务
+        # 启动服务（多进程时不支持自动重载）
         uvicorn.run(
             "app.api:app",
             host=settings.API_HOST,
             port=settings.API_PORT,
-            reload=settings.DEBUG
+            reload=settings.DEBUG and settings.API_WORKERS <= 1,
+            workers=settings.API_WORKERS
         )
     except Exception as e:
-        print(f"启动失败: {str(e)}")
\ No newline at end of file
+        print(f"启动失败: {str(e)}")
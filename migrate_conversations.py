@@ -0,0 +1,19 @@
+import argparse
+
+from app.config import settings
+from app.storage import SQLiteStore, migrate_json_conversations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把JSON会话文件迁移到SQLite会话存储")
+    parser.add_argument("--source", default=settings.CONVERSATION_DIR, help="JSON会话文件目录")
+    parser.add_argument("--db", default=settings.CONVERSATION_DB_PATH, help="目标SQLite数据库路径")
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+    try:
+        result = migrate_json_conversations(args.source, store)
+    finally:
+        store.close()
+
+    print(f"迁移完成: 会话 {result['migrated']} 个, 消息 {result['messages']} 条, "
+          f"跳过 {result['skipped']} 个, 失败 {result['failed']} 个")
@@ -0,0 +1,17 @@
+"""测试环境：在导入应用模块之前设置环境变量，不访问外部服务"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("LLM_FACTORY", "benchmarks.fake_llm:create_fake_llm")
+os.environ.setdefault("FAKE_LLM_LATENCY", "0")
+os.environ.setdefault("FAKE_LLM_TOKENS_PER_SECOND", "0")
+os.environ.setdefault("PROPOSAL_DB_PATH", "")
+os.environ.setdefault("RISK_CACHE_DISK_PATH", "")
+os.environ.setdefault("ROLE_DB_PATH", "")
+# 应用级的会话存储（app.api 导入时创建）写到临时目录
+os.environ.setdefault("CONVERSATION_DIR", tempfile.mkdtemp(prefix="conversations-"))
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from app.agents.agent import CounselorAgent
+from app.tools.executor import submit_sync_tool
+
+_UNPARSED = {"level": "unknown", "categories": {}, "high_risk_categories": [], "raw": "不是JSON"}
+_HIGH = {"level": "high", "categories": {"自伤或自杀想法": "high"}, "high_risk_categories": ["自伤或自杀想法"]}
+_LOW = {"level": "low", "categories": {"严重焦虑症状": "low"}, "high_risk_categories": []}
+
+
+class _ScriptedRiskTool:
+    """依次返回预设评估结果的替身评估工具"""
+
+    def __init__(self, results, delay=0.0):
+        self.results = list(results)
+        self.delay = delay
+        self.calls = 0
+
+    def assess(self, message):
+        self.calls += 1
+        return dict(self.results.pop(0))
+
+    async def aassess(self, message):
+        await asyncio.sleep(self.delay)
+        return self.assess(message)
+
+
+@pytest.fixture
+def agent():
+    agent = CounselorAgent()
+    agent.risk_preflight = True
+    return agent
+
+
+def _finish(agent, user_input):
+    async def run():
+        task = agent._start_risk_assessment(user_input)
+        return await agent._finish_risk_assessment(task, user_input)
+    return asyncio.run(run())
+
+
+def test_unparsed_assessment_is_retried(agent):
+    agent.risk_tool = _ScriptedRiskTool([_UNPARSED, _HIGH])
+    assessment = _finish(agent, "我撑不下去了")
+    assert assessment["level"] == "high"
+    assert assessment["assessed"] is True
+    assert agent.risk_stats()["retries"] == 1
+
+
+def test_unassessed_message_falls_back_to_crisis_keywords(agent):
+    agent.risk_tool = _ScriptedRiskTool([_UNPARSED, _UNPARSED])
+    assessment = _finish(agent, "我真的不想活了")
+    assert assessment["level"] == "high"
+    assert assessment["assessed"] is False
+    stats = agent.risk_stats()
+    assert stats["unparsed"] == 1
+    assert stats["keyword_overrides"] == 1
+
+    result = agent._apply_risk({"response": "模型回答"}, assessment)
+    assert result["response"] == agent.crisis_response
+
+
+def test_unassessed_message_without_keywords_keeps_answer(agent):
+    agent.risk_tool = _ScriptedRiskTool([_UNPARSED, _UNPARSED])
+    assessment = _finish(agent, "最近睡得不太好")
+    assert assessment["level"] == "unknown"
+    assert assessment["assessed"] is False
+    assert agent._apply_risk({"response": "模型回答"}, assessment)["response"] == "模型回答"
+
+
+def test_timeout_counts_as_unassessed(agent, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "RISK_PREFLIGHT_TIMEOUT", 0.05)
+    agent.risk_tool = _ScriptedRiskTool([_LOW], delay=1)
+    assessment = _finish(agent, "我想自杀")
+    assert assessment["level"] == "high"
+    assert assessment["error"] == "timeout"
+    assert agent.risk_stats()["timeouts"] == 1
+
+
+def test_sync_assessment_is_retried(agent):
+    agent.risk_tool = _ScriptedRiskTool([_UNPARSED, _LOW])
+    future = submit_sync_tool(agent.risk_tool.assess, "最近睡得不太好")
+    assessment = agent._finish_risk_assessment_sync(future, "最近睡得不太好")
+    assert assessment["level"] == "low"
+    assert agent.risk_stats()["retries"] == 1
+
+
+def _install_stream(agent, tokens, closed):
+    async def stream_events(user_input, chat_history, conversation_id):
+        try:
+            yield {"type": "route", "route": "agent"}
+            for token in tokens:
+                await asyncio.sleep(0.01)
+                yield {"type": "token", "content": token}
+            yield {"type": "final", "response": "".join(tokens)}
+        finally:
+            closed.append(True)
+    agent._stream_events = stream_events
+
+
+def _collect(agent, user_input):
+    async def run():
+        return [event async for event in agent.stream_response(user_input, [], "stream-risk")]
+    return asyncio.run(run())
+
+
+def test_high_risk_stream_sends_no_model_tokens(agent):
+    closed = []
+    _install_stream(agent, ["模"] * 20, closed)
+    agent.risk_tool = _ScriptedRiskTool([_HIGH], delay=0.03)
+
+    events = _collect(agent, "我不想活了")
+    assert [event["type"] for event in events] == ["route", "risk", "final"]
+    assert events[-1]["response"] == agent.crisis_response
+    # 主回答在评估结果出来后被停止
+    assert closed == [True]
+
+
+def test_low_risk_stream_releases_held_tokens(agent):
+    closed = []
+    tokens = ["今", "天", "好"]
+    _install_stream(agent, tokens, closed)
+    agent.risk_tool = _ScriptedRiskTool([_LOW], delay=0.015)
+
+    events = _collect(agent, "今天心情一般")
+    assert [event["type"] for event in events] == ["route", "token", "token", "token", "risk", "final"]
+    assert [event["content"] for event in events if event["type"] == "token"] == tokens
+    assert events[-1]["response"] == "今天好"
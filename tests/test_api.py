@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import api
+from app.models.proposal import ProposalManager
+
+
+@pytest.fixture(scope="module")
+def client():
+    # 关闭应用时会关闭提案管理器，换成测试专用的实例，不影响其他测试使用的全局实例
+    original = api.proposal_manager
+    api.proposal_manager = ProposalManager()
+    with TestClient(api.app) as client:
+        yield client
+    api.proposal_manager = original
+
+
+def _events(response):
+    """把SSE响应体解析为 (事件名, 数据) 列表"""
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_tokens_then_done_and_saves_history(client):
+    response = client.post("/api/chat/stream", json={"message": "最近压力很大", "conversation_id": "stream-ok"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _events(response)
+    names = [name for name, _ in events]
+    assert names[:2] == ["start", "route"]
+    assert names[-2:] == ["risk", "done"]
+    assert set(names[2:-2]) == {"token"}
+    tokens = "".join(data["content"] for name, data in events if name == "token")
+    assert events[-1][1]["response"] == tokens
+
+    # 流结束后用户消息和助手消息都已保存
+    history = client.get("/api/conversations/stream-ok").json()
+    assert [(msg["role"], msg["content"]) for msg in history] == [("user", "最近压力很大"), ("assistant", tokens)]
+
+
+def test_stream_error_is_sent_as_event(client, monkeypatch):
+    async def failing_stream(user_input, chat_history, conversation_id=None):
+        yield {"type": "route", "route": "counselor"}
+        raise RuntimeError("upstream unavailable")
+
+    monkeypatch.setattr(api.counselor_agent, "stream_response", failing_stream)
+    response = client.post("/api/chat/stream", json={"message": "最近压力很大", "conversation_id": "stream-error"})
+    assert response.status_code == 200
+
+    events = _events(response)
+    assert [name for name, _ in events] == ["start", "route", "error"]
+    assert "upstream unavailable" in events[-1][1]["detail"]
+    # 出错时不保存助手消息
+    history = client.get("/api/conversations/stream-error").json()
+    assert [msg["role"] for msg in history] == ["user"]
+
+
+def test_batch_endpoint_streams_jsonl(client, monkeypatch):
+    async def generate_response(user_input, chat_history, conversation_id=None):
+        return {"response": f"回答:{user_input}", "route": "counselor", "role": "counselor"}
+
+    monkeypatch.setattr(api.counselor_agent, "generate_response", generate_response)
+
+    def body():
+        # 分块上传，行可能跨块
+        yield '{"message": "一", "conversation_id": "batch-a"}\n{"mess'.encode()
+        yield 'age": "二", "conversation_id": "batch-a"}\n不是JSON\n'.encode()
+
+    response = client.post("/api/chat/batch", content=body())
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
+    assert [result["response"] for result in results if "response" in result] == ["回答:一", "回答:二"]
+    assert "invalid line" in next(result["error"] for result in results if result["index"] == 2)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.batch import BatchRunner, aparse_batch_lines, iter_lines, parse_batch_lines
+from app.database import ConversationMemory
+from app.history import ChatHistoryManager
+from app.storage import JsonFileStore
+
+
+class _FakeAgent:
+    """记录并发数和看到的历史的替身Agent"""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.histories = {}
+
+    async def generate_response(self, user_input, chat_history, conversation_id=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if user_input == "fail":
+                raise RuntimeError("model error")
+            self.histories.setdefault(conversation_id, []).append([msg.content for msg in chat_history])
+            return {"response": f"回答:{user_input}", "route": "counselor", "role": "counselor"}
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def make_runner(tmp_path):
+    memories = []
+
+    def make(agent, **kwargs):
+        memory = ConversationMemory(store=JsonFileStore(str(tmp_path)), shared=False)
+        memories.append(memory)
+        return BatchRunner(agent, memory, ChatHistoryManager(memory, token_budget=0), **kwargs)
+
+    yield make
+    for memory in memories:
+        memory.close()
+
+
+def _lines(*records):
+    return [json.dumps(record, ensure_ascii=False) for record in records]
+
+
+def _run(runner, items):
+    async def collect():
+        return [result async for result in runner.run(items)]
+    return asyncio.run(collect())
+
+
+def test_parse_reports_invalid_lines_in_place():
+    lines = _lines({"message": "你好", "conversation_id": "a"}) + ["", "不是JSON", '{"id": 1}', b"\xff\xfe"]
+    items = list(parse_batch_lines(lines))
+    assert [item["index"] for item in items] == [0, 2, 3, 4]
+    assert items[0]["conversation_id"] == "a" and "error" not in items[0]
+    assert all("invalid line" in item["error"] for item in items[1:])
+
+
+def test_results_keep_conversation_order_and_errors(make_runner):
+    agent = _FakeAgent()
+    runner = make_runner(agent, concurrency=4)
+    lines = _lines(
+        {"message": "一", "conversation_id": "a", "id": "a1"},
+        {"message": "fail", "conversation_id": "b"},
+        {"message": "二", "conversation_id": "a", "id": "a2"},
+    ) + ["坏行"] + _lines({"message": "三", "conversation_id": "a", "id": "a3"})
+    results = _run(runner, parse_batch_lines(lines))
+
+    assert sorted(result["index"] for result in results) == [0, 1, 2, 3, 4]
+    by_index = {result["index"]: result for result in results}
+    assert by_index[1]["error"] == "model error"
+    assert "invalid line" in by_index[3]["error"]
+    # 同一会话按输入顺序处理，后面的消息看到前面的历史
+    assert [result["id"] for result in results if result.get("conversation_id") == "a"] == ["a1", "a2", "a3"]
+    assert agent.histories["a"] == [[], ["一", "回答:一"], ["一", "回答:一", "二", "回答:二"]]
+
+
+def test_concurrency_is_bounded(make_runner):
+    agent = _FakeAgent(delay=0.02)
+    runner = make_runner(agent, concurrency=3)
+    items = parse_batch_lines(_lines(*({"message": "你好", "conversation_id": f"c{i}"} for i in range(12))))
+    results = _run(runner, items)
+    assert len(results) == 12
+    assert agent.max_active == 3
+
+
+def test_rate_limit_spaces_requests(make_runner):
+    rate = 10
+    runner = make_runner(_FakeAgent(delay=0), concurrency=8, rate_limit=rate)
+    items = parse_batch_lines(_lines(*({"message": "你好", "conversation_id": f"c{i}"} for i in range(13))))
+    started = time.monotonic()
+    assert len(_run(runner, items)) == 13
+    # 令牌桶起始有 rate 个令牌，其余 3 条按每秒 rate 个补充
+    assert time.monotonic() - started >= 3 / rate * 0.9
+
+
+def test_input_is_consumed_while_results_are_produced(make_runner):
+    runner = make_runner(_FakeAgent(delay=0), concurrency=2, max_buffered=2)
+    first_result = asyncio.Event()
+    read = []
+
+    async def chunks():
+        yield json.dumps({"message": "一", "conversation_id": "a"}).encode() + b"\n" + b'{"message": "'
+        yield "二".encode() + b'", "conversation_id": "b"}\n'
+        # 没有读完整个输入之前就已经输出了结果
+        await asyncio.wait_for(first_result.wait(), 5)
+        read.append("rest")
+        yield json.dumps({"message": "三", "conversation_id": "a"}).encode()
+
+    async def collect():
+        results = []
+        async for result in runner.run(aparse_batch_lines(iter_lines(chunks()))):
+            results.append(result)
+            first_result.set()
+        return results
+
+    results = asyncio.run(collect())
+    assert read == ["rest"]
+    assert [result["message"] for result in sorted(results, key=lambda r: r["index"])] == ["一", "二", "三"]
@@ -0,0 +1,28 @@
+from app.cache import LRUCache
+
+
+def test_grow_adjusts_size_without_recomputing():
+    calls = []
+    cache = LRUCache(max_bytes=100, sizeof=lambda value: calls.append(value) or len(value))
+    cache.set("a", [1, 2])
+    cache.set("b", [1])
+    assert cache.stats()["bytes"] == 3
+
+    value = cache.peek("a")
+    value.append(3)
+    assert cache.grow("a", 1)
+    assert cache.stats()["bytes"] == 4
+    # 只有两次 set 调用了 sizeof
+    assert len(calls) == 2
+    assert not cache.grow("missing", 1)
+
+
+def test_grow_evicts_least_recently_used():
+    evicted = []
+    cache = LRUCache(max_bytes=10, sizeof=len, on_evict=lambda key, value: evicted.append(key))
+    cache.set("a", "x" * 4)
+    cache.set("b", "x" * 4)
+    # b 变大后总大小超过上限，最久未访问的 a 被淘汰
+    assert cache.grow("b", 4)
+    assert evicted == ["a"]
+    assert "b" in cache
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.concurrency import ConversationGate, DuplicateRequestError, KeyedLock, SingleFlight
+
+
+def test_keyed_lock_serializes_and_cleans_up():
+    locks = KeyedLock()
+    order = []
+
+    async def worker(key, name):
+        async with locks.acquire(key):
+            order.append(f"{name}-start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name}-end")
+
+    async def scenario():
+        await asyncio.gather(worker("a", "first"), worker("a", "second"), worker("b", "other"))
+
+    asyncio.run(scenario())
+    assert order.index("first-end") < order.index("second-start")
+    assert len(locks) == 0
+
+
+def test_queue_policy_runs_same_conversation_in_order():
+    gate = ConversationGate("queue")
+    order = []
+
+    async def call(name):
+        order.append(f"{name}-start")
+        await asyncio.sleep(0.01)
+        order.append(f"{name}-end")
+        return name
+
+    async def scenario():
+        return await asyncio.gather(gate.run("c", "你好", lambda: call("1")),
+                                    gate.run("c", "你好", lambda: call("2")))
+
+    assert asyncio.run(scenario()) == ["1", "2"]
+    assert order == ["1-start", "1-end", "2-start", "2-end"]
+    assert gate.stats()["waited"] == 1
+
+
+def test_reject_policy_raises_for_duplicate():
+    gate = ConversationGate("reject")
+
+    async def scenario():
+        first = asyncio.ensure_future(gate.run("c", "你好", lambda: asyncio.sleep(0.05, "ok")))
+        await asyncio.sleep(0)
+        with pytest.raises(DuplicateRequestError):
+            await gate.run("c", " 你好 ", lambda: asyncio.sleep(0, "dup"))
+        # 内容不同的消息照常排队
+        assert await gate.run("c", "别的消息", lambda: asyncio.sleep(0, "other")) == "other"
+        return await first
+
+    assert asyncio.run(scenario()) == "ok"
+    assert gate.stats()["rejected"] == 1
+
+
+def test_coalesce_policy_shares_result():
+    gate = ConversationGate("coalesce")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "shared"
+
+    async def scenario():
+        return await asyncio.gather(*(gate.run("c", "你好", call) for _ in range(3)))
+
+    assert asyncio.run(scenario()) == ["shared"] * 3
+    assert len(calls) == 1
+    assert gate.stats()["coalesced"] == 2
+
+
+def test_coalesce_waiters_rerun_when_leader_is_cancelled():
+    gate = ConversationGate("coalesce")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.ensure_future(gate.run("c", "你好", call))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(gate.run("c", "你好", call)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        return results
+
+    # 一个等待者重新执行，其余等待者共享它的结果
+    assert asyncio.run(scenario()) == [2, 2, 2]
+    assert len(calls) == 2
+    assert gate.stats()["rerun"] == 3
+
+
+def test_cancelled_coalesce_waiter_does_not_cancel_leader():
+    gate = ConversationGate("coalesce")
+
+    async def scenario():
+        leader = asyncio.ensure_future(gate.run("c", "你好", lambda: asyncio.sleep(0.02, "ok")))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(gate.run("c", "你好", lambda: asyncio.sleep(0, "dup")))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await leader
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_cancelled_waiter_does_not_rerun_when_leader_is_also_cancelled():
+    gate = ConversationGate("coalesce")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.ensure_future(gate.run("c", "你好", call))
+        await asyncio.sleep(0)
+        cancelled = asyncio.ensure_future(gate.run("c", "你好", call))
+        waiter = asyncio.ensure_future(gate.run("c", "你好", call))
+        await asyncio.sleep(0.005)
+        # 原请求和一个等待者同时被取消
+        leader.cancel()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await waiter
+
+    # 只有未被取消的等待者重新执行
+    assert asyncio.run(scenario()) == 2
+    assert len(calls) == 2
+    assert gate.stats()["rerun"] == 1
+
+
+def test_single_flight_executes_identical_calls_once():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("key", call) for _ in range(5)), flight.do("other", call))
+        # 调用结束后没有结果缓存，再次调用会重新执行
+        results.append(await flight.do("key", call))
+        return results
+
+    assert asyncio.run(scenario()) == ["result"] * 7
+    assert len(calls) == 3
+    stats = flight.stats()
+    assert (stats["executions"], stats["shared"], stats["inflight"]) == (3, 4, 0)
+
+
+def test_single_flight_shares_exceptions_without_caching_them():
+    flight = SingleFlight(result_ttl=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await flight.do("key", lambda: asyncio.sleep(0, "ok")) == "ok"
+        # 成功的结果在 TTL 内被缓存
+        assert await flight.do("key", failing) == "ok"
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert flight.stats()["cache_hits"] == 1
+
+
+def test_single_flight_initiator_cancellation_does_not_affect_waiters():
+    flight = SingleFlight()
+
+    async def scenario():
+        initiator = asyncio.ensure_future(flight.do("key", lambda: asyncio.sleep(0.02, "shared")))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", lambda: asyncio.sleep(0, "other")))
+        await asyncio.sleep(0.005)
+        initiator.cancel()
+        return await waiter
+
+    assert asyncio.run(scenario()) == "shared"
+
+
+def test_single_flight_sync_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(4)
+    results = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.05)
+        return "result"
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do_sync("key", call))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 4
+    assert len(calls) == 1
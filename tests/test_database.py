@@ -0,0 +1,114 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.database import ConversationMemory, _estimate_size
+from app.storage import ConversationStore, JournalStore, JsonFileStore
+
+
+def _seed(store, conversation_ids, count=5):
+    for conversation_id in conversation_ids:
+        history = [{"role": "user", "content": f"{conversation_id}-{i}"} for i in range(count)]
+        store.append(conversation_id, history, history)
+
+
+@pytest.mark.parametrize("store_class", [JsonFileStore, JournalStore])
+def test_concurrent_append_with_eviction_keeps_all_messages(tmp_path, store_class):
+    """并发追加的同时会话被淘汰，已确认的消息不能丢失（内存和存储中都不能）"""
+    for run in range(50):
+        store = store_class(str(tmp_path / f"run{run}"))
+        _seed(store, "abc")
+        memory = ConversationMemory(store=store, max_entries=1, max_bytes=0, idle_ttl=0, shared=False)
+
+        async def scenario():
+            await asyncio.gather(*(
+                memory.aadd_message(conversation_id, {"role": "user", "content": f"new-{i}"})
+                for i, conversation_id in enumerate("abcabc")
+            ))
+            await memory.aflush()
+
+        asyncio.run(scenario())
+        in_memory = [len(memory.get_conversation(conversation_id)) for conversation_id in "abc"]
+        on_disk = [len(store.load(conversation_id)) for conversation_id in "abc"]
+        memory.close()
+        assert in_memory == [7, 7, 7], f"run {run}"
+        assert on_disk == [7, 7, 7], f"run {run}"
+
+
+class _BlockingStore(ConversationStore):
+    """内存中的存储，第一次写入会阻塞到 release 被设置"""
+
+    def __init__(self):
+        self.data = {}
+        self.release = threading.Event()
+        self.writing = threading.Event()
+        self._first = True
+
+    def load(self, conversation_id):
+        messages = self.data.get(conversation_id)
+        return list(messages) if messages is not None else None
+
+    def append(self, conversation_id, messages, history):
+        if self._first:
+            self._first = False
+            self.writing.set()
+            self.release.wait(5)
+        self.data.setdefault(conversation_id, []).extend(messages)
+
+    def list_conversations(self):
+        return list(self.data)
+
+
+def test_wait_returns_only_after_message_is_persisted():
+    """其他线程正在写入同一会话时，aadd_message(wait=True) 要等本条消息写入后才返回"""
+    store = _BlockingStore()
+    memory = ConversationMemory(store=store, shared=False)
+    writer = threading.Thread(target=memory.add_message, args=("c", {"role": "user", "content": "first"}))
+    writer.start()
+    assert store.writing.wait(5)
+
+    async def scenario():
+        task = asyncio.ensure_future(memory.aadd_message("c", {"role": "user", "content": "second"}, wait=True))
+        done, _ = await asyncio.wait([task], timeout=0.2)
+        assert not done, "returned while the message was not yet persisted"
+        store.release.set()
+        await task
+
+    asyncio.run(scenario())
+    writer.join(5)
+    assert [message["content"] for message in store.data["c"]] == ["first", "second"]
+    memory.close()
+
+
+def test_cached_size_tracks_appends(tmp_path):
+    """追加消息后缓存中的大小估算与整个会话重新计算的结果一致"""
+    memory = ConversationMemory(store=JsonFileStore(str(tmp_path)), shared=False)
+    for i in range(5):
+        memory.add_message("c", {"role": "user", "content": "消息" * (i + 1)})
+    history = memory.get_conversation("c")
+    assert memory.cache_stats()["bytes"] == _estimate_size(history)
+    memory.close()
+
+
+def test_json_store_concurrent_writers_use_separate_temp_files(tmp_path):
+    store = JsonFileStore(str(tmp_path))
+    errors = []
+
+    def write(n):
+        try:
+            for i in range(50):
+                history = [{"role": "user", "content": f"{n}-{i}"}]
+                store.append("c", history, history)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(store.load("c")) == 1
+    assert sorted(os.listdir(tmp_path)) == ["c.json"]
@@ -0,0 +1,52 @@
+from app.config import settings
+from app.history import ChatHistoryManager
+
+
+class _DictMemory:
+    """只提供 get_conversation 的会话存储替身"""
+
+    def __init__(self):
+        self.conversations = {}
+
+    def get_conversation(self, conversation_id):
+        return self.conversations.setdefault(conversation_id, [])
+
+
+def _message(role, content, timestamp):
+    return {"role": role, "content": content, "timestamp": timestamp}
+
+
+def test_reloaded_conversation_reuses_window():
+    memory = _DictMemory()
+    memory.conversations["c"] = [_message("user", "你好", "t1"), _message("assistant", "你好，有什么想聊的？", "t2")]
+    manager = ChatHistoryManager(memory, token_budget=0)
+    first = manager.get_window("c")
+
+    # 会话被淘汰后从存储重新加载：内容相同但是新的列表对象
+    memory.conversations["c"] = [dict(msg) for msg in memory.conversations["c"]] + [_message("user", "最近很累", "t3")]
+    second = manager.get_window("c")
+    assert [msg.content for msg in second] == ["你好", "你好，有什么想聊的？", "最近很累"]
+    assert second[0] is first[0]
+
+
+def test_rewritten_conversation_rebuilds_window():
+    memory = _DictMemory()
+    memory.conversations["c"] = [_message("user", "旧消息", "t1")]
+    manager = ChatHistoryManager(memory, token_budget=0)
+    manager.get_window("c")
+
+    memory.conversations["c"] = [_message("user", "新消息", "t9"), _message("assistant", "回答", "t10")]
+    assert [msg.content for msg in manager.get_window("c")] == ["新消息", "回答"]
+
+
+def test_window_cache_is_bounded_by_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_CACHE_MAX_BYTES", 64 * 1024)
+    memory = _DictMemory()
+    manager = ChatHistoryManager(memory, token_budget=0)
+    for i in range(50):
+        memory.conversations[f"c{i}"] = [_message("user", "长" * 2000, f"t{j}") for j in range(3)]
+        manager.get_window(f"c{i}")
+
+    stats = manager.stats()
+    assert stats["bytes"] <= 64 * 1024
+    assert stats["entries"] < 50
@@ -0,0 +1,34 @@
+from app.database import ConversationMemory
+from app.storage import JournalStore
+
+
+def _message(i):
+    return {"role": "user", "content": f"消息{i}"}
+
+
+def test_per_conversation_state_does_not_grow_with_conversations(tmp_path):
+    store = JournalStore(str(tmp_path), compact_interval=0, lock_stripes=8)
+    memory = ConversationMemory(store=store, max_entries=10, max_bytes=0, idle_ttl=0, shared=False)
+    for i in range(200):
+        memory.add_message(f"c{i}", _message(i))
+
+    assert len(store._locks) == 8
+    # 只保留仍在内存缓存中的会话的日志行数
+    assert len(store._journal_lines) <= 10
+    assert [msg["content"] for msg in store.load("c0")] == ["消息0"]
+    memory.close()
+
+
+def test_evicted_conversation_is_recounted_on_load(tmp_path):
+    store = JournalStore(str(tmp_path), compact_interval=0, compact_threshold=3)
+    store.append("c", [_message(0), _message(1)], [])
+    store.evict("c")
+    assert "c" not in store._journal_lines
+
+    assert len(store.load("c")) == 2
+    store.append("c", [_message(2)], [])
+    # 重新统计后达到阈值，压缩把日志合并进快照
+    assert store.compact_pending() == 1
+    assert "c" not in store._journal_lines
+    assert [msg["content"] for msg in store.load("c")] == ["消息0", "消息1", "消息2"]
+    store.close()
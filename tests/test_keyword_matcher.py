@@ -0,0 +1,16 @@
+from utils.keyword_matcher import KeywordMatcher, fold_case
+
+
+def test_matches_are_case_insensitive_and_overlapping():
+    matcher = KeywordMatcher({"a": ["Stress", "压力"], "b": ["压力大"]})
+    matches = matcher.find_all("最近STRESS很多，压力大")
+    assert [(m.keyword, m.categories) for m in matches] == [("stress", ("a",)), ("压力", ("a",)), ("压力大", ("b",))]
+    assert matcher.count_by_category(matches) == {"a": 2, "b": 1}
+
+
+def test_positions_refer_to_original_text_when_lowercase_expands():
+    text = "İİ 焦虑 anxiety"
+    matcher = KeywordMatcher({"counseling": ["焦虑", "anxiety"]})
+    assert len(fold_case(text)) == len(text)
+    for match in matcher.find_all(text):
+        assert fold_case(text[match.start:match.end]) == match.keyword
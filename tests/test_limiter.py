@@ -0,0 +1,113 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.concurrency import AdaptiveLimiter, OverloadedError
+
+
+def test_waiters_are_granted_in_arrival_order():
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=10)
+    order = []
+
+    async def worker(name):
+        await limiter.acquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(None)
+
+    async def scenario():
+        await asyncio.gather(*(worker(i) for i in range(4)))
+
+    asyncio.run(scenario())
+    assert order == [0, 1, 2, 3]
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["queued"]) == (0, 0)
+
+
+def test_full_queue_sheds_immediately():
+    limiter = AdaptiveLimiter(initial_limit=1, max_queue=1, queue_timeout=5)
+
+    async def scenario():
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        limiter.release(None)
+        await queued
+        limiter.release(None)
+
+    asyncio.run(scenario())
+    assert limiter.stats()["shed"] == 1
+
+
+def test_queue_timeout_and_cancellation_leave_no_waiters():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=0.02)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        cancelled = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        limiter.release(None)
+
+    asyncio.run(scenario())
+    stats = limiter.stats()
+    assert (stats["in_flight"], stats["queued"], stats["queue_timeouts"]) == (0, 0, 1)
+
+
+def test_additive_increase_only_when_saturated():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+    limiter.acquire_sync()
+    limiter.release("success", 0.01)
+    # 并发没有用满，限制不变
+    assert limiter.limit == 2
+
+    limiter.acquire_sync()
+    limiter.acquire_sync()
+    limiter.release("success", 0.01)
+    assert limiter.limit == pytest.approx(2.5)
+    limiter.release("success", 0.01)
+
+
+def test_multiplicative_decrease_once_per_round():
+    limiter = AdaptiveLimiter(initial_limit=16, min_limit=2)
+    for _ in range(4):
+        limiter.acquire_sync()
+    # 同一批并发调用同时过载，只减小一次
+    for _ in range(4):
+        limiter.release("overload")
+    assert limiter.limit == 8
+    assert limiter.stats()["overloads"] == 4
+
+    limiter._last_decrease = 0.0
+    limiter.acquire_sync()
+    limiter.release("overload")
+    limiter._last_decrease = 0.0
+    limiter.acquire_sync()
+    limiter.release("overload")
+    assert limiter.limit == 2
+
+
+def test_sync_waiter_is_woken_by_release():
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=5)
+    limiter.acquire_sync()
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.acquire_sync()
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release("success", 0.01)
+    assert acquired.wait(5)
+    thread.join()
+    limiter.release(None)
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,95 @@
+import threading
+
+from app.models.proposal import Proposal, ProposalManager
+
+
+def test_concurrent_votes_are_counted_once():
+    proposal = Proposal("并发", "描述")
+    ballots = [(f"user-{i % 500}", "support" if i % 2 else "oppose") for i in range(4000)]
+    threads = [threading.Thread(target=proposal.add_votes, args=(ballots[i::8],)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(proposal.votes.values()) == 500
+    assert len(proposal.voters) == 500
+
+
+def test_managed_proposal_has_no_in_memory_voters():
+    manager = ProposalManager()
+    proposal = manager.create_proposal("提案", "描述")
+    assert proposal.voters is None
+    assert proposal.add_vote("alice", "support")
+    assert proposal.has_voted("alice")
+    assert manager.get_proposal(proposal.proposal_id).has_voted("alice")
+    assert not proposal.has_voted("bob")
+    manager.close()
+
+
+def test_votes_on_closed_proposal_do_not_intern_voters():
+    manager = ProposalManager()
+    proposal = manager.create_proposal("提案", "描述")
+    proposal.close_proposal()
+    assert manager.add_votes(proposal.proposal_id, [("alice", "support"), ("bob", "oppose")]) == [False, False]
+    assert manager._conn.execute("SELECT COUNT(*) FROM voters").fetchone()[0] == 0
+    manager.close()
+
+
+def _paged_manager(count):
+    manager = ProposalManager()
+    ids = [manager.create_proposal(f"提案{i}", "描述").proposal_id for i in range(count)]
+    return manager, ids
+
+
+def test_pages_cover_all_proposals_once():
+    manager, ids = _paged_manager(7)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = manager.list_proposals_page(limit=3, cursor=cursor)
+        seen.extend(p["proposal_id"] for p in page)
+        pages += 1
+        if cursor is None:
+            break
+    assert seen == ids
+    assert pages == 3
+    manager.close()
+
+
+def test_exact_page_has_no_next_cursor():
+    manager, ids = _paged_manager(6)
+    page, cursor = manager.list_proposals_page(limit=3)
+    assert cursor is not None
+    page, cursor = manager.list_proposals_page(limit=3, cursor=cursor)
+    assert [p["proposal_id"] for p in page] == ids[3:]
+    assert cursor is None
+    # 越过末尾的游标得到空页
+    assert manager.list_proposals_page(limit=3, cursor=10 ** 6) == ([], None)
+    manager.close()
+
+
+def test_page_limit_is_clamped():
+    manager, ids = _paged_manager(3)
+    for limit in (0, -5):
+        page, cursor = manager.list_proposals_page(limit=limit)
+        assert [p["proposal_id"] for p in page] == ids[:1]
+        assert cursor is not None
+    manager.close()
+
+
+def test_tool_rejects_invalid_paging_arguments(monkeypatch):
+    from app.tools import proposal_tool
+
+    manager, ids = _paged_manager(5)
+    monkeypatch.setattr(proposal_tool, "proposal_manager", manager)
+    monkeypatch.setattr(proposal_tool.settings, "PROPOSAL_PAGE_SIZE", 2)
+    tool = proposal_tool.ProposalTool()
+
+    assert "limit 必须是整数" in tool._run("list", limit="abc")
+    assert "无效的游标" in tool._run("list", cursor="next")
+    assert "无效的游标" in tool._run("list", cursor=-1)
+    # 超过每页上限时按上限返回
+    text = tool._run("list", limit=100)
+    assert ids[1] in text and ids[2] not in text
+    assert "cursor=" in text
+    assert tool._run("list", cursor="999999") == "没有更多提案"
+    manager.close()
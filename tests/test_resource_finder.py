@@ -0,0 +1,73 @@
+import json
+import os
+
+from app.tools.resource_finder import ResourceFinderTool
+from app.tools.resource_index import BM25Index, tokenize
+
+
+def _write(path, resources):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(resources, f, ensure_ascii=False)
+
+
+def _resources(*apps):
+    return {"crisis_lines": [], "self_help": [], "professional_services": [], "apps": list(apps)}
+
+
+def test_single_character_query_matches():
+    index = BM25Index([("apps", {"name": "睡眠助手", "description": "改善失眠"}),
+                       ("apps", {"name": "正念冥想", "description": "呼吸练习"})])
+    results = index.search("睡", 5)
+    assert [item["name"] for _, _, item in results] == ["睡眠助手"]
+    # 多字查询只用二元组
+    assert tokenize("失眠") == ["失眠"]
+
+
+def test_changed_file_is_reindexed_in_background(tmp_path):
+    path = os.path.join(tmp_path, "resources.json")
+    _write(path, _resources({"name": "正念冥想App", "description": "引导式冥想"}))
+    tool = ResourceFinderTool(resource_path=path)
+    old_index = tool.index
+
+    _write(path, _resources({"name": "正念冥想App", "description": "引导式冥想"},
+                            {"name": "睡眠改善助手", "description": "帮助改善失眠的应用"}))
+    os.utime(path, ns=(0, 1))
+    tool._run("失眠")
+    tool.wait_for_reload(5)
+
+    assert tool.index is not old_index
+    assert tool.reload_thread is None
+    assert "睡眠改善助手" in tool._run("失眠")
+
+
+def test_invalid_file_keeps_previous_index(tmp_path):
+    path = os.path.join(tmp_path, "resources.json")
+    _write(path, _resources({"name": "睡眠改善助手", "description": "帮助改善失眠的应用"}))
+    tool = ResourceFinderTool(resource_path=path)
+    old_index = tool.index
+
+    # 写了一半的文件
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"apps": [{"name": "半')
+    os.utime(path, ns=(0, 1))
+    tool._run("失眠")
+    tool.wait_for_reload(5)
+    assert tool.index is old_index
+    assert "睡眠改善助手" in tool._run("失眠")
+    # 同一个损坏的版本不会反复重新加载
+    assert not tool._is_stale()
+
+    _write(path, _resources({"name": "正念冥想App", "description": "缓解失眠的冥想"}))
+    os.utime(path, ns=(0, 2))
+    tool._run("失眠")
+    tool.wait_for_reload(5)
+    assert "正念冥想App" in tool._run("失眠")
+
+
+def test_unreadable_file_on_first_load_gives_empty_index(tmp_path):
+    path = os.path.join(tmp_path, "resources.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("not json")
+    tool = ResourceFinderTool(resource_path=path)
+    assert len(tool.index) == 0
+    assert "未找到" in tool._run("失眠")
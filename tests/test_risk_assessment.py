@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.tools.risk_assessment as risk_assessment
+from app.tools.risk_assessment import RiskAssessmentTool
+from app.tools.risk_cache import risk_cache
+
+
+class _ScriptedLLM:
+    """依次返回预设输出的替身模型"""
+
+    model_name = "scripted"
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.calls = 0
+
+    def _get_llm_string(self):
+        return f"scripted-{id(self)}"
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(content=self.outputs.pop(0))
+
+    async def ainvoke(self, prompt):
+        return self.invoke(prompt)
+
+
+@pytest.fixture
+def scripted_llm(monkeypatch):
+    def install(*outputs):
+        llm = _ScriptedLLM(outputs)
+        monkeypatch.setattr(risk_assessment, "get_specialized_llm", lambda **kwargs: llm)
+        return llm
+    return install
+
+
+def test_parse_levels():
+    assessment = RiskAssessmentTool._parse_assessment('{"自伤或自杀想法": "高风险", "严重焦虑症状": "低风险"}')
+    assert assessment["level"] == "high"
+    assert assessment["high_risk_categories"] == ["自伤或自杀想法"]
+
+
+def test_unparseable_result_is_not_cached(scripted_llm):
+    llm = scripted_llm("不是JSON", '{"自伤或自杀想法": "高风险"}', '{"自伤或自杀想法": "无风险"}')
+    tool = RiskAssessmentTool()
+    message = "test_unparseable_result_is_not_cached 我不想活了"
+
+    first = tool.assess(message)
+    assert first["level"] == "unknown"
+    # 解析失败的结果没有进入缓存，下一次重新评估
+    second = tool.assess(message)
+    assert second["level"] == "high"
+    # 明确的结果被缓存
+    assert tool.assess(message)["level"] == "high"
+    assert llm.calls == 2
+
+
+def test_async_unparseable_result_is_not_cached(scripted_llm):
+    llm = scripted_llm("不是JSON", '{"自伤或自杀想法": "中风险"}')
+    tool = RiskAssessmentTool()
+    message = "test_async_unparseable_result_is_not_cached"
+
+    assert asyncio.run(tool.aassess(message))["level"] == "unknown"
+    assert asyncio.run(tool.aassess(message))["level"] == "medium"
+    assert asyncio.run(tool.aassess(message))["level"] == "medium"
+    assert llm.calls == 2
+
+
+def test_cached_unknown_entry_is_ignored(scripted_llm):
+    llm = scripted_llm('{"自伤或自杀想法": "低风险"}')
+    tool = RiskAssessmentTool()
+    message = "test_cached_unknown_entry_is_ignored"
+    risk_cache.set(risk_cache.make_key(message, llm.model_name),
+                   '{"level": "unknown", "categories": {}, "high_risk_categories": [], "raw": "x"}')
+
+    assert tool.assess(message)["level"] == "low"
+    assert llm.calls == 1
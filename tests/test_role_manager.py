@@ -0,0 +1,36 @@
+import os
+
+from app.config import settings
+from app.tools.role_manager import AgentRole, RoleStore
+
+
+def test_role_survives_restart(tmp_path):
+    path = os.path.join(tmp_path, "roles.sqlite3")
+    store = RoleStore(path)
+    store.set_role("c", AgentRole.PROPOSAL_EVALUATOR)
+    store.close()
+
+    reopened = RoleStore(path)
+    assert reopened.get_role("c") == AgentRole.PROPOSAL_EVALUATOR
+    assert reopened.get_role("other") == RoleStore.DEFAULT_ROLE
+    reopened.close()
+
+
+def test_role_survives_cache_eviction(monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_CACHE_MAX_ENTRIES", 2)
+    store = RoleStore()
+    store.set_role("c0", AgentRole.PROPOSAL_EVALUATOR)
+    for i in range(1, 5):
+        store.set_role(f"c{i}", AgentRole.COUNSELOR)
+    assert store.get_role("c0") == AgentRole.PROPOSAL_EVALUATOR
+    store.close()
+
+
+def test_shared_store_sees_other_process_switch(tmp_path):
+    path = os.path.join(tmp_path, "roles.sqlite3")
+    first, second = RoleStore(path, shared=True), RoleStore(path, shared=True)
+    assert first.get_role("c") == AgentRole.COUNSELOR
+    second.set_role("c", AgentRole.PROPOSAL_EVALUATOR)
+    assert first.get_role("c") == AgentRole.PROPOSAL_EVALUATOR
+    first.close()
+    second.close()
@@ -0,0 +1,87 @@
+import asyncio
+
+import utils.message_analyzer as message_analyzer
+from app.agents.router import MessageRouter, ROUTE_AGENT, ROUTE_COUNSELOR
+
+
+class _FailingLLM:
+    model_name = "failing"
+
+    def _get_llm_string(self):
+        return "failing"
+
+    async def ainvoke(self, prompt):
+        raise RuntimeError("upstream unavailable")
+
+    def invoke(self, prompt):
+        raise RuntimeError("upstream unavailable")
+
+
+def test_llm_failure_is_counted(monkeypatch):
+    monkeypatch.setattr(message_analyzer, "get_specialized_llm", lambda **kwargs: _FailingLLM())
+    router = MessageRouter(use_llm=True)
+    # 两类关键词都命中，交给LLM判断
+    decision = asyncio.run(router.route("关于这个提案我很焦虑"))
+    assert decision["route"] == ROUTE_AGENT
+    assert router.stats()["llm_failures"] == 1
+
+
+def test_crisis_messages_go_to_agent():
+    router = MessageRouter(use_llm=False)
+    decision = asyncio.run(router.route("我很痛苦，想自杀"))
+    assert decision["route"] == ROUTE_AGENT
+    assert decision["source"] == "crisis"
+    assert router.stats()["crisis_decisions"] == 1
+
+
+def test_role_switch_in_counseling_message_goes_to_agent():
+    router = MessageRouter(use_llm=False)
+    assert asyncio.run(router.route("最近压力很大，请切换到提案评估者角色"))["route"] == ROUTE_AGENT
+    assert asyncio.run(router.route("最近压力很大"))["route"] == ROUTE_COUNSELOR
+
+
+def test_direct_chain_follows_conversation_role():
+    from app.agents.agent import CounselorAgent
+    from app.tools.role_manager import AgentRole, role_store
+
+    agent = CounselorAgent()
+    role_store.set_role("role-test", AgentRole.PROPOSAL_EVALUATOR)
+    decision = {"route": ROUTE_COUNSELOR}
+    assert agent._direct_chain_for(decision, "role-test") is agent.direct_chains[AgentRole.PROPOSAL_EVALUATOR]
+    assert agent._direct_chain_for(decision, "other") is agent.direct_chains[AgentRole.COUNSELOR]
+    assert agent._direct_chain_for({"route": ROUTE_AGENT}, "other") is None
+
+
+class _StubExecutor:
+    def __init__(self, output):
+        self.output = output
+
+    def invoke(self, inputs):
+        return {"output": self.output}
+
+
+def test_sync_response_is_routed_by_conversation_role():
+    from app.agents.agent import CounselorAgent
+    from app.tools.role_manager import AgentRole, role_store
+
+    agent = CounselorAgent()
+    agent.risk_preflight = False
+    agent.executors = {AgentRole.COUNSELOR: _StubExecutor("咨询师"),
+                       AgentRole.PROPOSAL_EVALUATOR: _StubExecutor("评估者")}
+    role_store.set_role("sync-role", AgentRole.PROPOSAL_EVALUATOR)
+
+    # 需要提案工具的消息交给当前角色的Agent
+    result = agent.generate_response_sync("帮我列出所有提案", conversation_id="sync-role")
+    assert result["response"] == "评估者"
+    assert (result["route"], result["role"]) == (ROUTE_AGENT, "proposal_evaluator")
+    assert agent.generate_response_sync("帮我列出所有提案", conversation_id="other")["response"] == "咨询师"
+
+
+def test_sync_route_matches_async_route(monkeypatch):
+    monkeypatch.setattr(message_analyzer, "get_specialized_llm", lambda **kwargs: _FailingLLM())
+    router = MessageRouter(use_llm=True)
+    for message in ["最近压力很大", "帮我列出所有提案", "我很痛苦，想自杀", "关于这个提案我很焦虑"]:
+        expected = asyncio.run(router.route(message))
+        actual = router.route_sync(message)
+        assert (actual["route"], actual["source"]) == (expected["route"], expected["source"])
+    assert router.stats()["llm_failures"] == 2
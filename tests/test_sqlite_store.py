@@ -0,0 +1,64 @@
+import gc
+import sqlite3
+import threading
+
+import pytest
+
+from app.storage import SQLiteStore
+
+
+def _message(i):
+    return {"role": "user", "content": f"消息{i}", "timestamp": f"2024-01-01T00:00:{i:02d}"}
+
+
+def test_close_closes_reader_connections_of_all_threads(tmp_path):
+    store = SQLiteStore(str(tmp_path / "conversations.sqlite3"))
+    store.append("c", [_message(0)], [])
+    connections = []
+    loaded = threading.Barrier(5)
+    release = threading.Event()
+
+    def reader():
+        store.load("c")
+        connections.append(store._local.conn)
+        loaded.wait()
+        release.wait(5)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    loaded.wait()
+    assert len(store._readers) == 4
+
+    store.close()
+    release.set()
+    for thread in threads:
+        thread.join()
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    with pytest.raises(RuntimeError):
+        store.load("c")
+
+
+def test_finished_threads_release_their_connections(tmp_path):
+    store = SQLiteStore(str(tmp_path / "conversations.sqlite3"))
+    store.append("c", [_message(0)], [])
+    threads = [threading.Thread(target=store.load, args=("c",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+    assert len(store._readers) == 0
+    assert len(store.load("c")) == 1
+    store.close()
+
+
+def test_messages_load_in_insertion_order(tmp_path):
+    store = SQLiteStore(str(tmp_path / "conversations.sqlite3"))
+    # 另一个进程的时钟较慢，后写入的消息时间戳反而更早
+    store.append("c", [_message(30)], [])
+    store.append("c", [_message(10)], [])
+    assert [message["content"] for message in store.load("c")] == ["消息30", "消息10"]
+    store.close()
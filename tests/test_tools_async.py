@@ -0,0 +1,71 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import app.tools.risk_assessment as risk_assessment
+from app.tools.executor import run_sync_tool
+from app.tools.risk_assessment import RiskAssessmentTool
+from app.tools.role_manager import AgentRole, RoleManagerTool, current_conversation_id, role_store
+
+
+def _loop_lag(coro_factory, count):
+    """并发执行 count 个调用，返回期间事件循环的最大调度延迟"""
+    async def scenario():
+        lag = 0.0
+        done = False
+
+        async def probe():
+            nonlocal lag
+            while not done:
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lag = max(lag, time.perf_counter() - start - 0.005)
+
+        monitor = asyncio.ensure_future(probe())
+        results = await asyncio.gather(*(coro_factory(i) for i in range(count)))
+        done = True
+        await monitor
+        return results, lag
+
+    return asyncio.run(scenario())
+
+
+def test_sync_tools_run_off_the_event_loop():
+    results, lag = _loop_lag(lambda i: run_sync_tool(time.sleep, 0.05), 4)
+    assert len(results) == 4
+    assert lag < 0.04
+
+
+def test_tool_thread_keeps_conversation_context():
+    tool = RoleManagerTool()
+
+    async def scenario():
+        current_conversation_id.set("async-tool-context")
+        return await tool._arun("switch", role="proposal_evaluator")
+
+    assert asyncio.run(scenario()) == {"current_role": AgentRole.PROPOSAL_EVALUATOR.value}
+    assert role_store.get_role("async-tool-context") == AgentRole.PROPOSAL_EVALUATOR
+
+
+class _SlowAsyncLLM:
+    """异步调用不阻塞事件循环、同步调用会阻塞的替身模型"""
+
+    model_name = "slow-async"
+
+    def _get_llm_string(self):
+        return "slow-async"
+
+    def invoke(self, prompt):
+        raise AssertionError("_arun must not use the blocking invoke")
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(content='{"严重焦虑症状": "低风险"}')
+
+
+def test_risk_tool_awaits_the_llm(monkeypatch):
+    monkeypatch.setattr(risk_assessment, "get_specialized_llm", lambda **kwargs: _SlowAsyncLLM())
+    tool = RiskAssessmentTool()
+    results, lag = _loop_lag(lambda i: tool._arun(f"test_risk_tool_awaits_the_llm {i}"), 4)
+    assert all("未检测到高风险信号" in result for result in results)
+    assert lag < 0.04
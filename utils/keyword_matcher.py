@@ -0,0 +1,131 @@
+from collections import deque
+import re
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+
+class KeywordMatch(NamedTuple):
+    """一次关键词命中"""
+    start: int                  # 在消息中的起始位置
+    end: int                    # 结束位置（不含）
+    keyword: str                # 命中的关键词（小写）
+    categories: Tuple[str, ...]  # 关键词所属的类别
+
+
+def fold_case(text: str) -> str:
+    """不区分大小写匹配用的小写化，保证结果与原文等长，命中位置可以直接对应原文
+
+    str.lower() 会把个别字符（如 "İ"）变成两个字符，这些字符保持原样。
+    """
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(low if len(low) == 1 else char for char, low in ((char, char.lower()) for char in text))
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多模式关键词匹配器
+
+    在构造时把所有类别的关键词编译成一个自动机，之后对任意消息只需扫描一遍，
+    就能得到所有类别的全部命中（包括重叠的命中）。匹配不区分大小写。
+    """
+
+    def __init__(self, keywords_by_category: Dict[str, Iterable[str]]):
+        self.categories = tuple(keywords_by_category)
+
+        # 关键词 -> 所属类别（同一关键词可能属于多个类别）
+        keyword_categories: Dict[str, List[str]] = {}
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                keyword = fold_case(keyword)
+                if not keyword:
+                    continue
+                owners = keyword_categories.setdefault(keyword, [])
+                if category not in owners:
+                    owners.append(category)
+
+        self._keywords = list(keyword_categories)
+        self._keyword_categories = [tuple(keyword_categories[k]) for k in self._keywords]
+
+        # 状态转移表、失败指针和每个状态的输出（关键词下标）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for index, keyword in enumerate(self._keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(index)
+
+        self._build_failure_links()
+
+        # 所有关键词首字符组成的字符类
+        first_chars = "".join(sorted(self._goto[0]))
+        self._skip_pattern = re.compile(f"[{re.escape(first_chars)}]" if first_chars else r"(?!)")
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+
+                # 合并失败链上的输出，匹配时无需再沿失败指针回溯
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """返回消息中所有关键词命中，按结束位置排序"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        skip = self._skip_pattern.search
+
+        text = fold_case(text)
+        length = len(text)
+        matches = []
+        state = 0
+        position = 0
+        while position < length:
+            if not state:
+                # 在根状态时用正则（C实现）直接跳到下一个可能开始关键词的字符
+                found = skip(text, position)
+                if found is None:
+                    break
+                position = found.start()
+
+            char = text[position]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for index in output[state]:
+                keyword = self._keywords[index]
+                matches.append(KeywordMatch(
+                    position + 1 - len(keyword),
+                    position + 1,
+                    keyword,
+                    self._keyword_categories[index]
+                ))
+            position += 1
+        return matches
+
+    def count_by_category(self, matches: List[KeywordMatch]) -> Dict[str, int]:
+        """统计每个类别的命中次数"""
+        counts = {category: 0 for category in self.categories}
+        for match in matches:
+            for category in match.categories:
+                counts[category] += 1
+        return counts
@@ -1,12 +1,20 @@
-from app.llm import get_specialized_llm
+import json
+import logging
+import re
+
+from langchain_core.prompts import PromptTemplate
+
+from app.llm import ainvoke_shared, get_specialized_llm, invoke_shared
+from utils.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
 
 class LLMMessageAnalyzer:
     """使用LLM进行高级消息内容分析"""
     
-    MESSAGE_ANALYSIS_TEMPLATE = """
-    请分析以下用户消息，判断是否与提案/投票相关还是与心理健康咨询相关。
-    
-    用户消息: "{message}"
+    # 固定的说明在前，用户消息在最后，保持前缀不变
+    MESSAGE_ANALYSIS_TEMPLATE = PromptTemplate.from_template("""
+    请分析下面的用户消息，判断是否与提案/投票相关还是与心理健康咨询相关。
     
     首先，判断消息是否包含提案相关内容(如提案、投票、社区决策等)。
     其次，判断消息是否包含心理健康咨询相关内容(如情绪问题、心理困扰等)。
@@ -18,7 +26,17 @@ class LLMMessageAnalyzer:
     4. confidence: 0到1之间的数字，表示判断的置信度
     
     只返回JSON对象，不要有其他文字。
-    """
+    
+    用户消息: "{message}"
+    """)
+    
+    @classmethod
+    def _basic_result(cls, message: str):
+        """关键词分析结果；只命中一类时结果已经明确，不需要再调用LLM"""
+        basic_result = MessageAnalyzer().analyze_message_type(message)
+        is_proposal = basic_result["is_proposal_related"]
+        is_counseling = basic_result["is_counseling_related"]
+        return basic_result, is_proposal != is_counseling
     
     @classmethod
     async def analyze_message(cls, message: str) -> dict:
@@ -29,37 +47,38 @@ class LLMMessageAnalyzer:
             message: 用户消息文本
             
         Returns:
-            分析结果字典
+            分析结果字典；LLM调用或解析失败时回退到关键词分析结果，并带有 llm_error 字段
         """
-        # 快速关键词检查（优化性能）
-        basic_analyzer = MessageAnalyzer()
-        basic_result = basic_analyzer.analyze_message_type(message)
-        
-        # 如果基本分析已经很明确，直接返回结果
-        if (basic_result["is_proposal_related"] and not basic_result["is_counseling_related"]) or \
-           (basic_result["is_counseling_related"] and not basic_result["is_proposal_related"]):
+        # 快速关键词检查（优化性能），如果基本分析已经很明确，直接返回结果
+        basic_result, clear = cls._basic_result(message)
+        if clear:
             return basic_result
         
         # 对于不明确的情况，使用LLM进行深入分析
         try:
-            # 获取LLM实例
-            llm = get_specialized_llm(temperature=0.1)  # 低温度确保一致性
-            
-            # 创建分析提示
-            prompt = cls.MESSAGE_ANALYSIS_TEMPLATE.format(message=message)
-            
-            # 调用LLM
-            response = llm.invoke(prompt)
-            
-            # 解析JSON结果
-            import json
-            result = json.loads(response.content)
-            
-            return result
+            # 低温度确保一致性；相同消息的并发分类共享一次调用
+            llm = get_specialized_llm(temperature=0.1)
+            response = await ainvoke_shared(llm, cls.MESSAGE_ANALYSIS_TEMPLATE.format(message=message))
+            return json.loads(response.content)
         except Exception as e:
-            # 发生错误时回退到基本分析结果
-            print(f"LLM分析失败: {e}")
+            # 发生错误时回退到基本分析结果，llm_error 供调用方（路由）统计失败次数
+            logger.error(f"LLM message analysis failed: {str(e)}")
+            return dict(basic_result, llm_error=str(e))
+    
+    @classmethod
+    def analyze_message_sync(cls, message: str) -> dict:
+        """analyze_message 的同步版本（用于非异步上下文）"""
+        basic_result, clear = cls._basic_result(message)
+        if clear:
             return basic_result
+        
+        try:
+            llm = get_specialized_llm(temperature=0.1)
+            response = invoke_shared(llm, cls.MESSAGE_ANALYSIS_TEMPLATE.format(message=message))
+            return json.loads(response.content)
+        except Exception as e:
+            logger.error(f"LLM message analysis failed: {str(e)}")
+            return dict(basic_result, llm_error=str(e))
 
 
 class MessageAnalyzer:
@@ -87,6 +106,44 @@ class MessageAnalyzer:
         "feeling", "mental health", "心理健康", "困难", "挣扎", "痛苦"
     ]
     
+    # 危机信号关键词库：命中时路由交给Agent；预先风险评估没有给出结论时据此按高风险处理
+    CRISIS_KEYWORDS = [
+        "自杀", "自尽", "轻生", "自残", "自伤", "割腕", "跳楼", "上吊", "寻死", "想死", "去死",
+        "不想活", "活不下去", "活着没意思", "结束生命", "结束自己", "伤害自己", "了结",
+        "suicide", "suicidal", "kill myself", "end my life", "self-harm", "self harm", "hurt myself"
+    ]
+    
+    @classmethod
+    def match_keywords(cls, message: str) -> dict:
+        """
+        一次扫描找出消息中各类关键词的全部命中
+        
+        Args:
+            message: 用户消息文本
+        
+        Returns:
+            包含命中列表（位置、关键词、类别）和每个类别命中次数的字典
+        """
+        matches = _KEYWORD_MATCHER.find_all(message)
+        return {
+            "matches": [
+                {"start": m.start, "end": m.end, "keyword": m.keyword, "categories": list(m.categories)}
+                for m in matches
+            ],
+            "counts": _KEYWORD_MATCHER.count_by_category(matches)
+        }
+    
+    @classmethod
+    def has_proposal_id(cls, message: str) -> bool:
+        """检测消息中是否包含提案ID (#加数字字母)"""
+        return _PROPOSAL_ID_PATTERN.search(message) is not None
+    
+    @classmethod
+    def has_crisis_signal(cls, message: str) -> bool:
+        """检测消息中是否包含危机信号关键词（自伤、自杀等）"""
+        counts = _KEYWORD_MATCHER.count_by_category(_KEYWORD_MATCHER.find_all(message))
+        return counts["crisis"] > 0
+    
     @classmethod
     def is_proposal_related(cls, message: str) -> bool:
         """
@@ -98,19 +155,8 @@ class MessageAnalyzer:
         Returns:
             布尔值表示是否与提案相关
         """
-        message = message.lower()
-        
-        # 检查提案关键词
-        for keyword in cls.PROPOSAL_KEYWORDS:
-            if keyword.lower() in message:
-                return True
-        
-        # 检查提案ID模式 (#加数字字母)
-        import re
-        if re.search(r'#[a-zA-Z0-9]+', message):
-            return True
-        
-        return False
+        counts = _KEYWORD_MATCHER.count_by_category(_KEYWORD_MATCHER.find_all(message))
+        return counts["proposal"] > 0 or _PROPOSAL_ID_PATTERN.search(message) is not None
     
     @classmethod
     def is_counseling_related(cls, message: str) -> bool:
@@ -123,13 +169,8 @@ class MessageAnalyzer:
         Returns:
             布尔值表示是否与心理咨询相关
         """
-        message = message.lower()
-        
-        for keyword in cls.COUNSELING_KEYWORDS:
-            if keyword.lower() in message:
-                return True
-                
-        return False
+        counts = _KEYWORD_MATCHER.count_by_category(_KEYWORD_MATCHER.find_all(message))
+        return counts["counseling"] > 0
     
     @classmethod
     def analyze_message_type(cls, message: str) -> dict:
@@ -142,8 +183,10 @@ class MessageAnalyzer:
         Returns:
             包含多个分析维度的字典
         """
-        is_proposal = cls.is_proposal_related(message)
-        is_counseling = cls.is_counseling_related(message)
+        # 一次扫描同时得到两个类别的命中
+        counts = _KEYWORD_MATCHER.count_by_category(_KEYWORD_MATCHER.find_all(message))
+        is_proposal = counts["proposal"] > 0 or _PROPOSAL_ID_PATTERN.search(message) is not None
+        is_counseling = counts["counseling"] > 0
         
         # 更倾向的类型 - 如果两者都匹配，优先考虑提案相关
         # 这可以根据业务需求调整优先级
@@ -153,5 +196,16 @@ class MessageAnalyzer:
             "is_proposal_related": is_proposal,
             "is_counseling_related": is_counseling,
             "primary_type": primary_type,
-            "has_mixed_content": is_proposal and is_counseling
-        }
\ No newline at end of file
+            "has_mixed_content": is_proposal and is_counseling,
+            "has_crisis_signal": counts["crisis"] > 0,
+            "keyword_counts": counts
+        }
+
+
+# 导入时把各类关键词编译成一个自动机，提案ID模式也只编译一次
+_KEYWORD_MATCHER = KeywordMatcher({
+    "proposal": MessageAnalyzer.PROPOSAL_KEYWORDS,
+    "counseling": MessageAnalyzer.COUNSELING_KEYWORDS,
+    "crisis": MessageAnalyzer.CRISIS_KEYWORDS
+})
+_PROPOSAL_ID_PATTERN = re.compile(r'#[a-zA-Z0-9]+')